@@ -2,10 +2,7 @@ import os
 import logging
 from datetime import datetime
 import secrets
-from typing import Any
-from dotenv import load_dotenv
 from flask import Flask, g, session, jsonify
-from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager, current_user
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_wtf.csrf import CSRFProtect, generate_csrf
@@ -13,12 +10,18 @@ from models import db
 
 logging.basicConfig(level=logging.INFO)
 
-class Base(DeclarativeBase):
-    pass
+_env_loaded = False
 
-load_dotenv()
+def _load_env():
+    """读取 .env（每个进程只读一次）"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 def create_app() -> Flask:
+    _load_env()
     app = Flask(__name__)
     app.secret_key = os.environ.get("SESSION_SECRET", secrets.token_hex(32))
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///inventory.db")
@@ -32,6 +35,12 @@ def create_app() -> Flask:
     app.config["SESSION_COOKIE_HTTPONLY"] = True
     app.config["SESSION_COOKIE_SECURE"] = os.environ.get("FLASK_ENV") == "production"
     app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+    # 严格加载模式：未预加载的关系被访问时直接报错，默认在开发环境开启
+    default_strict = "1" if os.environ.get("FLASK_ENV") == "development" else "0"
+    app.config["STRICT_LOADING"] = os.environ.get("STRICT_LOADING", default_strict) == "1"
+    # 按请求统计 SQL 语句数与耗时，单条语句超过阈值（毫秒）写入慢查询日志
+    app.config["SQL_INSTRUMENTATION"] = os.environ.get("SQL_INSTRUMENTATION", "1") == "1"
+    app.config["SLOW_QUERY_THRESHOLD_MS"] = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "200"))
 
     # 日志级别按环境切换
     log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -58,14 +67,21 @@ def create_app() -> Flask:
     login_manager.login_view = 'auth.login'
     login_manager.login_message = '请先登录'
 
+    # SQL 统计：Server-Timing 响应头、慢查询日志、管理员统计页
+    from instrumentation import init_sql_instrumentation
+    init_sql_instrumentation(app)
+
     @app.before_request
     def before_request():
         g.year = datetime.now().year
+        # 调试日志关闭时不加载用户、不复制 session、不拼接字符串
+        if not app.logger.isEnabledFor(logging.DEBUG):
+            return
         if current_user.is_authenticated:
-            app.logger.debug(f"DEBUG: Session active for authenticated user: {current_user.id} ({current_user.username})")
+            app.logger.debug("DEBUG: Session active for authenticated user: %s (%s)", current_user.id, current_user.username)
         else:
             app.logger.debug("DEBUG: No active authenticated user session.")
-        app.logger.debug(f"DEBUG: Current session content: {dict(session)}")
+        app.logger.debug("DEBUG: Current session content: %s", dict(session))
 
     @app.context_processor
     def inject_csrf_token():
@@ -88,11 +104,11 @@ def create_app() -> Flask:
         return jsonify(error="Internal Server Error"), 500
 
     # 蓝图自动注册
-    from routes import auth, dashboard, customer, supplier, category, product, raw_material, purchase, order, report, api
+    from routes import auth, dashboard, customer, supplier, category, product, raw_material, purchase, order, report, api, stocktake
     blueprints = [
         auth.auth_bp, dashboard.dashboard_bp, customer.customer_bp, supplier.supplier_bp,
         category.category_bp, product.product_bp, raw_material.raw_material_bp,
-        purchase.purchase_bp, order.order_bp, report.report_bp, api.api_bp
+        purchase.purchase_bp, order.order_bp, report.report_bp, api.api_bp, stocktake.stocktake_bp
     ]
     for bp in blueprints:
         # API 路由禁用 CSRF
@@ -104,14 +120,25 @@ def create_app() -> Flask:
         else:
             app.register_blueprint(bp)
 
+    # 注册 flask 命令行工具（init-db / create-indexes 等）
+    from cli import register_cli
+    register_cli(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return User.query.get(int(user_id))
+        return auth.load_cached_user(int(user_id))
 
     return app
 
-app = create_app()
+def __getattr__(name):
+    """模块级的 app 在第一次访问 app.app 时才创建（flask 命令行按 app 属性查找应用）
+
+    导入本模块只为使用 create_app 的场景（测试、main.py、基准测试）不会多构建一个应用。
+    """
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(debug=os.environ.get("FLASK_ENV") != "production")
+    create_app().run(debug=os.environ.get("FLASK_ENV") != "production")
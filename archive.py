@@ -0,0 +1,110 @@
+"""归档已结束的旧订单和旧库存流水
+
+订单、订单项和库存流水只增不减，在线表越大，列表页、写入和每个索引都越慢。
+flask archive --months N 把截止时间（N 个月前的月初 0 点）之前的
+
+    - 已完成 / 已取消的订单及其订单项   -> archived_orders / archived_order_items
+    - 库存调整记录                       -> archived_stock_adjustments
+
+按批移到归档表（同一数据库，SQLite / PostgreSQL 通用），每批一个事务：
+INSERT ... SELECT 复制到归档表后从在线表删除，中途失败整批回滚，不会丢失或重复数据，可重复执行。
+
+与派生数据保持一致：
+    - 销售汇总表本就包含这些订单，归档不改动它；rebuild_sales_rollup 同时读取两张表；
+    - 归档流水之前先为截止时间之前的月份建好库存检查点（stock_history.build_checkpoints），
+      截止时间之后的历史库存只需在线流水，更早的日期由 stock_history 同时读取归档表；
+    - 商品 / 客户的删除检查、仪表盘订单总数同时统计归档表。
+
+已归档的订单不再出现在订单列表中，也不能再编辑；商品详情、客户详情的订单记录中仍会列出（只读）。
+"""
+from datetime import datetime
+
+from sqlalchemy import delete, insert, literal, select
+
+from models import db, Order, OrderItem, StockAdjustment, ArchivedOrder, ArchivedOrderItem, ArchivedStockAdjustment
+from rollups import CANCELLED_STATUS
+from stock_history import build_checkpoints
+
+# 可归档的订单状态
+ARCHIVABLE_STATUSES = ('已完成', CANCELLED_STATUS)
+
+# 每批（每个事务）移动的订单数 / 库存流水行数
+ARCHIVE_BATCH_SIZE = 1000
+
+_ORDER_COLUMNS = [c.name for c in Order.__table__.columns]
+_ORDER_ITEM_COLUMNS = [c.name for c in OrderItem.__table__.columns]
+_ADJUSTMENT_COLUMNS = [c.name for c in StockAdjustment.__table__.columns]
+
+
+def archive_cutoff(months, now=None):
+    """归档截止时间：months 个月前的月初 0 点（与按月的库存检查点对齐）"""
+    now = now or datetime.now()
+    year, month = divmod(now.year * 12 + now.month - 1 - months, 12)
+    return datetime(year, month + 1, 1)
+
+
+def _copy(source, target, columns, where, extra=None):
+    """INSERT INTO target (...) SELECT ... FROM source WHERE where（保留原 id）"""
+    extra = extra or {}
+    db.session.execute(
+        insert(target.__table__).from_select(
+            columns + list(extra),
+            select(*[source.__table__.c[c] for c in columns], *[literal(v) for v in extra.values()]).where(where)
+        )
+    )
+
+
+def _delete(source, where):
+    db.session.execute(delete(source).where(where).execution_options(synchronize_session=False))
+
+
+def archive_orders(cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """按批归档 cutoff 之前已完成 / 已取消的订单及其订单项，每批提交一次，返回归档的订单数"""
+    total = 0
+    while True:
+        ids = db.session.scalars(
+            select(Order.id).where(
+                Order.status.in_(ARCHIVABLE_STATUSES), Order.order_date < cutoff
+            ).order_by(Order.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return total
+        # 先复制订单再复制订单项，先删订单项再删订单，外键始终成立
+        _copy(Order, ArchivedOrder, _ORDER_COLUMNS, Order.id.in_(ids), {'archived_at': datetime.now()})
+        _copy(OrderItem, ArchivedOrderItem, _ORDER_ITEM_COLUMNS, OrderItem.order_id.in_(ids))
+        _delete(OrderItem, OrderItem.order_id.in_(ids))
+        _delete(Order, Order.id.in_(ids))
+        db.session.commit()
+        total += len(ids)
+        if progress:
+            progress('orders', total)
+
+
+def archive_stock_adjustments(cutoff, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """先为 cutoff 之前的月份建好库存检查点，再按批归档 cutoff 之前的库存流水，返回归档的行数"""
+    build_checkpoints(until=cutoff)
+    db.session.commit()
+
+    total = 0
+    while True:
+        ids = db.session.scalars(
+            select(StockAdjustment.id).where(
+                StockAdjustment.adjustment_date < cutoff
+            ).order_by(StockAdjustment.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return total
+        _copy(StockAdjustment, ArchivedStockAdjustment, _ADJUSTMENT_COLUMNS, StockAdjustment.id.in_(ids))
+        _delete(StockAdjustment, StockAdjustment.id.in_(ids))
+        db.session.commit()
+        total += len(ids)
+        if progress:
+            progress('stock_adjustments', total)
+
+
+def archive(months, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """归档 months 个月前的月初之前的已结束订单和库存流水，返回 (截止时间, 订单数, 流水行数)"""
+    cutoff = archive_cutoff(months)
+    orders = archive_orders(cutoff, batch_size, progress)
+    adjustments = archive_stock_adjustments(cutoff, batch_size, progress)
+    return cutoff, orders, adjustments
@@ -0,0 +1,90 @@
+"""订单录入基准测试：order.add 的耗时与 SQL 语句数随订单项行数的变化
+
+用法:
+    python benchmarks/bench_order_entry.py --lines 1 10 100 300
+
+使用临时 SQLite 文件库，通过 Flask 测试客户端提交订单，输出 JSON。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='order.add 订单录入基准测试')
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100, 300], help='每个订单的订单项行数')
+    parser.add_argument('--repeat', type=int, default=3, help='每个行数重复提交次数，取中位数')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_order_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    from sqlalchemy import event
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from models import db, User, Category, Customer, Product
+
+    app = create_app()
+    app.config.update({'TESTING': True, 'WTF_CSRF_ENABLED': False})
+
+    max_lines = max(args.lines)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', password_hash=generate_password_hash('bench'), role='admin'))
+        category = Category(name='基准分类', description='')
+        customer = Customer(name='基准客户', contact='', phone='', address='')
+        db.session.add_all([category, customer])
+        db.session.flush()
+        db.session.add_all([
+            Product(name=f'基准商品{i}', sku=f'BENCH-{i}', description='', selling_price=10.0,
+                    cost_price=5.0, stock_quantity=10 ** 9, category_id=category.id)
+            for i in range(max_lines)
+        ])
+        db.session.commit()
+        customer_id = customer.id
+        product_ids = [pid for (pid,) in db.session.query(Product.id).order_by(Product.id)]
+        engine = db.engine
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+
+    results = []
+    for lines in args.lines:
+        timings = []
+        for _ in range(args.repeat):
+            data = {
+                'order_date': '2026-01-01',
+                'customer_id': customer_id,
+                'status': '待支付',
+                'payment_method': '现金',
+                'notes': '',
+                'product_id[]': [str(pid) for pid in product_ids[:lines]],
+                'quantity[]': ['1'] * lines,
+                'unit_price[]': ['10.0'] * lines,
+            }
+            statements.clear()
+            start = time.perf_counter()
+            resp = client.post('/order/add', data=data)
+            timings.append(time.perf_counter() - start)
+            assert resp.status_code == 302, resp.status_code
+        timings.sort()
+        results.append({
+            'lines': lines,
+            'median_ms': round(timings[len(timings) // 2] * 1000, 2),
+            'statements': len(statements),
+            'product_loads': sum(1 for s in statements if s.lstrip().upper().startswith('SELECT') and 'products.name' in s),
+        })
+
+    print(json.dumps({'benchmark': 'order_entry', 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""批量导入基准测试：import_orders 每分钟可导入的订单数
+
+用法:
+    python benchmarks/bench_order_import.py --orders 10000 --lines 3 --chunk-size 500
+
+使用临时 SQLite 文件库，直接调用 order_import 模块（不经 HTTP），输出 JSON。
+目标：SQLite 上不低于 10000 订单/分钟。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量订单导入基准测试')
+    parser.add_argument('--orders', type=int, default=10000, help='导入的订单数')
+    parser.add_argument('--lines', type=int, default=3, help='每个订单的订单项行数')
+    parser.add_argument('--products', type=int, default=500, help='商品数')
+    parser.add_argument('--chunk-size', type=int, default=500, help='每块订单数')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_import_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    from app import create_app
+    from models import db, Category, Customer, Product
+    from order_import import import_orders, parse_orders
+
+    app = create_app()
+    rng = random.Random(42)  # nosec B311 - 生成测试数据
+    with app.app_context():
+        db.create_all()
+        category = Category(name='基准分类', description='')
+        customers = [Customer(name=f'基准客户{i}', contact='', phone='', address='') for i in range(50)]
+        db.session.add(category)
+        db.session.add_all(customers)
+        db.session.flush()
+        db.session.add_all([
+            Product(name=f'基准商品{i}', sku=f'BENCH-{i}', description='', selling_price=10.0,
+                    cost_price=5.0, stock_quantity=10 ** 9, category_id=category.id)
+            for i in range(args.products)
+        ])
+        db.session.commit()
+        customer_ids = [c.id for c in customers]
+
+        payload = json.dumps([{
+            'ref': f'R{n}',
+            'order_date': f'2026-01-{n % 28 + 1:02d}',
+            'customer_id': rng.choice(customer_ids),
+            'status': '已支付',
+            'items': [{'sku': f'BENCH-{rng.randrange(args.products)}', 'quantity': rng.randint(1, 5)}
+                      for _ in range(args.lines)],
+        } for n in range(args.orders)])
+
+        start = time.perf_counter()
+        orders = parse_orders(payload, 'json')
+        result = import_orders(orders, created_by='bench', chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'benchmark': 'order_import',
+        'orders': args.orders,
+        'lines_per_order': args.lines,
+        'chunk_size': args.chunk_size,
+        'imported': result.imported,
+        'failed': len(result.errors),
+        'seconds': round(elapsed, 2),
+        'orders_per_minute': round(result.imported / elapsed * 60),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""订单号分配并发基准测试：多个进程同时下单，验证订单号不重复且按进程单调递增
+
+用法:
+    python benchmarks/bench_order_numbers.py --workers 8 --orders 500 --batch 1
+    python benchmarks/bench_order_numbers.py --database-url postgresql://... --block-size 50
+
+默认使用临时 SQLite 文件库。每个 worker 进程独立创建应用，每个事务通过 ORM 插入
+--batch 个订单（订单号由 Order 的默认值分配）并提交，输出 JSON：吞吐量、唯一性冲突数、
+各 worker 内是否单调递增。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _worker(args):
+    database_url, block_size, orders, batch, customer_id = args
+    os.environ['DATABASE_URL'] = database_url
+
+    from sqlalchemy.exc import IntegrityError
+    from app import create_app
+    from models import db, Order
+
+    app = create_app()
+    app.config['ORDER_NUMBER_BLOCK_SIZE'] = block_size
+    numbers, collisions = [], 0
+    with app.app_context():
+        remaining = orders
+        while remaining > 0:
+            created = [
+                Order(customer_id=customer_id, status='已支付', payment_method='现金', notes='')
+                for _ in range(min(batch, remaining))
+            ]
+            db.session.add_all(created)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                collisions += 1
+                continue
+            numbers.extend(o.order_number for o in created)
+            remaining -= len(created)
+    return numbers, collisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='订单号分配并发基准测试')
+    parser.add_argument('--workers', type=int, default=8, help='并发进程数')
+    parser.add_argument('--orders', type=int, default=500, help='每个进程创建的订单数')
+    parser.add_argument('--batch', type=int, default=1, help='每个事务插入的订单数')
+    parser.add_argument('--block-size', type=int, default=50, help='ORDER_NUMBER_BLOCK_SIZE（SQLite 上不使用）')
+    parser.add_argument('--database-url', help='数据库地址（默认临时 SQLite 文件库，会清空其中的表）')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if not database_url:
+        tmpdir = tempfile.mkdtemp(prefix='bench_order_numbers_')
+        database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+
+    from app import create_app
+    from models import db, Customer
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        customer = Customer(name='基准客户', contact='', phone='', address='')
+        db.session.add(customer)
+        db.session.commit()
+        customer_id = customer.id
+        db.engine.dispose()
+
+    jobs = [(database_url, args.block_size, args.orders, args.batch, customer_id)] * args.workers
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+        results = pool.map(_worker, jobs)
+    elapsed = time.perf_counter() - start
+
+    all_numbers = [n for numbers, _ in results for n in numbers]
+    print(json.dumps({
+        'benchmark': 'order_numbers',
+        'dialect': database_url.split(':', 1)[0],
+        'workers': args.workers,
+        'orders_per_worker': args.orders,
+        'batch': args.batch,
+        'orders': len(all_numbers),
+        'unique_numbers': len(set(all_numbers)),
+        'integrity_errors': sum(collisions for _, collisions in results),
+        'monotonic_per_worker': all(numbers == sorted(numbers) for numbers, _ in results),
+        'format_ok': all(len(n) == 14 and n[:8].isdigit() for n in all_numbers),
+        'seconds': round(elapsed, 2),
+        'orders_per_second': round(len(all_numbers) / elapsed),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
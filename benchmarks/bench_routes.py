@@ -0,0 +1,241 @@
+"""热点路由基准测试：在合成数据上计时主要页面和 API
+
+用法:
+    python benchmarks/bench_routes.py --products 10000 --customers 100000 --order-items 1000000 \
+        --db /tmp/bench_large.db --output results.json
+    python benchmarks/bench_routes.py --db /tmp/bench_large.db --compare results.json
+
+--db 指向的数据库不存在时按给定规模生成（seed.generate），已存在则直接复用，
+大规模数据只需生成一次。通过 Flask 测试客户端依次计时：
+
+    order.add           --lines 指定的每种订单项行数
+    order.list          客户 / 状态 / 分类 / 日期范围 四个筛选条件的全部组合
+    report.sales / report.material_cost   本月与最近一年
+    report.inventory_valuation
+    dashboard.index
+    /api/*              每个 GET 接口，以及 POST /api/orders/import
+
+每个用例先预热一次，再重复 --repeat 次，记录中位数、P95 与 SQL 语句数（来自 Server-Timing 头），
+结果以 JSON 输出（同时写入 --output）。指定 --compare 时与之前的结果逐项比较，
+中位数变慢超过 --threshold（百分比）的用例列为回归，存在回归时以退出码 1 结束。
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(client, name, method, path, repeat, data=None, json_body=None, expect=(200, 302)):
+    """预热一次后重复请求，返回计时结果"""
+    timings, queries, status = [], None, None
+    for attempt in range(repeat + 1):
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=data, json=json_body)
+        elapsed = (time.perf_counter() - start) * 1000
+        status = response.status_code
+        if status not in expect:
+            raise RuntimeError(f'{name}: {method} {path} 返回 {status}')
+        if attempt == 0:
+            continue
+        timings.append(elapsed)
+        match = _SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        queries = int(match.group(1)) if match else None
+    timings.sort()
+    return {
+        'name': name,
+        'method': method,
+        'path': path,
+        'status': status,
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'min_ms': round(timings[0], 2),
+        'queries': queries,
+    }
+
+
+def _cases(sample, lines_options):
+    """生成 (名称, 方法, 路径, 表单, JSON) 用例列表"""
+    today = datetime.now()
+    month_start = today.replace(day=1).strftime('%Y-%m-%d')
+    year_ago = (today - timedelta(days=365)).strftime('%Y-%m-%d')
+    today_str = today.strftime('%Y-%m-%d')
+
+    cases = []
+    for lines in lines_options:
+        form = {
+            'order_date': today_str,
+            'customer_id': sample['customer_id'],
+            'status': '已支付',
+            'payment_method': '支付宝',
+            'notes': '',
+            'product_id[]': [str(pid) for pid in sample['product_ids'][:lines]],
+            'quantity[]': ['1'] * lines,
+            'unit_price[]': ['10.0'] * lines,
+        }
+        cases.append((f'order.add[{lines} lines]', 'POST', '/order/add', form, None))
+
+    filters = {
+        'customer': f"customer_id={sample['customer_id']}",
+        'status': 'status=已完成',
+        'category': f"category_id={sample['category_id']}",
+        'dates': f'start_date={month_start}&end_date={today_str}',
+    }
+    for size in range(len(filters) + 1):
+        for combo in itertools.combinations(filters, size):
+            query = '&'.join(filters[key] for key in combo)
+            label = '+'.join(combo) or 'none'
+            cases.append((f'order.list[{label}]', 'GET', f'/order/list?{query}', None, None))
+
+    for endpoint, path in (('report.sales', '/report/sales'), ('report.material_cost', '/report/material-cost')):
+        cases.append((f'{endpoint}[month]', 'GET', path, None, None))
+        cases.append((f'{endpoint}[year]', 'GET', f'{path}?start_date={year_ago}&end_date={today_str}', None, None))
+    cases.append(('report.inventory_valuation', 'GET', '/report/inventory-valuation', None, None))
+    cases.append(('dashboard.index', 'GET', '/', None, None))
+
+    cases += [
+        ('api.products', 'GET', '/api/products', None, None),
+        ('api.products[limit]', 'GET', '/api/products?limit=100&fields=id,name,sku', None, None),
+        ('api.product', 'GET', f"/api/products/{sample['product_ids'][0]}", None, None),
+        ('api.customers', 'GET', '/api/customers?limit=100', None, None),
+        ('api.suppliers', 'GET', '/api/suppliers', None, None),
+        ('api.categories', 'GET', '/api/categories', None, None),
+        ('api.raw_materials', 'GET', '/api/raw-materials', None, None),
+        ('api.raw_material', 'GET', f"/api/raw-materials/{sample['raw_material_id']}", None, None),
+        ('api.search_products', 'GET', f"/api/search/products?q={sample['search']}", None, None),
+        ('api.orders_import[10]', 'POST', '/api/orders/import', None, [
+            {'customer_id': sample['customer_id'],
+             'items': [{'product_id': pid, 'quantity': 1} for pid in sample['product_ids'][:3]]}
+            for _ in range(10)
+        ]),
+    ]
+    return cases
+
+
+def _compare(results, baseline, threshold):
+    """与基准结果比较，返回回归列表"""
+    previous = {r['name']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['name'])
+        if not before or not before['median_ms']:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100
+        result['change_pct'] = round(change, 1)
+        if change > threshold:
+            regressions.append({'name': result['name'], 'before_ms': before['median_ms'],
+                                'after_ms': result['median_ms'], 'change_pct': round(change, 1)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热点路由基准测试')
+    parser.add_argument('--db', help='SQLite 数据库文件（不存在则生成，存在则复用）')
+    parser.add_argument('--products', type=int, default=10000, help='商品数')
+    parser.add_argument('--customers', type=int, default=10000, help='客户数')
+    parser.add_argument('--order-items', type=int, default=100000, help='订单项数（订单数 = 订单项数 / 3）')
+    parser.add_argument('--purchases', type=int, default=10000, help='原材料采购记录数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100], help='order.add 的订单项行数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的重复次数')
+    parser.add_argument('--output', help='结果 JSON 写入的文件')
+    parser.add_argument('--compare', help='与之前的结果 JSON 比较')
+    parser.add_argument('--threshold', type=float, default=20.0, help='判定回归的变慢百分比')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='bench_routes_'), 'bench.db')
+    db_path = os.path.abspath(db_path)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from models import db, User, Category, Customer, Product, RawMaterial
+    from seed import generate
+
+    app = create_app()
+    app.config.update({'TESTING': True, 'WTF_CSRF_ENABLED': False, 'SQL_INSTRUMENTATION': True,
+                       'SLOW_QUERY_THRESHOLD_MS': 10 ** 9})
+
+    sizes = None
+    with app.app_context():
+        if not os.path.exists(db_path) or not db.inspect(db.engine).has_table('orders'):
+            db.create_all()
+            start = time.perf_counter()
+            sizes = generate(
+                products=args.products, customers=args.customers, orders=max(1, args.order_items // 3),
+                lines_per_order=3, purchases=args.purchases, seed=args.seed
+            )
+            sizes['seconds'] = round(time.perf_counter() - start, 1)
+            print(f'合成数据已生成: {json.dumps(sizes, ensure_ascii=False)}', file=sys.stderr)
+        if not User.query.filter_by(username='bench').first():
+            db.session.add(User(username='bench', password_hash=generate_password_hash('bench'), role='admin'))
+            db.session.commit()
+        sample = {
+            'customer_id': db.session.scalar(db.select(Customer.id).order_by(Customer.id)),
+            'category_id': db.session.scalar(db.select(Category.id).order_by(Category.id)),
+            'product_ids': list(db.session.scalars(db.select(Product.id).order_by(Product.id).limit(max(args.lines)))),
+            'raw_material_id': db.session.scalar(db.select(RawMaterial.id).order_by(RawMaterial.id)),
+            'search': (db.session.scalar(db.select(Product.name).order_by(Product.id)) or '商品')[:3],
+        }
+        counts = {
+            model.__tablename__: db.session.scalar(db.select(db.func.count()).select_from(model))
+            for model in (Product, Customer, RawMaterial)
+        }
+        counts['order_items'] = db.session.scalar(db.text('SELECT count(*) FROM order_items'))
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+
+    results = [
+        _measure(client, name, method, path, args.repeat, data=form, json_body=body)
+        for name, method, path, form, body in _cases(sample, args.lines)
+    ]
+
+    report = {
+        'benchmark': 'routes',
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'database': db_path,
+        'rows': counts,
+        'generated': sizes,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = _compare(results, json.load(f), args.threshold)
+        report['regressions'] = regressions
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""启动耗时基准测试：从导入入口模块到第一个请求完成
+
+用法:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --entry app --runs 5
+
+每次在新的 Python 进程中依次计时：导入入口模块（默认 main，即 gunicorn 的 main:app）、
+取得应用对象、用测试客户端完成第一个请求（GET /auth/login）。输出各阶段的中位数（毫秒）、
+构建的应用个数以及启动时是否加载了 pypinyin 等按需导入的模块，JSON 格式，便于持续跟踪。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子进程中执行的计时脚本
+_PROBE = r'''
+import importlib, json, sys, time
+start = time.perf_counter()
+import flask
+apps = []
+_init = flask.Flask.__init__
+def _counting_init(self, *args, **kwargs):
+    apps.append(self)
+    _init(self, *args, **kwargs)
+flask.Flask.__init__ = _counting_init
+
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+application = module.app if sys.argv[1] == 'main' else module.create_app()
+created = time.perf_counter()
+response = application.test_client().get('/auth/login')
+first_request = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first_request - created) * 1000,
+    'total_ms': (first_request - start) * 1000,
+    'status': response.status_code,
+    'apps_created': len(apps),
+    'modules': len(sys.modules),
+    'pypinyin_loaded': 'pypinyin' in sys.modules,
+    'postgresql_dialect_loaded': 'sqlalchemy.dialects.postgresql' in sys.modules,
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='重复次数，取中位数')
+    parser.add_argument('--entry', choices=['main', 'app'], default='main', help='入口模块')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_startup_')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}", PYTHONPATH=ROOT)
+
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE, args.entry],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    result = {'benchmark': 'startup', 'entry': args.entry, 'runs': args.runs}
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'total_ms'):
+        result[key] = round(statistics.median(s[key] for s in samples), 1)
+    last = samples[-1]
+    for key in ('status', 'apps_created', 'modules', 'pypinyin_loaded', 'postgresql_dialect_loaded'):
+        result[key] = last[key]
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
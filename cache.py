@@ -0,0 +1,159 @@
+"""进程内缓存
+
+每个 gunicorn worker 各自持有一份，写操作只能失效本进程的缓存，
+其他 worker 最多在 TTL 到期后看到最新数据，因此 TTL 应保持较短。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """线程安全的 TTL 缓存，记录命中/未命中次数"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+        self._generation = 0  # 每次失效加 1，get_or_set 据此丢弃计算期间已失效的结果
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, generation=None):
+        """写入条目；generation 为计算开始时的失效计数，之后发生过失效则不写入"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """命中则返回缓存值，否则调用 factory() 计算并缓存
+
+        计算期间有失效发生时只返回结果、不写入缓存，避免把失效前读到的旧数据重新放回。
+        """
+        sentinel = object()
+        generation = self._generation
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory()
+            self.set(key, value, ttl, generation=generation)
+        return value
+
+    def invalidate(self, key=None):
+        """失效指定 key；不传 key 时清空全部"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+class LRUCache:
+    """线程安全、按条目数限制大小的 LRU 缓存
+
+    超出 maxsize 时淘汰最久未使用的条目。每个条目可单独指定 TTL，ttl=None 表示不过期
+    （只会被淘汰或失效）。记录命中、未命中、淘汰与失效次数。
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # 每次失效加 1，get_or_set 据此丢弃计算期间已失效的结果
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, generation=None):
+        """写入条目；generation 为计算开始时的失效计数，之后发生过失效则不写入"""
+        if self.maxsize <= 0 or (ttl is not None and ttl <= 0):
+            return
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, factory, ttl=None):
+        """命中则返回缓存值，否则调用 factory() 计算并缓存
+
+        计算期间有失效发生时只返回结果、不写入缓存，避免把失效前读到的旧数据重新放回。
+        """
+        sentinel = object()
+        generation = self._generation
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory()
+            self.set(key, value, ttl, generation=generation)
+        return value
+
+    def invalidate(self, key=None):
+        """失效指定 key；不传 key 时清空全部"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self.invalidations += len(self._data)
+                self._data.clear()
+            elif self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_where(self, predicate):
+        """失效所有 predicate(key) 为真的条目，返回失效的条数"""
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
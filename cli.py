@@ -1,7 +1,8 @@
 import click
 from flask.cli import with_appcontext
-from app import db, create_app
-from models import User
+from sqlalchemy import text
+
+from models import db, User
 from werkzeug.security import generate_password_hash
 
 @click.command('init-db')
@@ -9,6 +10,7 @@ from werkzeug.security import generate_password_hash
 def init_db_command():
     """初始化数据库并创建默认管理员账户"""
     db.create_all()
+    _ensure_search_index()
     admin = User.query.filter_by(username='admin').first()
     if not admin:
         admin = User(
@@ -22,10 +24,228 @@ def init_db_command():
     else:
         click.echo('管理员账户已存在')
 
+def _ensure_search_index():
+    """已有数据库缺少商品检索表时建表并回填（create_all 只在新建 products 表时创建检索表）"""
+    from search import ensure_search_index
+    count = ensure_search_index()
+    db.session.commit()
+    if count is not None:
+        click.echo(f'创建商品检索索引: {count} 个商品')
+
+def _create_missing_indexes():
+    """创建模型中声明但数据库中不存在的索引，返回新建数量"""
+    inspector = db.inspect(db.engine)
+    created = 0
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            click.echo(f'跳过: 表 {table.name} 不存在，请先执行 flask init-db')
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing:
+                continue
+            index.create(bind=db.engine)
+            created += 1
+            click.echo(f'创建索引: {table.name}.{index.name}')
+    return created
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes_command():
+    """在已有数据库上补建模型中声明的索引（不重建表，已存在的索引跳过）"""
+    created = _create_missing_indexes()
+    click.echo(f'索引检查完成，新建 {created} 个')
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """升级已有数据库：创建新增的表，补充新增的可空列，并补建索引"""
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    added = 0
+    for table in db.metadata.sorted_tables:
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                click.echo(f'跳过: {table.name}.{column.name} 不可为空，需手动迁移')
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            # 新增的 updated_at 用 created_at 回填，保证 API 的 Last-Modified 有值
+            if column.name == 'updated_at' and 'created_at' in table.columns:
+                db.session.execute(text(f'UPDATE {table.name} SET updated_at = created_at'))
+            added += 1
+            click.echo(f'新增列: {table.name}.{column.name}')
+    # 已有 SKU 登记到自动生成 SKU 的序列，避免之后分配到相同编号
+    from sku import sync_sku_sequences
+    sync_sku_sequences()
+    # 新增的汇总表需要回填，否则销售报表、原材料成本报表缺少历史数据
+    from rollups import (
+        material_cost_rollup_missing, rebuild_material_cost_rollup, rebuild_sales_rollup, sales_rollup_missing
+    )
+    if sales_rollup_missing():
+        line_rows, customer_rows = rebuild_sales_rollup()
+        click.echo(f'回填销售日汇总: 明细 {line_rows} 行, 客户 {customer_rows} 行')
+    if material_cost_rollup_missing():
+        click.echo(f'回填原材料采购月汇总: {rebuild_material_cost_rollup()} 行')
+    db.session.commit()
+    _ensure_search_index()
+    created = _create_missing_indexes()
+    click.echo(f'数据库升级完成: 新增 {added} 列, 新建 {created} 个索引')
+
+@click.command('rebuild-sales-rollup')
+@with_appcontext
+def rebuild_sales_rollup_command():
+    """根据历史订单重建销售日汇总表（首次部署或数据修复时使用）"""
+    from rollups import rebuild_sales_rollup
+    line_rows, customer_rows = rebuild_sales_rollup()
+    db.session.commit()
+    click.echo(f'销售日汇总重建完成: 明细 {line_rows} 行, 客户 {customer_rows} 行')
+
+@click.command('rebuild-material-cost-rollup')
+@with_appcontext
+def rebuild_material_cost_rollup_command():
+    """回填采购月份并根据全部采购记录重建原材料采购月汇总表"""
+    from rollups import rebuild_material_cost_rollup
+    count = rebuild_material_cost_rollup()
+    db.session.commit()
+    click.echo(f'原材料采购月汇总重建完成: {count} 行')
+
+@click.command('snapshot-inventory')
+@click.option('--date', 'snapshot_date', type=click.DateTime(formats=['%Y-%m-%d']), help='快照日期（默认今天）')
+@with_appcontext
+def snapshot_inventory_command(snapshot_date):
+    """记录库存价值快照（每晚由 cron 执行，同一天重复执行时覆盖；--date 补录过去某天结束时的库存价值）"""
+    from valuation import take_inventory_snapshot
+    try:
+        snapshot = take_inventory_snapshot(snapshot_date.date() if snapshot_date else None)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(
+        f'库存价值快照 {snapshot.snapshot_date}: 商品 {snapshot.product_value:.2f}, '
+        f'原材料 {snapshot.raw_material_value:.2f}, 合计 {snapshot.total_value:.2f}'
+    )
+
+@click.command('build-stock-checkpoints')
+@click.option('--rebuild', is_flag=True, help='清空已有检查点后从头重建')
+@click.option('--verify', 'then_verify', is_flag=True, help='建立后核对全部检查点')
+@with_appcontext
+def build_stock_checkpoints_command(rebuild, then_verify):
+    """为已结束的月份建立库存检查点（增量执行，建议每月初由 cron 执行）"""
+    from stock_history import build_checkpoints
+    count = build_checkpoints(rebuild=rebuild)
+    db.session.commit()
+    click.echo(f'库存检查点建立完成: 新增 {count} 行')
+    if then_verify:
+        _verify_stock_checkpoints()
+
+@click.command('verify-stock-checkpoints')
+@with_appcontext
+def verify_stock_checkpoints_command():
+    """从头回放库存流水核对检查点，并核对推算出的当前库存（不一致时返回非 0 退出码）"""
+    _verify_stock_checkpoints()
+
+def _verify_stock_checkpoints():
+    from stock_history import verify_checkpoints
+    checked, mismatches, stock_mismatches = verify_checkpoints()
+    for m in mismatches:
+        click.echo(f'检查点不一致: {m.item_type} {m.item_id} {m.checkpoint_at} 应为 {m.expected}, 实际 {m.actual}', err=True)
+    for m in stock_mismatches:
+        click.echo(f'当前库存不一致: {m.item_type} {m.item_id} 流水推算 {m.expected}, 库存字段 {m.actual}', err=True)
+    click.echo(f'核对完成: {checked} 个检查点, 不一致 {len(mismatches)} 个, 当前库存不一致 {len(stock_mismatches)} 个')
+    if mismatches or stock_mismatches:
+        raise click.ClickException('库存检查点核对未通过')
+
+@click.command('archive')
+@click.option('--months', type=click.IntRange(min=1), default=12, show_default=True,
+              help='归档多少个月之前（按月初对齐）的已结束订单和库存流水')
+@click.option('--batch-size', type=click.IntRange(min=1), default=1000, show_default=True, help='每批（每个事务）移动的行数')
+@with_appcontext
+def archive_command(months, batch_size):
+    """把已完成 / 已取消的旧订单和旧库存流水按批移到归档表"""
+    from archive import archive
+    cutoff, orders, adjustments = archive(
+        months, batch_size, progress=lambda name, count: click.echo(f'  {name}: {count}')
+    )
+    click.echo(f'归档完成（截止 {cutoff:%Y-%m-%d}）: 订单 {orders} 个, 库存流水 {adjustments} 行')
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """创建（如不存在）并重建商品全文检索索引"""
+    from search import rebuild_search_index
+    count = rebuild_search_index()
+    db.session.commit()
+    click.echo(f'商品检索索引重建完成: {count} 个商品')
+
+@click.command('import-orders')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), help='文件格式，默认按扩展名判断')
+@click.option('--chunk-size', type=int, help='每块订单数（默认 ORDER_IMPORT_CHUNK_SIZE 或 500）')
+@click.option('--user', 'username', help='记录为库存调整操作人的用户名（默认记为 import-orders）')
+@with_appcontext
+def import_orders_command(path, fmt, chunk_size, username):
+    """从 CSV / JSON 文件批量导入订单，校验失败的订单逐行报告并跳过"""
+    from order_import import OrderImportError, import_orders, parse_orders
+    fmt = fmt or ('json' if path.lower().endswith('.json') else 'csv')
+    created_by = 'import-orders'
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'用户 {username} 不存在')
+        created_by = user.id
+    with open(path, 'rb') as f:
+        content = f.read()
+    try:
+        orders = parse_orders(content, fmt)
+    except OrderImportError as e:
+        raise click.ClickException(str(e))
+    result = import_orders(orders, created_by=created_by, chunk_size=chunk_size)
+    for error in result.errors:
+        click.echo(f"第 {error['row']} 行 (ref={error['ref']}): {error['error']}", err=True)
+    click.echo(f'导入完成: 成功 {result.imported} 个订单, 失败 {len(result.errors)} 个')
+
+@click.command('seed')
+@click.option('--products', type=int, default=1000, show_default=True, help='商品数')
+@click.option('--customers', type=int, default=1000, show_default=True, help='客户数')
+@click.option('--orders', type=int, default=3000, show_default=True, help='订单数')
+@click.option('--lines-per-order', type=int, default=3, show_default=True, help='每个订单的平均订单项数')
+@click.option('--raw-materials', type=int, default=100, show_default=True, help='原材料数')
+@click.option('--purchases', type=int, default=1000, show_default=True, help='原材料采购记录数')
+@click.option('--categories', type=int, default=20, show_default=True, help='分类数')
+@click.option('--suppliers', type=int, default=50, show_default=True, help='供应商数')
+@click.option('--days', type=int, default=365, show_default=True, help='订单和采购分布的天数（截至今天）')
+@click.option('--zipf', type=float, default=1.1, show_default=True, help='商品热度的 Zipf 指数，0 为均匀分布')
+@click.option('--seed', 'random_seed', type=int, default=42, show_default=True, help='随机种子，相同种子生成相同数据')
+@click.option('--chunk-size', type=int, default=10000, show_default=True, help='每次批量插入并提交的行数')
+@with_appcontext
+def seed_command(random_seed, **sizes):
+    """生成合成数据（压测 / 基准测试用），追加到当前数据库"""
+    import time
+    from seed import generate
+    db.create_all()
+    start = time.perf_counter()
+    counts = generate(seed=random_seed, progress=lambda name, count: click.echo(f'  {name}: {count}'), **sizes)
+    click.echo(f'合成数据生成完成: {sum(counts.values())} 行, 用时 {time.perf_counter() - start:.1f} 秒')
+
 def register_cli(app):
     app.cli.add_command(init_db_command)
+    app.cli.add_command(create_indexes_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(rebuild_sales_rollup_command)
+    app.cli.add_command(rebuild_material_cost_rollup_command)
+    app.cli.add_command(snapshot_inventory_command)
+    app.cli.add_command(build_stock_checkpoints_command)
+    app.cli.add_command(verify_stock_checkpoints_command)
+    app.cli.add_command(archive_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(import_orders_command)
+    app.cli.add_command(seed_command)
 
 if __name__ == '__main__':
-    app = create_app()
-    register_cli(app)
-    app.run()
+    # create_app 已注册全部命令
+    from app import create_app
+    create_app().run()
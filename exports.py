@@ -0,0 +1,45 @@
+"""流式 CSV 导出
+
+导出内容由生成器逐块产生，查询结果通过 yield_per 分批读取，
+无论导出多少行，worker 内存占用都保持恒定。
+"""
+import csv
+import io
+
+from flask import Response, stream_with_context
+
+# 每次读取的数据库行数 / 每个响应块包含的 CSV 行数
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iter_rows(query, chunk_size=EXPORT_CHUNK_SIZE):
+    """按块从数据库读取查询结果（ORM Query 或已是可迭代对象均可）"""
+    if hasattr(query, 'yield_per'):
+        return query.yield_per(chunk_size)
+    return query
+
+
+def iter_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """把行序列编码为 CSV 文本块，每块最多 chunk_size 行"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if count:
+        yield buffer.getvalue()
+
+
+def csv_response(rows, filename):
+    """返回流式 CSV 下载响应；rows 为生成 CSV 行（列表）的可迭代对象"""
+    return Response(
+        stream_with_context(iter_csv(rows)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
@@ -0,0 +1,160 @@
+"""按请求统计 SQL：语句数、数据库耗时与慢查询日志
+
+每个请求结束时：
+    - 通过 Server-Timing 响应头输出 db（数据库耗时、语句数）与 app（总耗时），
+      浏览器开发者工具的 Timing 面板可直接查看；
+    - 把本次请求累加到按 endpoint 分组的进程内统计，供管理员页面查看最差的接口；
+    - 单条语句耗时超过 SLOW_QUERY_THRESHOLD_MS 时，以 JSON 结构写入 <app>.slow_query 日志。
+
+配置项:
+    SQL_INSTRUMENTATION      是否启用（默认 True）
+    SLOW_QUERY_THRESHOLD_MS  慢查询阈值，毫秒（默认 200）
+    SQL_STATS_TOP_N          每个请求/接口保留的最慢语句条数（默认 5）
+
+统计数据只保存在当前 worker 进程内，重启即清空。
+"""
+import json
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 日志与统计页中 SQL 文本的最大长度
+STATEMENT_MAX_LENGTH = 500
+
+
+class EndpointStats:
+    """按 endpoint 汇总的请求 SQL 统计（线程安全）"""
+
+    def __init__(self, top_n=5):
+        self.top_n = top_n
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, query_count, db_ms, total_ms, slowest):
+        with self._lock:
+            entry = self._data.setdefault(endpoint, {
+                'endpoint': endpoint,
+                'requests': 0,
+                'queries': 0,
+                'db_ms': 0.0,
+                'total_ms': 0.0,
+                'max_queries': 0,
+                'max_db_ms': 0.0,
+                'slowest': [],
+            })
+            entry['requests'] += 1
+            entry['queries'] += query_count
+            entry['db_ms'] += db_ms
+            entry['total_ms'] += total_ms
+            entry['max_queries'] = max(entry['max_queries'], query_count)
+            entry['max_db_ms'] = max(entry['max_db_ms'], db_ms)
+            merged = entry['slowest'] + slowest
+            merged.sort(key=lambda s: s['ms'], reverse=True)
+            entry['slowest'] = merged[:self.top_n]
+
+    def worst(self, sort='db_ms', limit=20):
+        """返回按指定指标（平均值）降序排列的接口统计"""
+        with self._lock:
+            rows = []
+            for entry in self._data.values():
+                requests = entry['requests']
+                rows.append(dict(
+                    entry,
+                    slowest=list(entry['slowest']),
+                    avg_queries=entry['queries'] / requests,
+                    avg_db_ms=entry['db_ms'] / requests,
+                    avg_total_ms=entry['total_ms'] / requests,
+                ))
+        key = {'queries': 'avg_queries', 'total_ms': 'avg_total_ms'}.get(sort, 'avg_db_ms')
+        rows.sort(key=lambda r: r[key], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _enabled():
+    return has_request_context() and current_app.config.get('SQL_INSTRUMENTATION', True)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 开始时间记在本条语句的执行上下文上：语句失败时不会走 after_cursor_execute，
+    # 记在连接上会残留在连接池的连接里
+    if _enabled() and context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start_time', None)
+    if start is None or not _enabled():
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = {'count': 0, 'db_ms': 0.0, 'slowest': []}
+    stats['count'] += 1
+    stats['db_ms'] += elapsed_ms
+
+    top_n = current_app.config.get('SQL_STATS_TOP_N', 5)
+    slowest = stats['slowest']
+    if len(slowest) < top_n or elapsed_ms > slowest[-1]['ms']:
+        slowest.append({'ms': round(elapsed_ms, 2), 'statement': statement[:STATEMENT_MAX_LENGTH]})
+        slowest.sort(key=lambda s: s['ms'], reverse=True)
+        del slowest[top_n:]
+
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 200)
+    if elapsed_ms >= threshold:
+        # 只记录语句文本，不记录参数，避免把业务数据写进日志
+        current_app.extensions['sql_instrumentation']['logger'].warning(json.dumps({
+            'event': 'slow_query',
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'ms': round(elapsed_ms, 2),
+            'threshold_ms': threshold,
+            'executemany': executemany,
+            'statement': statement[:STATEMENT_MAX_LENGTH],
+        }, ensure_ascii=False))
+
+
+def init_sql_instrumentation(app):
+    """注册请求钩子；SQL 计时监听在模块导入时已挂到所有 Engine 上"""
+    app.config.setdefault('SQL_INSTRUMENTATION', True)
+    app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+    app.config.setdefault('SQL_STATS_TOP_N', 5)
+
+    endpoint_stats = EndpointStats(top_n=app.config['SQL_STATS_TOP_N'])
+    app.extensions['sql_instrumentation'] = {
+        'stats': endpoint_stats,
+        'logger': logging.getLogger(f'{app.logger.name}.slow_query'),
+    }
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = time.perf_counter()
+
+    @app.after_request
+    def record_sql_stats(response):
+        if not app.config.get('SQL_INSTRUMENTATION', True):
+            return response
+        start = g.get('request_start_time')
+        total_ms = (time.perf_counter() - start) * 1000 if start else 0.0
+        stats = g.get('sql_stats') or {'count': 0, 'db_ms': 0.0, 'slowest': []}
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats["db_ms"]:.2f};desc="{stats["count"]} queries", app;dur={total_ms:.2f}'
+        )
+        if request.endpoint and request.endpoint != 'static':
+            endpoint_stats.record(request.endpoint, stats['count'], stats['db_ms'], total_ms, stats['slowest'])
+        return response
+
+    return endpoint_stats
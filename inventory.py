@@ -0,0 +1,103 @@
+"""库存变动工具
+
+所有商品库存的增减都通过单条带条件的 UPDATE 完成：
+
+    UPDATE products SET stock_quantity = stock_quantity - :q
+    WHERE id = :id AND stock_quantity >= :q
+
+由数据库保证"检查 + 扣减"的原子性，多 worker 并发下单同一商品时不会超卖，
+不需要全局锁。rowcount 为 0 即表示库存不足。
+"""
+import functools
+import random
+import time
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from models import db, Product, StockAdjustment
+
+
+class InsufficientStock(Exception):
+    """库存不足，扣减未执行"""
+
+    def __init__(self, product_id, requested, available):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f'商品 {product_id} 库存不足: 需要 {requested}, 实际 {available}')
+
+
+def adjust_product_stock(product_id, delta, reason, created_by=None):
+    """原子地调整商品库存并记录 StockAdjustment
+
+    delta 为负数时带条件扣减，库存不足抛出 InsufficientStock；为正数时直接增加。
+    会话中已加载的 Product 对象的 stock_quantity 会同步为最新值。
+    返回新增的 StockAdjustment 记录（已加入会话，未提交）。
+    """
+    stmt = (
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock_quantity=Product.stock_quantity + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if delta < 0:
+        stmt = stmt.where(Product.stock_quantity >= -delta)
+
+    result = db.session.execute(stmt)
+    # 同一事务内，该行已被本事务锁定，读取到的就是更新后的值
+    current = db.session.execute(
+        select(Product.stock_quantity).where(Product.id == product_id)
+    ).scalar()
+
+    if result.rowcount == 0:
+        raise InsufficientStock(product_id, -delta, current)
+
+    # 同步会话中已加载的对象，避免页面/后续逻辑读到旧库存
+    product = db.session.identity_map.get(identity_key(Product, product_id))
+    if product is not None:
+        set_committed_value(product, 'stock_quantity', current)
+
+    adjustment = StockAdjustment(
+        adjustment_type='product',
+        product_id=product_id,
+        quantity_before=current - delta,
+        quantity_after=current,
+        adjustment_quantity=delta,
+        reason=reason,
+        created_by=created_by
+    )
+    db.session.add(adjustment)
+    return adjustment
+
+
+def _is_retryable(error):
+    """锁冲突 / 死锁 / 序列化失败，重试整个事务即可"""
+    pgcode = getattr(error.orig, 'pgcode', None)
+    if pgcode in ('40001', '40P01'):
+        return True
+    message = str(error.orig).lower()
+    return any(key in message for key in ('database is locked', 'deadlock', 'could not serialize'))
+
+
+def retry_on_conflict(view):
+    """视图函数遇到锁冲突或序列化错误时回滚并整体重试
+
+    重试次数由 STOCK_RETRY_ATTEMPTS 配置（默认 3 次），采用带抖动的指数退避。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        attempts = current_app.config.get('STOCK_RETRY_ATTEMPTS', 3)
+        for attempt in range(attempts + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if attempt >= attempts or not _is_retryable(e):
+                    raise
+                current_app.logger.warning('数据库锁冲突，第 %d 次重试 %s: %s', attempt + 1, view.__name__, e.orig)
+                time.sleep(0.05 * (2 ** attempt) * (1 + random.random()))  # nosec B311 - 退避抖动，不涉及安全
+    return wrapper
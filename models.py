@@ -1,21 +1,145 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Any, Optional
+from flask import current_app, has_app_context
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-import secrets
+from sqlalchemy import case, event, select
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, raiseload, relationship
 import string
+import threading
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
-def generate_order_number() -> str:
-    """生成唯一的订单号: 年月日 + 6位随机字符"""
-    date_part = datetime.now().strftime('%Y%m%d')
-    random_part = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(6))
-    return f"{date_part}{random_part}"
+@event.listens_for(Session, 'do_orm_execute')
+def _strict_loading(orm_execute_state):
+    """严格加载模式（STRICT_LOADING 配置，开发和测试环境使用）
+
+    所有 ORM 查询默认附加 raiseload('*')：没有通过 joinedload/selectinload 显式预加载的关系，
+    在需要额外发出 SQL 时直接抛出异常，让新的 N+1 查询在开发阶段暴露出来。
+    已在会话中的对象（例如按主键从 identity map 取到的多对一关系）不受影响。
+    """
+    if (
+        orm_execute_state.is_select
+        and not orm_execute_state.is_column_load
+        and has_app_context()
+        and current_app.config.get('STRICT_LOADING')
+    ):
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*', sql_only=True))
+
+# 订单号 = 年月日 + 6 位序号（0-9A-Z 的 36 进制，左补 0），按字符串排序即按分配顺序
+ORDER_NUMBER_ALPHABET = string.digits + string.ascii_uppercase
+ORDER_NUMBER_WIDTH = 6
+ORDER_NUMBER_MAX = len(ORDER_NUMBER_ALPHABET) ** ORDER_NUMBER_WIDTH - 1
+
+# 非 SQLite 数据库上每个 worker 一次预留的序号个数，可由 ORDER_NUMBER_BLOCK_SIZE 配置覆盖
+ORDER_NUMBER_BLOCK_SIZE = 50
+
+
+def format_order_number(day: str, value: int) -> str:
+    """把当天第 value 个序号格式化为订单号"""
+    if not 0 < value <= ORDER_NUMBER_MAX:
+        raise ValueError(f'{day} 的订单号已用尽')
+    digits = []
+    while value:
+        value, remainder = divmod(value, len(ORDER_NUMBER_ALPHABET))
+        digits.append(ORDER_NUMBER_ALPHABET[remainder])
+    return day + ''.join(reversed(digits)).rjust(ORDER_NUMBER_WIDTH, '0')
+
+
+def advance_sequence(connection, table, key, count: int = 0, at_least: int = 0) -> int:
+    """在 connection 的事务内推进序列表（键 + last_value 两列）中 key 的计数，返回新值
+
+    新值 = max(当前值 + count, at_least)：count 用于预留 count 个序号，
+    at_least 用于登记外部写入的编号，之后不会再分配到它。
+
+    SQLite / PostgreSQL 用一条 INSERT ... ON CONFLICT DO UPDATE ... RETURNING 完成，
+    不需要先读后写；并发的预留由序列行上的写锁串行化，区间互不重叠。
+    """
+    key_column = table.primary_key.columns.values()[0]
+    advanced = table.c.last_value + count
+    new_value = case((advanced < at_least, at_least), else_=advanced)
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        stmt = upsert(table).values({key_column: key, table.c.last_value: max(count, at_least)}).on_conflict_do_update(
+            index_elements=[key_column],
+            set_={'last_value': new_value}
+        ).returning(table.c.last_value)
+        return connection.execute(stmt).scalar_one()
+
+    # 其他数据库：先带条件 UPDATE 锁住序列行，首次使用该键时再插入
+    updated = connection.execute(table.update().where(key_column == key).values(last_value=new_value)).rowcount
+    if not updated:
+        connection.execute(table.insert().values({key_column: key, table.c.last_value: max(count, at_least)}))
+    return connection.execute(select(table.c.last_value).where(key_column == key)).scalar_one()
+
+
+def reserve_order_numbers(connection, day: str, count: int) -> int:
+    """把当天的订单号序列推进 count，返回预留区间的最后一个序号"""
+    return advance_sequence(connection, OrderNumberSequence.__table__, day, count)
+
+
+class OrderNumberAllocator:
+    """按天单调递增、互不重复的订单号分配器
+
+    SQLite 同一时刻只允许一个写事务，序号直接在调用方的事务内预留：订单回滚时
+    序号一起回滚，订单号连续。
+
+    其他数据库上每个 worker 以独立的短事务一次预留一段序号（ORDER_NUMBER_BLOCK_SIZE），
+    之后在进程内分配，序列行的锁只在预留的瞬间持有，不会随订单事务一直占用。
+    代价是各 worker 的订单号交错、回滚或重启会留下空号，但绝不重复。
+    """
+
+    def __init__(self):
+        self._blocks = {}  # 引擎 URL -> [日期, 下一个序号, 区间末尾]
+        self._lock = threading.Lock()
+
+    def _block_size(self):
+        if has_app_context():
+            return current_app.config.get('ORDER_NUMBER_BLOCK_SIZE', ORDER_NUMBER_BLOCK_SIZE)
+        return ORDER_NUMBER_BLOCK_SIZE
+
+    def allocate(self, connection, count: int = 1, day: Optional[str] = None) -> list[str]:
+        """分配 count 个订单号，按分配顺序返回"""
+        day = day or datetime.now().strftime('%Y%m%d')
+        block_size = self._block_size()
+        if connection.dialect.name == 'sqlite' or block_size <= 1:
+            end = reserve_order_numbers(connection, day, count)
+            return [format_order_number(day, value) for value in range(end - count + 1, end + 1)]
+
+        engine = connection.engine
+        values = []
+        with self._lock:
+            block = self._blocks.get(str(engine.url))
+            while len(values) < count:
+                if block is None or block[0] != day or block[1] > block[2]:
+                    size = max(block_size, count - len(values))
+                    with engine.begin() as reserve_connection:
+                        end = reserve_order_numbers(reserve_connection, day, size)
+                    block = self._blocks[str(engine.url)] = [day, end - size + 1, end]
+                take = min(count - len(values), block[2] - block[1] + 1)
+                values.extend(range(block[1], block[1] + take))
+                block[1] += take
+        return [format_order_number(day, value) for value in values]
+
+    def reset(self):
+        """丢弃进程内尚未用完的序号段（测试或重建数据库后使用）"""
+        with self._lock:
+            self._blocks.clear()
+
+
+order_number_allocator = OrderNumberAllocator()
+
+
+def generate_order_number(context) -> str:
+    """Order.order_number 的默认值：在插入语句所在的连接上分配"""
+    return order_number_allocator.allocate(context.connection)[0]
 
 class User(UserMixin, db.Model):
     """用户模型"""
@@ -40,6 +164,12 @@ class Customer(db.Model):
     phone: Mapped[str] = mapped_column()
     address: Mapped[str] = mapped_column()
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.now, onupdate=datetime.now)
+    
+    # API 条件请求取 MAX(updated_at)
+    __table_args__ = (
+        db.Index('ix_customers_updated_at', 'updated_at'),
+    )
     
     # 关系
     orders: Mapped[list['Order']] = relationship('Order', back_populates='customer', lazy=True)
@@ -57,6 +187,11 @@ class Supplier(db.Model):
     phone: Mapped[str] = mapped_column()
     address: Mapped[str] = mapped_column()
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_suppliers_updated_at', 'updated_at'),
+    )
     
     # 关系
     products: Mapped[list['Product']] = relationship('Product', back_populates='supplier', lazy=True)
@@ -74,6 +209,11 @@ class Category(db.Model):
     name: Mapped[str] = mapped_column(unique=True, nullable=False)
     description: Mapped[str] = mapped_column()
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_categories_updated_at', 'updated_at'),
+    )
     
     # 关系
     products: Mapped[list['Product']] = relationship('Product', back_populates='category', lazy=True)
@@ -100,6 +240,13 @@ class Product(db.Model):
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
     
+    # 索引：分类筛选 / 仪表盘分类计数 / API 条件请求取 MAX(updated_at)
+    __table_args__ = (
+        db.Index('ix_products_category_id', 'category_id'),
+        db.Index('ix_products_supplier_id', 'supplier_id'),
+        db.Index('ix_products_updated_at', 'updated_at'),
+    )
+    
     # 关系
     category: Mapped['Category'] = relationship('Category', back_populates='products')
     supplier: Mapped['Supplier'] = relationship('Supplier', back_populates='products')
@@ -127,6 +274,10 @@ class RawMaterial(db.Model):
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
     
+    __table_args__ = (
+        db.Index('ix_raw_materials_updated_at', 'updated_at'),
+    )
+    
     # 关系
     purchases: Mapped[list['RawMaterialPurchase']] = relationship('RawMaterialPurchase', back_populates='raw_material', lazy=True)
     stock_adjustments: Mapped[list['StockAdjustment']] = relationship('StockAdjustment', back_populates='raw_material', lazy=True, primaryjoin="and_(StockAdjustment.raw_material_id == RawMaterial.id, StockAdjustment.adjustment_type == 'raw_material')")
@@ -149,6 +300,14 @@ class Order(db.Model):
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
     
+    # 索引：order.list 按日期倒序 + 客户/状态筛选，report.sales 按日期范围 + 状态汇总
+    __table_args__ = (
+        db.Index('ix_orders_order_date_id', 'order_date', 'id'),
+        db.Index('ix_orders_customer_id_order_date', 'customer_id', 'order_date'),
+        db.Index('ix_orders_status_order_date', 'status', 'order_date'),
+        db.Index('ix_orders_created_at', 'created_at'),
+    )
+    
     # 关系
     customer: Mapped['Customer'] = relationship('Customer', back_populates='orders')
     items: Mapped[list['OrderItem']] = relationship('OrderItem', back_populates='order', cascade='all, delete-orphan', lazy=True)
@@ -168,6 +327,12 @@ class OrderItem(db.Model):
     subtotal: Mapped[float] = mapped_column(nullable=False)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     
+    # 索引：按订单加载明细，按商品汇总销量 / 分类筛选订单
+    __table_args__ = (
+        db.Index('ix_order_items_order_id', 'order_id'),
+        db.Index('ix_order_items_product_id_order_id', 'product_id', 'order_id'),
+    )
+    
     # 关系
     order: Mapped['Order'] = relationship('Order', back_populates='items')
     product: Mapped['Product'] = relationship('Product', back_populates='order_items')
@@ -186,8 +351,18 @@ class RawMaterialPurchase(db.Model):
     quantity: Mapped[float] = mapped_column(nullable=False)
     unit_price: Mapped[float] = mapped_column(nullable=False)
     total_price: Mapped[float] = mapped_column(nullable=False)
+    # 采购月份 YYYYMM，由 purchase_date 在写入时派生（见 _set_purchase_month），原材料成本报表按月汇总用
+    purchase_month: Mapped[Optional[int]] = mapped_column()
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     
+    # 索引：采购列表 / 原材料成本报表按日期范围或月份，供应商与原材料详情页的采购历史
+    __table_args__ = (
+        db.Index('ix_raw_material_purchases_purchase_date', 'purchase_date'),
+        db.Index('ix_raw_material_purchases_purchase_month', 'purchase_month'),
+        db.Index('ix_raw_material_purchases_supplier_id_purchase_date', 'supplier_id', 'purchase_date'),
+        db.Index('ix_raw_material_purchases_raw_material_id_purchase_date', 'raw_material_id', 'purchase_date'),
+    )
+    
     # 关系
     raw_material: Mapped['RawMaterial'] = relationship('RawMaterial', back_populates='purchases')
     supplier: Mapped['Supplier'] = relationship('Supplier', back_populates='raw_material_purchases')
@@ -200,6 +375,17 @@ class RawMaterialPurchase(db.Model):
         self.total_price = self.quantity * self.unit_price
         return self.total_price
 
+def month_key(value) -> int:
+    """日期所在月份的整数键 YYYYMM"""
+    return value.year * 100 + value.month
+
+@event.listens_for(RawMaterialPurchase, 'before_insert')
+@event.listens_for(RawMaterialPurchase, 'before_update')
+def _set_purchase_month(mapper, connection, target):
+    if target.purchase_date is None:
+        target.purchase_date = datetime.now()
+    target.purchase_month = month_key(target.purchase_date)
+
 class StockAdjustment(db.Model):
     """库存调整记录"""
     __tablename__ = 'stock_adjustments'
@@ -216,9 +402,305 @@ class StockAdjustment(db.Model):
     created_by: Mapped[str] = mapped_column() # 记录操作者
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     
+    # 索引：商品 / 原材料详情页的库存调整历史（按类型 + 对象筛选，按日期倒序）
+    __table_args__ = (
+        db.Index('ix_stock_adjustments_type_product_date', 'adjustment_type', 'product_id', 'adjustment_date'),
+        db.Index('ix_stock_adjustments_type_raw_material_date', 'adjustment_type', 'raw_material_id', 'adjustment_date'),
+    )
+    
     # 关系
     product: Mapped['Product'] = relationship('Product', back_populates='stock_adjustments', primaryjoin="and_(StockAdjustment.product_id == Product.id, StockAdjustment.adjustment_type == 'product')")
     raw_material: Mapped['RawMaterial'] = relationship('RawMaterial', back_populates='stock_adjustments', primaryjoin="and_(StockAdjustment.raw_material_id == RawMaterial.id, StockAdjustment.adjustment_type == 'raw_material')")
     
     def __repr__(self):
-        return f'<库存调整 {self.id}>'
\ No newline at end of file
+        return f'<库存调整 {self.id}>'
+
+class DailySalesRollup(db.Model):
+    """每日销售汇总：日期 × 商品 × 分类 × 客户
+
+    订单创建、编辑、状态变更、删除时在同一事务内增量维护（见 rollups.py），
+    销售报表直接读取本表，耗时取决于日期范围内的天数而非订单数。
+    已取消订单不计入。
+    """
+    __tablename__ = 'daily_sales_rollup'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(nullable=False)
+    product_id: Mapped[int] = mapped_column(db.ForeignKey('products.id'), nullable=False)
+    category_id: Mapped[int] = mapped_column(db.ForeignKey('categories.id'), nullable=False)
+    customer_id: Mapped[int] = mapped_column(db.ForeignKey('customers.id'), nullable=False)
+    quantity: Mapped[int] = mapped_column(default=0)
+    amount: Mapped[float] = mapped_column(default=0.0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'product_id', 'category_id', 'customer_id', name='uq_daily_sales_rollup_key'),
+        db.Index('ix_daily_sales_rollup_day_category', 'day', 'category_id'),
+    )
+    
+    def __repr__(self):
+        return f'<销售日汇总 {self.day} 商品 {self.product_id}>'
+
+class DailyCustomerSales(db.Model):
+    """每日客户订单汇总：日期 × 客户，记录订单数和订单总额
+
+    订单数无法从按商品拆分的 DailySalesRollup 中累加得到，单独维护。
+    """
+    __tablename__ = 'daily_customer_sales'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(nullable=False)
+    customer_id: Mapped[int] = mapped_column(db.ForeignKey('customers.id'), nullable=False)
+    order_count: Mapped[int] = mapped_column(default=0)
+    amount: Mapped[float] = mapped_column(default=0.0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'customer_id', name='uq_daily_customer_sales_key'),
+    )
+    
+    def __repr__(self):
+        return f'<客户日汇总 {self.day} 客户 {self.customer_id}>'
+
+class MonthlyMaterialCost(db.Model):
+    """原材料采购月汇总：月份 × 原材料 × 供应商，记录采购次数、采购数量和采购金额
+
+    由 purchase.add 在同一事务内累加，原材料成本报表从该表读取整月数据。
+    """
+    __tablename__ = 'monthly_material_costs'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    month: Mapped[int] = mapped_column(nullable=False)  # YYYYMM
+    raw_material_id: Mapped[int] = mapped_column(db.ForeignKey('raw_materials.id'), nullable=False)
+    supplier_id: Mapped[int] = mapped_column(db.ForeignKey('suppliers.id'), nullable=False)
+    purchase_count: Mapped[int] = mapped_column(default=0)
+    quantity: Mapped[float] = mapped_column(default=0.0)
+    amount: Mapped[float] = mapped_column(default=0.0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('month', 'raw_material_id', 'supplier_id', name='uq_monthly_material_costs_key'),
+    )
+    
+    def __repr__(self):
+        return f'<原材料月汇总 {self.month} 原材料 {self.raw_material_id}>'
+
+class ReportVersion(db.Model):
+    """报表数据版本：每天一行，当天的汇总数据每被一个事务修改一次 version 加 1
+
+    day 为 date.min 的一行是全局版本（重建汇总表、修改名称等影响全部报表的写操作）。
+    各 worker 的报表缓存按日期范围内的版本之和校验（见 report_cache.py）。
+    """
+    __tablename__ = 'report_versions'
+    
+    day: Mapped[date] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<报表版本 {self.day}: {self.version}>'
+
+class InventorySnapshot(db.Model):
+    """每日库存价值快照：商品与原材料的库存总量和总价值（按成本价）
+
+    由 flask snapshot-inventory 每晚写入一行（同一天重复执行时覆盖），
+    查询某月月末的库存价值只需按日期取一行，不需要回放库存调整记录。
+    """
+    __tablename__ = 'inventory_snapshots'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    snapshot_date: Mapped[date] = mapped_column(unique=True, nullable=False)
+    product_quantity: Mapped[int] = mapped_column(default=0)
+    product_value: Mapped[float] = mapped_column(default=0.0)
+    raw_material_quantity: Mapped[float] = mapped_column(default=0.0)
+    raw_material_value: Mapped[float] = mapped_column(default=0.0)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    
+    @property
+    def total_value(self):
+        return (self.product_value or 0.0) + (self.raw_material_value or 0.0)
+    
+    def __repr__(self):
+        return f'<库存价值快照 {self.snapshot_date}>'
+
+class StockCheckpoint(db.Model):
+    """库存检查点：某个商品 / 原材料在 checkpoint_at 时刻（不含）之前全部库存调整之后的数量
+
+    按月建立（每月第一天 0 点），只为当月有库存调整的对象写入一行。
+    某一时刻的历史库存 = 最近一个检查点 + 之后的调整，见 stock_history.py。
+    """
+    __tablename__ = 'stock_checkpoints'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    item_type: Mapped[str] = mapped_column(nullable=False)  # 'product' 或 'raw_material'，与 StockAdjustment 一致
+    item_id: Mapped[int] = mapped_column(nullable=False)
+    checkpoint_at: Mapped[datetime] = mapped_column(nullable=False)
+    quantity: Mapped[float] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    
+    # 唯一约束同时用于按对象查找不晚于某一时刻的最近检查点
+    __table_args__ = (
+        db.UniqueConstraint('item_type', 'item_id', 'checkpoint_at', name='uq_stock_checkpoints_item_at'),
+    )
+    
+    def __repr__(self):
+        return f'<库存检查点 {self.item_type} {self.item_id} {self.checkpoint_at}>'
+
+# ---- 归档表：flask archive 把已结束的旧订单、旧库存流水移到这里（见 archive.py） ----
+# 列与对应的在线表一致并保留原 id，只建报表 / 历史查询需要的索引，不参与日常列表和写入。
+
+class ArchivedOrder(db.Model):
+    """已归档的订单（已完成 / 已取消）"""
+    __tablename__ = 'archived_orders'
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    order_number: Mapped[str] = mapped_column(unique=True, nullable=False)
+    order_date: Mapped[datetime] = mapped_column()
+    customer_id: Mapped[int] = mapped_column(db.ForeignKey('customers.id'), nullable=False)
+    total_amount: Mapped[float] = mapped_column(default=0.0)
+    status: Mapped[str] = mapped_column()
+    payment_method: Mapped[str] = mapped_column()
+    notes: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column()
+    updated_at: Mapped[datetime] = mapped_column()
+    archived_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_archived_orders_order_date', 'order_date'),
+        db.Index('ix_archived_orders_customer_id', 'customer_id'),
+    )
+    
+    def __repr__(self):
+        return f'<已归档订单 {self.order_number}>'
+
+class ArchivedOrderItem(db.Model):
+    """已归档订单的订单项"""
+    __tablename__ = 'archived_order_items'
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    order_id: Mapped[int] = mapped_column(db.ForeignKey('archived_orders.id'), nullable=False)
+    product_id: Mapped[int] = mapped_column(db.ForeignKey('products.id'), nullable=False)
+    quantity: Mapped[int] = mapped_column(nullable=False)
+    unit_price: Mapped[float] = mapped_column(nullable=False)
+    subtotal: Mapped[float] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column()
+    
+    __table_args__ = (
+        db.Index('ix_archived_order_items_order_id', 'order_id'),
+        db.Index('ix_archived_order_items_product_id', 'product_id'),
+    )
+    
+    def __repr__(self):
+        return f'<已归档订单项 {self.id} - 订单 {self.order_id}>'
+
+class ArchivedStockAdjustment(db.Model):
+    """已归档的库存调整记录"""
+    __tablename__ = 'archived_stock_adjustments'
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    adjustment_date: Mapped[datetime] = mapped_column()
+    adjustment_type: Mapped[str] = mapped_column(nullable=False)
+    # 不设外键：商品 / 原材料删除后在线流水的引用被置空，归档流水保留原 id 作为历史记录
+    product_id: Mapped[Optional[int]] = mapped_column()
+    raw_material_id: Mapped[Optional[int]] = mapped_column()
+    quantity_before: Mapped[float] = mapped_column(nullable=False)
+    quantity_after: Mapped[float] = mapped_column(nullable=False)
+    adjustment_quantity: Mapped[float] = mapped_column(nullable=False)
+    reason: Mapped[str] = mapped_column(nullable=False)
+    created_by: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column()
+    
+    # 索引：历史库存按对象 + 日期累加
+    __table_args__ = (
+        db.Index('ix_archived_stock_adjustments_type_product_date', 'adjustment_type', 'product_id', 'adjustment_date'),
+        db.Index('ix_archived_stock_adjustments_type_raw_material_date', 'adjustment_type', 'raw_material_id', 'adjustment_date'),
+    )
+    
+    def __repr__(self):
+        return f'<已归档库存调整 {self.id}>'
+
+class OrderNumberSequence(db.Model):
+    """订单号每日序列：day 为 YYYYMMDD，last_value 为当天已预留的最大序号"""
+    __tablename__ = 'order_number_sequences'
+    
+    day: Mapped[str] = mapped_column(primary_key=True)
+    last_value: Mapped[int] = mapped_column(nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<订单号序列 {self.day}: {self.last_value}>'
+
+class SkuSequence(db.Model):
+    """自动生成 SKU 的序列：prefix 为名称拼音首字母，last_value 为该前缀已使用的最大序号"""
+    __tablename__ = 'sku_sequences'
+    
+    prefix: Mapped[str] = mapped_column(primary_key=True)
+    last_value: Mapped[int] = mapped_column(nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SKU 序列 {self.prefix}: {self.last_value}>'
+
+class TableDeleteCount(db.Model):
+    """各表累计删除的行数，由下方的 flush / 批量删除钩子在删除的同一事务内推进
+
+    API 条件请求用它感知删除（新增看最大 id，修改看最大 updated_at），不必每次 COUNT 全表。
+    """
+    __tablename__ = 'table_delete_counts'
+    
+    table_name: Mapped[str] = mapped_column(primary_key=True)
+    last_value: Mapped[int] = mapped_column(nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<删除计数 {self.table_name}: {self.last_value}>'
+
+# 记录删除计数的表（API 列表接口的数据）
+DELETE_COUNTED_MODELS = (Customer, Supplier, Category, Product, RawMaterial)
+
+
+@event.listens_for(Session, 'before_flush')
+def _count_deletes(session, flush_context, instances):
+    counts = {}
+    for obj in session.deleted:
+        if isinstance(obj, DELETE_COUNTED_MODELS):
+            counts[obj.__tablename__] = counts.get(obj.__tablename__, 0) + 1
+    for table_name in sorted(counts):
+        advance_sequence(session.connection(), TableDeleteCount.__table__, table_name, counts[table_name])
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _count_bulk_deletes(orm_execute_state):
+    """delete(Product) 等批量删除不经过 flush，删除行数未知，计数加 1 即可让版本变化"""
+    mapper = orm_execute_state.bind_mapper
+    if orm_execute_state.is_delete and mapper is not None and issubclass(mapper.class_, DELETE_COUNTED_MODELS):
+        advance_sequence(
+            orm_execute_state.session.connection(), TableDeleteCount.__table__, mapper.class_.__tablename__, 1
+        )
+
+class StocktakeSession(db.Model):
+    """库存盘点单：上传实盘数量后先预览差异，确认后一次性写入库存调整"""
+    __tablename__ = 'stocktake_sessions'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    status: Mapped[str] = mapped_column(default='待确认')  # 待确认 / 已应用 / 已取消
+    filename: Mapped[Optional[str]] = mapped_column()
+    line_count: Mapped[int] = mapped_column(default=0)
+    created_by: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    applied_at: Mapped[Optional[datetime]] = mapped_column()
+    
+    def __repr__(self):
+        return f'<盘点单 {self.id}>'
+
+class StocktakeLine(db.Model):
+    """盘点明细：一个商品或原材料的实盘数量"""
+    __tablename__ = 'stocktake_lines'
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    session_id: Mapped[int] = mapped_column(db.ForeignKey('stocktake_sessions.id'), nullable=False)
+    item_type: Mapped[str] = mapped_column(nullable=False)  # 'product' 或 'raw_material'
+    product_id: Mapped[Optional[int]] = mapped_column(db.ForeignKey('products.id'))
+    raw_material_id: Mapped[Optional[int]] = mapped_column(db.ForeignKey('raw_materials.id'))
+    counted_quantity: Mapped[float] = mapped_column(nullable=False)
+    
+    # 索引：预览和应用时按盘点单读取全部明细
+    __table_args__ = (
+        db.Index('ix_stocktake_lines_session_id', 'session_id'),
+    )
+    
+    def __repr__(self):
+        return f'<盘点明细 {self.id} - 盘点单 {self.session_id}>'
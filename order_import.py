@@ -0,0 +1,380 @@
+"""批量导入订单（CSV / JSON）
+
+供 flask import-orders 命令和 POST /api/orders/import 共用。
+
+JSON 格式：订单数组（或 {"orders": [...]}），每个订单：
+
+    {"ref": "外部单号", "order_date": "2026-01-01", "customer_id": 1,
+     "status": "已支付", "payment_method": "支付宝", "notes": "",
+     "items": [{"sku": "HSB-1", "quantity": 2, "unit_price": 9.9}, ...]}
+
+CSV 格式：每行一个订单项，表头为
+    ref,order_date,customer_id,status,payment_method,notes,product_id,sku,quantity,unit_price
+相同 ref 的行合并为一个订单，订单级字段取该订单的第一行。
+
+商品可用 product_id 或 sku 指定，unit_price 缺省时使用商品售价；order_date 缺省为当前时间，
+status 缺省为待支付，payment_method 缺省为其他。
+
+订单按 chunk_size 分块处理，每块：
+    1. 一次查询校验块内全部客户、商品和库存，逐单在内存中扣减可用库存；
+    2. 按商品汇总扣减量，一条 executemany 的条件 UPDATE 完成扣减（与 inventory 模块相同的
+       stock_quantity >= :qty 条件，并发下不会超卖；受影响行数不足说明库存被并发占用，
+       回滚本块并重新校验）；
+    3. 订单号从每日序列一次预留整块，Order / OrderItem / StockAdjustment 用批量 insert() 写入，
+       销售日汇总一次累加；
+    4. 提交本块。
+校验失败的订单记录行号和原因后跳过，不影响同批其他订单。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, or_, select
+
+from models import db, Order, OrderItem, Customer, Product, StockAdjustment, order_number_allocator
+from rollups import CANCELLED_STATUS, sales_snapshot, merge_snapshots, apply_sales_delta
+
+ORDER_STATUSES = ('待支付', '已支付', '已发货', '已完成', '已取消')
+DEFAULT_STATUS = '待支付'
+DEFAULT_PAYMENT_METHOD = '其他'
+
+# 每块订单数，可由 ORDER_IMPORT_CHUNK_SIZE 配置覆盖
+IMPORT_CHUNK_SIZE = 500
+
+# 库存被并发占用时，单块最多重新校验的次数
+CHUNK_RETRY_ATTEMPTS = 3
+
+CSV_COLUMNS = (
+    'ref', 'order_date', 'customer_id', 'status', 'payment_method', 'notes',
+    'product_id', 'sku', 'quantity', 'unit_price'
+)
+
+
+class OrderImportError(ValueError):
+    """整个文件无法解析（格式错误），不是单个订单的校验失败"""
+
+
+class ImportResult:
+    """导入结果：成功订单数、新订单 ID 与逐行错误"""
+
+    def __init__(self):
+        self.order_ids = []
+        self.errors = []
+
+    @property
+    def imported(self):
+        return len(self.order_ids)
+
+    def add_error(self, order, message):
+        self.errors.append({'row': order.row, 'ref': order.ref, 'error': message})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': len(self.errors),
+            'order_ids': self.order_ids,
+            'errors': self.errors,
+        }
+
+
+class _ImportLine:
+    def __init__(self, product_id, sku, quantity, unit_price):
+        self.product_id = product_id
+        self.sku = sku
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.subtotal = None
+
+
+class _ImportOrder:
+    def __init__(self, row, ref):
+        self.row = row
+        self.ref = ref
+        self.order_date = None
+        self.customer_id = None
+        self.status = DEFAULT_STATUS
+        self.payment_method = DEFAULT_PAYMENT_METHOD
+        self.notes = ''
+        self.items = []
+        self.total_amount = 0.0
+        self.error = None
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _parse_order_fields(order, data):
+    """解析订单级字段，出错时写入 order.error"""
+    try:
+        raw_date = data.get('order_date')
+        if _blank(raw_date):
+            order.order_date = datetime.now()
+        else:
+            order.order_date = datetime.fromisoformat(str(raw_date).strip())
+    except ValueError:
+        order.error = f'订单日期格式无效: {raw_date}'
+        return
+    try:
+        order.customer_id = int(data.get('customer_id'))
+    except (TypeError, ValueError):
+        order.error = '缺少或无效的 customer_id'
+        return
+    if not _blank(data.get('status')):
+        order.status = str(data['status']).strip()
+    if order.status not in ORDER_STATUSES:
+        order.error = f'无效的订单状态: {order.status}'
+        return
+    if not _blank(data.get('payment_method')):
+        order.payment_method = str(data['payment_method']).strip()
+    order.notes = data.get('notes') or ''
+
+
+def _parse_line(order, data, position):
+    """解析一个订单项，出错时写入 order.error"""
+    if order.error:
+        return
+    try:
+        product_id = None if _blank(data.get('product_id')) else int(data['product_id'])
+        sku = None if _blank(data.get('sku')) else str(data['sku']).strip()
+        quantity = int(data.get('quantity'))
+        unit_price = None if _blank(data.get('unit_price')) else float(data['unit_price'])
+    except (TypeError, ValueError):
+        order.error = f'订单项 {position} 的商品、数量或单价格式无效'
+        return
+    if product_id is None and sku is None:
+        order.error = f'订单项 {position} 缺少 product_id 或 sku'
+    elif quantity <= 0:
+        order.error = f'订单项 {position} 的数量必须大于0'
+    elif unit_price is not None and unit_price < 0:
+        order.error = f'订单项 {position} 的单价不能为负数'
+    else:
+        order.items.append(_ImportLine(product_id, sku, quantity, unit_price))
+
+
+def parse_json(text):
+    """解析 JSON 订单数组，row 为订单在数组中的序号（从 1 开始）"""
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise OrderImportError(f'JSON 格式错误: {e}')
+    if isinstance(data, dict):
+        data = data.get('orders')
+    if not isinstance(data, list):
+        raise OrderImportError('JSON 顶层必须是订单数组或 {"orders": [...]}')
+
+    orders = []
+    for row, entry in enumerate(data, start=1):
+        if not isinstance(entry, dict):
+            order = _ImportOrder(row, None)
+            order.error = '订单必须是 JSON 对象'
+            orders.append(order)
+            continue
+        order = _ImportOrder(row, entry.get('ref'))
+        _parse_order_fields(order, entry)
+        items = entry.get('items')
+        if not isinstance(items, list) or not items:
+            order.error = order.error or '订单必须包含至少一项商品'
+        else:
+            for position, item in enumerate(items, start=1):
+                _parse_line(order, item if isinstance(item, dict) else {}, position)
+        orders.append(order)
+    return orders
+
+
+def parse_csv(text):
+    """解析 CSV 订单项，按 ref 合并为订单，row 为订单第一行的行号（表头为第 1 行）"""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'ref' not in reader.fieldnames:
+        raise OrderImportError(f'CSV 缺少表头，需包含: {",".join(CSV_COLUMNS)}')
+
+    orders = {}
+    for line in reader:
+        ref = (line.get('ref') or '').strip()
+        order = orders.get(ref)
+        if order is None:
+            order = orders[ref] = _ImportOrder(reader.line_num, ref or None)
+            if not ref:
+                order.error = '缺少 ref'
+            else:
+                _parse_order_fields(order, line)
+        _parse_line(order, line, len(order.items) + 1)
+    return list(orders.values())
+
+
+def parse_orders(content, fmt):
+    """按格式（csv / json）解析文件内容（str 或 bytes）"""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if fmt == 'json':
+        return parse_json(content)
+    if fmt == 'csv':
+        return parse_csv(content)
+    raise OrderImportError(f'不支持的格式: {fmt}')
+
+
+def _validate_chunk(orders, result):
+    """一次查询加载块内全部客户和商品，逐单校验并在内存中扣减库存
+
+    返回 (通过校验的订单, {商品ID: 扣减总量}, {商品ID: 分类ID})。
+    """
+    customer_ids = {o.customer_id for o in orders}
+    product_ids = {line.product_id for o in orders for line in o.items if line.product_id is not None}
+    skus = {line.sku for o in orders for line in o.items if line.sku is not None}
+
+    existing_customers = set(db.session.scalars(select(Customer.id).where(Customer.id.in_(customer_ids))))
+    conditions = []
+    if product_ids:
+        conditions.append(Product.id.in_(product_ids))
+    if skus:
+        conditions.append(Product.sku.in_(skus))
+    rows = db.session.execute(
+        select(Product.id, Product.sku, Product.selling_price, Product.category_id, Product.stock_quantity)
+        .where(or_(*conditions))
+    ).all()
+    by_id = {r.id: r for r in rows}
+    by_sku = {r.sku: r for r in rows if r.sku}
+    available = {r.id: r.stock_quantity for r in rows}
+
+    accepted, decrements = [], {}
+    for order in orders:
+        if order.customer_id not in existing_customers:
+            result.add_error(order, f'客户ID {order.customer_id} 不存在')
+            continue
+        needed = {}
+        for position, line in enumerate(order.items, start=1):
+            product = by_id.get(line.product_id) if line.product_id is not None else by_sku.get(line.sku)
+            if product is None:
+                order.error = f'订单项 {position} 的商品 {line.product_id or line.sku} 不存在'
+                break
+            line.product_id = product.id
+            if line.unit_price is None:
+                line.unit_price = product.selling_price
+            line.subtotal = round(line.quantity * line.unit_price, 2)
+            needed[product.id] = needed.get(product.id, 0) + line.quantity
+        if order.error:
+            result.add_error(order, order.error)
+            continue
+
+        # 已取消订单不扣减库存
+        if order.status != CANCELLED_STATUS:
+            short = [pid for pid, qty in needed.items() if available[pid] < qty]
+            if short:
+                pid = short[0]
+                result.add_error(order, f'商品ID {pid} 库存不足: 需要 {needed[pid]}, 可用 {available[pid]}')
+                continue
+            for pid, qty in needed.items():
+                available[pid] -= qty
+                decrements[pid] = decrements.get(pid, 0) + qty
+
+        order.total_amount = round(sum(line.subtotal for line in order.items), 2)
+        accepted.append(order)
+
+    return accepted, decrements, {r.id: r.category_id for r in rows}
+
+
+def _write_chunk(accepted, decrements, category_map, created_by):
+    """扣减库存并批量写入订单；库存被并发占用时返回 None（调用方回滚后重试）"""
+    stock = {}
+    if decrements:
+        products = Product.__table__
+        stmt = (
+            products.update()
+            .where(products.c.id == bindparam('pid'))
+            .where(products.c.stock_quantity >= bindparam('qty'))
+            .values(stock_quantity=products.c.stock_quantity - bindparam('qty'))
+        )
+        result = db.session.execute(stmt, [{'pid': pid, 'qty': qty} for pid, qty in decrements.items()])
+        if result.rowcount != len(decrements):
+            return None
+        # 本事务已锁定这些行，读到的就是扣减后的库存，由此推算每个订单项的前后库存
+        stock = dict(db.session.execute(
+            select(Product.id, Product.stock_quantity).where(Product.id.in_(decrements))
+        ).all())
+        stock = {pid: stock[pid] + qty for pid, qty in decrements.items()}
+
+    numbers = order_number_allocator.allocate(db.session.connection(), len(accepted))
+    order_ids = db.session.scalars(
+        insert(Order).returning(Order.id, sort_by_parameter_order=True),
+        [{
+            'order_number': number,
+            'order_date': order.order_date,
+            'customer_id': order.customer_id,
+            'total_amount': order.total_amount,
+            'status': order.status,
+            'payment_method': order.payment_method,
+            'notes': order.notes,
+        } for order, number in zip(accepted, numbers)]
+    ).all()
+
+    item_rows, adjustment_rows = [], []
+    for order, order_id, number in zip(accepted, order_ids, numbers):
+        for line in order.items:
+            item_rows.append({
+                'order_id': order_id,
+                'product_id': line.product_id,
+                'quantity': line.quantity,
+                'unit_price': line.unit_price,
+                'subtotal': line.subtotal,
+            })
+            if order.status == CANCELLED_STATUS:
+                continue
+            before = stock[line.product_id]
+            stock[line.product_id] = before - line.quantity
+            adjustment_rows.append({
+                'adjustment_type': 'product',
+                'product_id': line.product_id,
+                'quantity_before': before,
+                'quantity_after': before - line.quantity,
+                'adjustment_quantity': -line.quantity,
+                'reason': f'销售出库: 订单 {number}（批量导入）',
+                'created_by': created_by,
+            })
+    db.session.execute(insert(OrderItem), item_rows)
+    if adjustment_rows:
+        db.session.execute(insert(StockAdjustment), adjustment_rows)
+
+    apply_sales_delta({}, merge_snapshots(
+        sales_snapshot(order, order.items, category_map) for order in accepted
+    ))
+    return order_ids
+
+
+def import_orders(orders, created_by, chunk_size=None):
+    """分块校验并写入已解析的订单，每块单独提交，返回 ImportResult
+
+    created_by 记录在库存调整中（StockAdjustment.created_by 不可为空）。
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config.get('ORDER_IMPORT_CHUNK_SIZE', IMPORT_CHUNK_SIZE)
+    result = ImportResult()
+
+    valid = []
+    for order in orders:
+        if order.error:
+            result.add_error(order, order.error)
+        else:
+            valid.append(order)
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        for attempt in range(CHUNK_RETRY_ATTEMPTS):
+            chunk_result = ImportResult()
+            accepted, decrements, category_map = _validate_chunk(chunk, chunk_result)
+            order_ids = _write_chunk(accepted, decrements, category_map, created_by) if accepted else []
+            if order_ids is not None:
+                db.session.commit()
+                result.order_ids.extend(order_ids)
+                result.errors.extend(chunk_result.errors)
+                break
+            db.session.rollback()
+            for order in chunk:
+                order.error = None
+        else:
+            for order in chunk:
+                result.add_error(order, '库存被并发占用，本块未导入，请重试')
+
+    result.errors.sort(key=lambda e: e['row'])
+    return result
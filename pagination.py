@@ -0,0 +1,129 @@
+"""列表分页工具：在传统页码分页之外提供游标（keyset / seek）分页模式
+
+页码分页每页都要执行 OFFSET n LIMIT m 和一次完整的 COUNT(*)，页数越深越慢。
+游标分页用上一页最后一行的排序键作为起点：
+
+    WHERE (order_date, id) < (:last_date, :last_id) ORDER BY order_date DESC, id DESC LIMIT m + 1
+
+配合 (order_date, id) 这类复合索引，每一页的代价都与页深无关；多取的一行用于判断
+是否还有下一页，默认不统计总数。
+
+请求参数:
+    paging=cursor   启用游标分页（默认模式由 PAGINATION_MODE 配置，缺省 offset）
+    cursor=<token>  上一页/下一页链接中携带的游标
+    count=1         额外统计精确总数（会执行 COUNT(*)）
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from flask import current_app, request
+from sqlalchemy import tuple_
+
+
+class KeysetPagination:
+    """游标分页结果，属性与 Flask-SQLAlchemy 的 Pagination 尽量保持一致，便于模板复用"""
+
+    keyset = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # 未请求精确总数时为 None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(direction, values):
+    """把翻页方向和排序键值编码为 URL 安全的字符串"""
+    payload = [direction, [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]]
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, keys):
+    """解码游标，按排序列的类型还原键值；游标无效时返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(raw.decode('utf-8'))
+        if direction not in ('next', 'prev') or len(values) != len(keys):
+            return None
+        decoded = []
+        for key, value in zip(keys, values):
+            python_type = key.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            decoded.append(value)
+        return direction, decoded
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError, NotImplementedError):
+        return None
+
+
+def keyset_paginate(query, keys, per_page, cursor=None, descending=False, with_total=False):
+    """按 keys（最后一列须唯一，通常为主键）做游标分页
+
+    query 上已有的 ORDER BY 会被替换为 keys 的排序。
+    """
+    decoded = decode_cursor(cursor, keys) if cursor else None
+    direction, values = decoded if decoded else ('next', None)
+    backwards = direction == 'prev'
+
+    query = query.order_by(None)
+    total = query.count() if with_total else None
+
+    # 向前翻页时反向扫描，取到结果后再倒序
+    scan_desc = descending != backwards
+    if values is not None:
+        row, bound = tuple_(*keys), tuple_(*values)
+        query = query.filter(row < bound if scan_desc else row > bound)
+    query = query.order_by(*[k.desc() if scan_desc else k.asc() for k in keys])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if backwards:
+        has_next, has_prev = values is not None, has_more
+    else:
+        has_next, has_prev = has_more, values is not None
+
+    def key_values(item):
+        return [getattr(item, k.key) for k in keys]
+
+    next_cursor = encode_cursor('next', key_values(rows[-1])) if has_next and rows else None
+    prev_cursor = encode_cursor('prev', key_values(rows[0])) if has_prev and rows else None
+    return KeysetPagination(rows, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+
+def paginate(query, keys, per_page, descending=False, allow_cursor=True, **kwargs):
+    """根据请求参数选择游标分页或页码分页
+
+    游标分页会把排序替换为 keys；查询自带的排序必须保留时（例如按检索相关度）
+    传 allow_cursor=False，始终使用页码分页。
+    页码分页时 kwargs 透传给 query.paginate()（例如 error_out=False）。
+    """
+    mode = request.args.get('paging') or current_app.config.get('PAGINATION_MODE', 'offset')
+    if mode == 'cursor' and allow_cursor:
+        return keyset_paginate(
+            query,
+            keys,
+            per_page,
+            cursor=request.args.get('cursor'),
+            descending=descending,
+            with_total=request.args.get('count', type=int) == 1
+        )
+    page = request.args.get('page', 1, type=int)
+    return query.paginate(page=page, per_page=per_page, **kwargs)
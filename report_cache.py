@@ -0,0 +1,151 @@
+"""报表结果缓存
+
+销售报表、原材料成本报表按 (报表名, 开始日期, 结束日期, 筛选条件, 数据版本) 缓存计算结果，
+条目数超过 REPORT_CACHE_SIZE 时按 LRU 淘汰。
+
+缓存在每个 worker 进程各自一份，写操作只能直接失效本进程的缓存。为了让其他 worker
+也能发现对过去日期的修改（补录、编辑、取消旧订单等），写操作在同一事务内把涉及的
+今天之前的日期的版本号加 1（ReportVersion，每天一行，另有一行全局版本）；读取缓存前
+先查询日期范围内的版本之和（一条走主键的查询）作为缓存键的一部分。
+
+今天的写入不更新版本：否则当天所有下单事务都要排队等同一行的行锁。包含今天的区间
+只缓存 REPORT_CACHE_OPEN_TTL 秒（默认 60），其他 worker 最多在 TTL 内看到旧数据。
+
+    - 已结束的区间（结束日期早于今天）缓存 REPORT_CACHE_CLOSED_TTL 秒（默认 3600）；
+    - 包含今天的区间只缓存 REPORT_CACHE_OPEN_TTL 秒。0 表示不缓存。
+
+写操作的来源：汇总表的增量维护（rollups.apply_sales_delta / apply_material_purchase）
+记录涉及的日期；重建汇总表，以及修改商品、分类、客户、原材料、供应商的名称（报表中显示）
+时更新全局版本。事务提交后同时失效本进程中受影响的条目，回滚则版本号一起回滚。
+
+先读版本再计算报表，计算期间提交的修改最多让结果存在旧版本的键下，不会被当作新版本命中；
+计算期间本进程发生失效时结果不写入缓存（见 LRUCache.get_or_set）。
+命中/未命中等计数见 report_cache.stats()，管理员的 SQL 统计页同时显示。
+"""
+from datetime import date, datetime
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from cache import LRUCache
+from models import db, Product, Category, Customer, RawMaterial, Supplier, ReportVersion
+
+REPORT_CACHE_SIZE = 256
+
+# 全局版本所在的行
+ALL_DAYS = date.min
+
+report_cache = LRUCache(maxsize=REPORT_CACHE_SIZE)
+
+# 报表中显示的名称列，修改后清空全部缓存
+_LABEL_COLUMNS = {
+    Product: ('name',),
+    Category: ('name',),
+    Customer: ('name',),
+    RawMaterial: ('name', 'unit'),
+    Supplier: ('name',),
+}
+
+
+def report_version(start, end):
+    """[start, end] 日期范围内报表数据的版本：各天版本与全局版本之和，任何修改都会使它变大"""
+    return db.session.scalar(
+        select(func.coalesce(func.sum(ReportVersion.version), 0)).where(
+            ReportVersion.day.between(start, end) | (ReportVersion.day == ALL_DAYS)
+        )
+    )
+
+
+def cached_report(report, start, end, factory, filters=None):
+    """返回报表结果，未命中时调用 factory() 计算；start / end 为日期（含两端）"""
+    key = (report, start, end, tuple(sorted((filters or {}).items())), report_version(start, end))
+    if end < datetime.now().date():
+        ttl = current_app.config.get('REPORT_CACHE_CLOSED_TTL', 3600)
+    else:
+        ttl = current_app.config.get('REPORT_CACHE_OPEN_TTL', 60)
+    return report_cache.get_or_set(key, factory, ttl=ttl)
+
+
+def _bump_versions(session, days):
+    """在当前事务内把 days 的版本号加 1（每个事务每天只加一次）"""
+    bumped = session.info.setdefault('report_bumped_days', set())
+    days = set(days) - bumped
+    if not days:
+        return
+    bumped.update(days)
+    # 可能在 before_flush 中调用，直接在会话的连接上执行；按日期顺序加锁，避免并发事务互相等待成环
+    connection = session.connection()
+    table = ReportVersion.__table__
+    rows = [{'day': day, 'version': 1} for day in sorted(days)]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insert_func
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insert_func
+        stmt = insert_func(table)
+        connection.execute(
+            stmt.on_conflict_do_update(index_elements=['day'], set_={'version': table.c.version + 1}), rows
+        )
+        return
+    for row in rows:
+        result = connection.execute(
+            update(table).where(table.c.day == row['day']).values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+
+def mark_report_days(session, days):
+    """记录本事务修改了哪些日期的报表数据，提交后失效本进程的缓存
+
+    今天之前的日期同时更新版本号（随事务提交）；今天的数据只靠 TTL 和本进程失效。
+    """
+    days = set(days)
+    session.info.setdefault('report_dirty_days', set()).update(days)
+    today = date.today()
+    _bump_versions(session, [day for day in days if day < today])
+
+
+def mark_reports_dirty(session):
+    """本事务影响全部报表（例如重建汇总表）：更新全局版本，提交后清空本进程的缓存"""
+    session.info['report_dirty_all'] = True
+    _bump_versions(session, [ALL_DAYS])
+
+
+def invalidate_days(days):
+    """失效所有日期范围包含 days 中任一天的条目，返回失效的条数"""
+    days = set(days)
+    return report_cache.invalidate_where(lambda key: any(key[1] <= day <= key[2] for day in days))
+
+
+@event.listens_for(Session, 'before_flush')
+def _mark_label_changes(session, flush_context, instances):
+    """名称被修改或记录被删除时，缓存中的报表显示的是旧名称"""
+    for obj in chain(session.dirty, session.deleted):
+        columns = _LABEL_COLUMNS.get(type(obj))
+        if columns is None:
+            continue
+        state = inspect(obj)
+        if obj in session.deleted or any(state.attrs[column].history.has_changes() for column in columns):
+            mark_reports_dirty(session)
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_reports(session):
+    session.info.pop('report_bumped_days', None)
+    days = session.info.pop('report_dirty_days', None)
+    if session.info.pop('report_dirty_all', False):
+        report_cache.invalidate()
+    elif days:
+        invalidate_days(days)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_report_dirty(session):
+    session.info.pop('report_bumped_days', None)
+    session.info.pop('report_dirty_days', None)
+    session.info.pop('report_dirty_all', None)
@@ -0,0 +1,396 @@
+"""销售日汇总表的增量维护与重建
+
+订单的每次写操作（创建、编辑、状态变更、删除）都在同一事务内调用：
+
+    before = sales_snapshot(order, items)   # 修改前
+    ... 修改订单 ...
+    after = sales_snapshot(order, items)    # 修改后
+    apply_sales_delta(before, after)
+
+只把差值写入 DailySalesRollup / DailyCustomerSales。汇总行通过数据库的
+INSERT ... ON CONFLICT DO UPDATE 原子累加，并发写同一天同一商品不会丢失更新。
+
+已归档的订单（见 archive.py）已计入汇总表，归档不改动汇总表；重建时同时读取在线表与归档表。
+
+原材料采购以同样方式累加到月汇总表 MonthlyMaterialCost（月份 × 原材料 × 供应商），
+原材料成本报表由 material_cost_report 读取。
+
+两类汇总的写入都会把涉及的日期记到当前会话，提交后失效报表缓存（见 report_cache.py）。
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Date, Integer, cast, delete, event, extract, func, insert, inspect, select, union_all, update
+from sqlalchemy.orm import Session
+
+from models import (
+    db, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Product, RawMaterial, RawMaterialPurchase, Supplier,
+    DailySalesRollup, DailyCustomerSales, MonthlyMaterialCost, month_key
+)
+from report_cache import mark_report_days, mark_reports_dirty
+
+# 已取消订单不计入销售汇总
+CANCELLED_STATUS = '已取消'
+
+_LINE_KEYS = ('day', 'product_id', 'category_id', 'customer_id')
+_ORDER_KEYS = ('day', 'customer_id')
+
+
+def sales_snapshot(order, items, category_map=None):
+    """计算订单当前状态对汇总表的贡献
+
+    返回 {键: (数量, 金额)}：
+        ('line', day, product_id, category_id, customer_id) -> (销售数量, 销售额)
+        ('order', day, customer_id) -> (订单数, 订单总额)
+    已取消订单返回空字典。返回值只包含普通数值，之后修改订单不会影响它。
+    category_map（{商品ID: 分类ID}）由调用方提供时不再查询数据库，供批量导入使用。
+    """
+    if order.status == CANCELLED_STATUS:
+        return {}
+
+    day = order.order_date.date()
+    if category_map is None:
+        product_ids = {item.product_id for item in items}
+        category_map = dict(
+            db.session.query(Product.id, Product.category_id).filter(Product.id.in_(product_ids))
+        ) if product_ids else {}
+
+    snapshot = {}
+    for item in items:
+        key = ('line', day, item.product_id, category_map.get(item.product_id), order.customer_id)
+        quantity, amount = snapshot.get(key, (0, 0.0))
+        snapshot[key] = (quantity + item.quantity, amount + item.subtotal)
+    snapshot[('order', day, order.customer_id)] = (1, order.total_amount or 0.0)
+    return snapshot
+
+
+def merge_snapshots(snapshots):
+    """把多个订单的快照累加为一个，批量写入时只需执行一次 apply_sales_delta"""
+    merged = {}
+    for snapshot in snapshots:
+        for key, (value, amount) in snapshot.items():
+            old_value, old_amount = merged.get(key, (0, 0.0))
+            merged[key] = (old_value + value, old_amount + amount)
+    return merged
+
+
+def apply_sales_delta(before, after):
+    """把两个快照的差值累加到汇总表（在当前事务内执行，不提交）"""
+    line_rows, order_rows, days = [], [], set()
+    for key in set(before) | set(after):
+        old_value, old_amount = before.get(key, (0, 0.0))
+        new_value, new_amount = after.get(key, (0, 0.0))
+        value_delta, amount_delta = new_value - old_value, new_amount - old_amount
+        if not value_delta and not amount_delta:
+            continue
+        days.add(key[1])
+        if key[0] == 'line':
+            row = dict(zip(_LINE_KEYS, key[1:]))
+            row.update(quantity=value_delta, amount=amount_delta)
+            line_rows.append(row)
+        else:
+            row = dict(zip(_ORDER_KEYS, key[1:]))
+            row.update(order_count=value_delta, amount=amount_delta)
+            order_rows.append(row)
+
+    if line_rows:
+        _upsert_add(DailySalesRollup.__table__, _LINE_KEYS, ('quantity', 'amount'), line_rows)
+    if order_rows:
+        _upsert_add(DailyCustomerSales.__table__, _ORDER_KEYS, ('order_count', 'amount'), order_rows)
+    if days:
+        mark_report_days(db.session, days)
+
+
+def _upsert_add(table, key_columns, value_columns, rows, connection=None):
+    """按唯一键累加数值列，不存在则插入；connection 为空时在当前会话中执行"""
+    executor = connection if connection is not None else db.session
+    dialect = (connection if connection is not None else db.session.get_bind()).dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        # 方言模块在用到时才导入（postgresql 方言较重，SQLite 部署不需要加载）
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insert_func
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insert_func
+        stmt = insert_func(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={c: table.c[c] + stmt.excluded[c] for c in value_columns}
+        )
+        executor.execute(stmt, rows)
+        return
+
+    # 其他数据库：先更新，未命中再插入
+    for row in rows:
+        result = executor.execute(
+            update(table)
+            .where(*[table.c[k] == row[k] for k in key_columns])
+            .values({c: table.c[c] + row[c] for c in value_columns})
+        )
+        if result.rowcount == 0:
+            executor.execute(insert(table).values(**row))
+
+
+def move_product_category(connection, product_id, category_id):
+    """商品改分类后，把它的销售汇总行归到新分类，返回涉及的汇总行数
+
+    汇总行的分类取自写入时商品的分类；之后编辑、删除订单按商品当前分类扣减，
+    不移动的话旧分类的金额永远不会扣掉，新分类则可能被扣成负数。
+    移动后与按当前分类重建（rebuild_sales_rollup）的结果一致。
+    """
+    table = DailySalesRollup.__table__
+    moved = (table.c.product_id == product_id) & (table.c.category_id != category_id)
+    rows = connection.execute(
+        select(table.c.day, table.c.customer_id, func.sum(table.c.quantity), func.sum(table.c.amount))
+        .where(moved).group_by(table.c.day, table.c.customer_id)
+    ).all()
+    if not rows:
+        return 0
+    _upsert_add(table, _LINE_KEYS, ('quantity', 'amount'), [
+        {'day': day, 'product_id': product_id, 'category_id': category_id, 'customer_id': customer_id,
+         'quantity': quantity, 'amount': amount}
+        for day, customer_id, quantity, amount in rows
+    ], connection)
+    connection.execute(delete(table).where(moved))
+    return len(rows)
+
+
+@event.listens_for(Session, 'before_flush')
+def _follow_product_category(session, flush_context, instances):
+    """商品的 category_id 被修改时，在同一事务内移动它的销售汇总行"""
+    for obj in session.dirty:
+        if not isinstance(obj, Product) or obj.id is None or obj.category_id is None:
+            continue
+        if inspect(obj).attrs.category_id.history.has_changes():
+            if move_product_category(session.connection(), obj.id, obj.category_id):
+                mark_reports_dirty(session)
+
+
+def day_expr(column):
+    """把 DateTime 列截断为日期（SQLite 的 CAST AS DATE 会得到年份数字，需用 date()）"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def _all_orders():
+    """在线订单与已归档订单（UNION ALL），供重建汇总表使用"""
+    return union_all(*[
+        select(model.id, model.order_date, model.customer_id, model.status, model.total_amount)
+        for model in (Order, ArchivedOrder)
+    ]).subquery('all_orders')
+
+
+def _all_order_items():
+    return union_all(*[
+        select(model.order_id, model.product_id, model.quantity, model.subtotal)
+        for model in (OrderItem, ArchivedOrderItem)
+    ]).subquery('all_order_items')
+
+
+def sales_rollup_missing():
+    """是否有订单（含已归档）而销售汇总表为空（升级后的旧数据库）"""
+    if db.session.scalar(select(DailyCustomerSales.id).limit(1)) is not None:
+        return False
+    return any(db.session.scalar(select(model.id).limit(1)) is not None for model in (Order, ArchivedOrder))
+
+
+def rebuild_sales_rollup():
+    """清空并根据全部历史订单（含已归档）重建销售汇总表，返回 (明细汇总行数, 客户汇总行数)"""
+    mark_reports_dirty(db.session)
+    db.session.execute(delete(DailySalesRollup))
+    db.session.execute(delete(DailyCustomerSales))
+
+    orders = _all_orders()
+    items = _all_order_items()
+    day = day_expr(orders.c.order_date)
+    line_select = select(
+        day,
+        items.c.product_id,
+        Product.category_id,
+        orders.c.customer_id,
+        func.sum(items.c.quantity),
+        func.sum(items.c.subtotal)
+    ).select_from(
+        items
+    ).join(
+        orders, orders.c.id == items.c.order_id
+    ).join(
+        Product, Product.id == items.c.product_id
+    ).where(
+        orders.c.status != CANCELLED_STATUS
+    ).group_by(
+        day, items.c.product_id, Product.category_id, orders.c.customer_id
+    )
+    db.session.execute(
+        insert(DailySalesRollup.__table__).from_select(
+            ['day', 'product_id', 'category_id', 'customer_id', 'quantity', 'amount'], line_select
+        )
+    )
+
+    order_select = select(
+        day,
+        orders.c.customer_id,
+        func.count(orders.c.id),
+        func.coalesce(func.sum(orders.c.total_amount), 0)
+    ).where(
+        orders.c.status != CANCELLED_STATUS
+    ).group_by(
+        day, orders.c.customer_id
+    )
+    db.session.execute(
+        insert(DailyCustomerSales.__table__).from_select(
+            ['day', 'customer_id', 'order_count', 'amount'], order_select
+        )
+    )
+
+    return (
+        db.session.query(func.count(DailySalesRollup.id)).scalar(),
+        db.session.query(func.count(DailyCustomerSales.id)).scalar()
+    )
+
+
+# ---- 原材料采购月汇总 ----
+
+_MATERIAL_KEYS = ('month', 'raw_material_id', 'supplier_id')
+
+MonthlyCost = namedtuple('MonthlyCost', 'year month total_cost')
+MaterialCost = namedtuple('MaterialCost', 'material unit total_quantity total_cost')
+SupplierCost = namedtuple('SupplierCost', 'supplier total_cost purchase_count')
+
+
+def month_expr(column):
+    """DateTime 列对应的月份键 YYYYMM（用于回填，以及不满一个月的部分按 purchase_date 聚合）"""
+    return cast(extract('year', column), Integer) * 100 + cast(extract('month', column), Integer)
+
+
+def apply_material_purchase(purchase):
+    """把一条新采购累加到月汇总表（在当前事务内执行，不提交）"""
+    _upsert_add(MonthlyMaterialCost.__table__, _MATERIAL_KEYS, ('purchase_count', 'quantity', 'amount'), [{
+        'month': month_key(purchase.purchase_date),
+        'raw_material_id': purchase.raw_material_id,
+        'supplier_id': purchase.supplier_id,
+        'purchase_count': 1,
+        'quantity': purchase.quantity,
+        'amount': purchase.total_price,
+    }])
+    day = purchase.purchase_date
+    mark_report_days(db.session, [day.date() if isinstance(day, datetime) else day])
+
+
+def rebuild_material_cost_rollup():
+    """回填缺失的采购月份，清空并根据全部采购记录重建月汇总表，返回汇总行数"""
+    mark_reports_dirty(db.session)
+    purchases = RawMaterialPurchase.__table__
+    db.session.execute(
+        update(purchases).where(purchases.c.purchase_month.is_(None))
+        .values(purchase_month=month_expr(purchases.c.purchase_date))
+    )
+    db.session.execute(delete(MonthlyMaterialCost))
+    db.session.execute(
+        insert(MonthlyMaterialCost.__table__).from_select(
+            ['month', 'raw_material_id', 'supplier_id', 'purchase_count', 'quantity', 'amount'],
+            select(
+                purchases.c.purchase_month, purchases.c.raw_material_id, purchases.c.supplier_id,
+                func.count(), func.sum(purchases.c.quantity), func.sum(purchases.c.total_price)
+            ).group_by(purchases.c.purchase_month, purchases.c.raw_material_id, purchases.c.supplier_id)
+        )
+    )
+    return db.session.query(func.count(MonthlyMaterialCost.id)).scalar()
+
+
+def material_cost_rollup_missing():
+    """是否有采购记录尚未回填月份，或有采购记录而月汇总表为空（升级后的旧数据库）"""
+    purchases = RawMaterialPurchase.__table__
+    if db.session.scalar(select(purchases.c.id).where(purchases.c.purchase_month.is_(None)).limit(1)) is not None:
+        return True
+    return (
+        db.session.scalar(select(MonthlyMaterialCost.id).limit(1)) is None
+        and db.session.scalar(select(purchases.c.id).limit(1)) is not None
+    )
+
+
+def _full_months(start, end):
+    """[start, end] 日期范围内完整覆盖的月份区间 (首月键, 末月键, 首月第一天, 末月次月第一天)，没有则返回 None"""
+    first = date(start.year, start.month, 1)
+    if start.day != 1:
+        first = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    after_end = end + timedelta(days=1)
+    stop = date(after_end.year, after_end.month, 1)  # 最后一个完整月的次月第一天
+    if first >= stop:
+        return None
+    last = stop - timedelta(days=1)
+    return month_key(first), month_key(last), first, stop
+
+
+def material_cost_report(start, end):
+    """原材料成本报表：返回 (月度支出, 原材料采购排名, 供应商采购统计)
+
+    start / end 为日期（含两端）。完整覆盖的月份直接读月汇总表，首尾不满一个月的部分
+    按 purchase_date 范围从采购记录聚合，两部分 UNION ALL 后一条查询取回
+    月份 × 原材料 × 供应商 的明细，三个视图在内存中一次遍历得出。
+    """
+    purchases = RawMaterialPurchase.__table__
+    rollup = MonthlyMaterialCost.__table__
+
+    def raw_part(range_start, range_end):
+        # 月份由 purchase_date 计算，不依赖 purchase_month 是否已回填
+        month = month_expr(purchases.c.purchase_date)
+        return select(
+            month.label('month'), purchases.c.raw_material_id, purchases.c.supplier_id,
+            func.count().label('purchase_count'), func.sum(purchases.c.quantity).label('quantity'),
+            func.sum(purchases.c.total_price).label('amount')
+        ).where(
+            purchases.c.purchase_date >= range_start, purchases.c.purchase_date < range_end
+        ).group_by(month, purchases.c.raw_material_id, purchases.c.supplier_id)
+
+    def midnight(day):
+        return datetime.combine(day, datetime.min.time())
+
+    range_start, range_end = midnight(start), midnight(end + timedelta(days=1))
+    full = _full_months(start, end)
+    if full is None:
+        parts = [raw_part(range_start, range_end)]
+    else:
+        first_month, last_month, first_day, stop_day = full
+        parts = [select(
+            rollup.c.month, rollup.c.raw_material_id, rollup.c.supplier_id,
+            rollup.c.purchase_count, rollup.c.quantity, rollup.c.amount
+        ).where(rollup.c.month.between(first_month, last_month))]
+        if range_start < midnight(first_day):
+            parts.append(raw_part(range_start, midnight(first_day)))
+        if midnight(stop_day) < range_end:
+            parts.append(raw_part(midnight(stop_day), range_end))
+
+    combined = union_all(*parts).subquery() if len(parts) > 1 else parts[0].subquery()
+    rows = db.session.execute(
+        select(
+            combined.c.month, RawMaterial.name, RawMaterial.unit, Supplier.name,
+            func.sum(combined.c.purchase_count), func.sum(combined.c.quantity), func.sum(combined.c.amount)
+        ).join(
+            RawMaterial, RawMaterial.id == combined.c.raw_material_id
+        ).join(
+            Supplier, Supplier.id == combined.c.supplier_id
+        ).group_by(
+            combined.c.month, combined.c.raw_material_id, RawMaterial.name, RawMaterial.unit,
+            combined.c.supplier_id, Supplier.name
+        )
+    ).all()
+
+    monthly, materials, suppliers = {}, {}, {}
+    for month, material, unit, supplier, count, quantity, amount in rows:
+        monthly[month] = monthly.get(month, 0.0) + amount
+        old_quantity, old_amount = materials.get((material, unit), (0.0, 0.0))
+        materials[(material, unit)] = (old_quantity + quantity, old_amount + amount)
+        old_amount, old_count = suppliers.get(supplier, (0.0, 0))
+        suppliers[supplier] = (old_amount + amount, old_count + count)
+
+    monthly_costs = [MonthlyCost(month // 100, month % 100, total) for month, total in sorted(monthly.items())]
+    top_materials = sorted(
+        (MaterialCost(material, unit, quantity, amount) for (material, unit), (quantity, amount) in materials.items()),
+        key=lambda m: m.total_cost, reverse=True
+    )
+    supplier_costs = sorted(
+        (SupplierCost(supplier, amount, count) for supplier, (amount, count) in suppliers.items()),
+        key=lambda s: s.total_cost, reverse=True
+    )
+    return monthly_costs, top_materials, supplier_costs
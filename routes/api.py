@@ -1,33 +1,133 @@
-from flask import Blueprint, jsonify, request, current_app
-from flask_login import login_required
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import Blueprint, jsonify, request, current_app, abort
+from flask_login import login_required, current_user
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+from werkzeug.http import is_resource_modified
 
 from models import db
-from models import Product, Customer, Supplier, Category, RawMaterial
+from models import Product, Customer, Supplier, Category, RawMaterial, TableDeleteCount
+from pagination import keyset_paginate
+from search import apply_product_search
+from stock_history import stock_as_of
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# 列表接口分页：传 limit 或 cursor 时按 id 游标分页，否则返回全部（兼容旧客户端）
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 500
+
+def _parse_fields(columns, default_fields):
+    """解析 fields=a,b,c 参数，未知字段返回 400"""
+    raw = request.args.get('fields')
+    if not raw:
+        return default_fields
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in columns]
+    if unknown or not fields:
+        abort(400, description=f"未知字段: {', '.join(unknown)}；可用字段: {', '.join(columns)}")
+    return fields
+
+def _collection_version(models):
+    """根据各表的最大 id、最大 updated_at 和累计删除行数计算 ETag 与 Last-Modified
+
+    最大 id 感知新增，updated_at（有索引）感知修改，TableDeleteCount 感知删除，
+    都是索引 / 主键查找，304 响应不扫描全表。ETag 同时包含请求参数，
+    不同的 fields / limit / cursor 组合各自缓存。
+    """
+    parts = [request.full_path]
+    last_modified = None
+    for model in models:
+        max_id, updated, deleted = db.session.query(
+            select(func.max(model.id)).scalar_subquery(),
+            select(func.max(model.updated_at)).scalar_subquery(),
+            select(TableDeleteCount.last_value).where(
+                TableDeleteCount.table_name == model.__tablename__
+            ).scalar_subquery()
+        ).one()
+        parts.append(f'{model.__tablename__}:{max_id}:{updated}:{deleted or 0}')
+        if updated is not None and (last_modified is None or updated > last_modified):
+            last_modified = updated
+    etag = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    return etag, last_modified
+
+def _collection_response(model, columns, default_fields, version_models=(), joins=()):
+    """列表接口的统一实现：字段投影、游标分页、ETag/Last-Modified 条件请求
+
+    columns 为 {字段名: SQL 列表达式}，只查询客户端请求的列，不加载 ORM 对象。
+    """
+    fields = _parse_fields(columns, default_fields)
+    etag, last_modified = _collection_version((model,) + tuple(version_models))
+
+    # 数据未变化时直接返回 304，不再查询和序列化列表
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        query = db.session.query(
+            model.id.label('id'),
+            *[columns[f].label(f) for f in fields if f != 'id']
+        )
+        for target, onclause in joins:
+            query = query.outerjoin(target, onclause)
+
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        if limit or cursor:
+            limit = min(max(limit or API_DEFAULT_LIMIT, 1), API_MAX_LIMIT)
+            page = keyset_paginate(query, [model.id], limit, cursor=cursor)
+            payload = {
+                'items': [{f: getattr(row, f) for f in fields} for row in page.items],
+                'next_cursor': page.next_cursor,
+                'prev_cursor': page.prev_cursor,
+            }
+        else:
+            payload = [{f: getattr(row, f) for f in fields} for row in query.order_by(model.id)]
+        response = jsonify(payload)
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+PRODUCT_COLUMNS = {
+    'id': Product.id,
+    'name': Product.name,
+    'sku': Product.sku,
+    'description': Product.description,
+    'selling_price': Product.selling_price,
+    'cost_price': Product.cost_price,
+    'stock_quantity': Product.stock_quantity,
+    'category_id': Product.category_id,
+    'category_name': Category.name,
+    'supplier_id': Product.supplier_id,
+}
+PRODUCT_DEFAULT_FIELDS = [
+    'id', 'name', 'sku', 'selling_price', 'cost_price', 'stock_quantity', 'category_id', 'category_name'
+]
+PARTNER_FIELDS = ['id', 'name', 'contact', 'phone', 'address']
+CATEGORY_FIELDS = ['id', 'name', 'description']
+RAW_MATERIAL_FIELDS = ['id', 'name', 'unit', 'stock_quantity', 'unit_cost', 'safety_stock']
+
+def _model_columns(model, fields):
+    return {f: getattr(model, f) for f in fields}
+
 @api_bp.route('/products')
 @login_required
 def get_products():
-    """获取所有商品的API接口"""
-    products = Product.query.all()
-    result = [{
-        'id': p.id,
-        'name': p.name,
-        'sku': p.sku,
-        'selling_price': p.selling_price,
-        'cost_price': p.cost_price,
-        'stock_quantity': p.stock_quantity,
-        'category_id': p.category_id,
-        'category_name': p.category.name
-    } for p in products]
-    return jsonify(result)
+    """获取商品列表的API接口（分类名称随分类修改变化，版本同时参考分类表）"""
+    return _collection_response(
+        Product, PRODUCT_COLUMNS, PRODUCT_DEFAULT_FIELDS,
+        version_models=(Category,),
+        joins=((Category, Category.id == Product.category_id),)
+    )
 
 @api_bp.route('/products/<int:id>')
 @login_required
 def get_product(id):
     """获取单个商品详情的API接口"""
-    product = Product.query.get_or_404(id)
+    product = Product.query.options(joinedload(Product.category), joinedload(Product.supplier)).get_or_404(id)
     result = {
         'id': product.id,
         'name': product.name,
@@ -46,57 +146,28 @@ def get_product(id):
 @api_bp.route('/customers')
 @login_required
 def get_customers():
-    """获取所有客户的API接口"""
-    customers = Customer.query.all()
-    result = [{
-        'id': c.id,
-        'name': c.name,
-        'contact': c.contact,
-        'phone': c.phone,
-        'address': c.address
-    } for c in customers]
-    return jsonify(result)
+    """获取客户列表的API接口"""
+    return _collection_response(Customer, _model_columns(Customer, PARTNER_FIELDS), PARTNER_FIELDS)
 
 @api_bp.route('/suppliers')
 @login_required
 def get_suppliers():
-    """获取所有供应商的API接口"""
-    suppliers = Supplier.query.all()
-    result = [{
-        'id': s.id,
-        'name': s.name,
-        'contact': s.contact,
-        'phone': s.phone,
-        'address': s.address
-    } for s in suppliers]
-    return jsonify(result)
+    """获取供应商列表的API接口"""
+    return _collection_response(Supplier, _model_columns(Supplier, PARTNER_FIELDS), PARTNER_FIELDS)
 
 @api_bp.route('/categories')
 @login_required
 def get_categories():
-    """获取所有商品分类的API接口"""
-    categories = Category.query.all()
-    result = [{
-        'id': c.id,
-        'name': c.name,
-        'description': c.description
-    } for c in categories]
-    return jsonify(result)
+    """获取商品分类列表的API接口"""
+    return _collection_response(Category, _model_columns(Category, CATEGORY_FIELDS), CATEGORY_FIELDS)
 
 @api_bp.route('/raw-materials')
 @login_required
 def get_raw_materials():
-    """获取所有原材料的API接口"""
-    raw_materials = RawMaterial.query.all()
-    result = [{
-        'id': m.id,
-        'name': m.name,
-        'unit': m.unit,
-        'stock_quantity': m.stock_quantity,
-        'unit_cost': m.unit_cost,
-        'safety_stock': m.safety_stock
-    } for m in raw_materials]
-    return jsonify(result)
+    """获取原材料列表的API接口"""
+    return _collection_response(
+        RawMaterial, _model_columns(RawMaterial, RAW_MATERIAL_FIELDS), RAW_MATERIAL_FIELDS
+    )
 
 @api_bp.route('/raw-materials/<int:id>')
 @login_required
@@ -113,6 +184,31 @@ def get_raw_material(id):
     }
     return jsonify(result)
 
+def _stock_as_of_response(item_type, id):
+    """历史库存：date=YYYY-MM-DD（默认今天）当天结束时的库存，由库存检查点 + 之后的调整计算"""
+    raw = request.args.get('date')
+    try:
+        day = datetime.strptime(raw, '%Y-%m-%d').date() if raw else datetime.now().date()
+    except ValueError:
+        abort(400, description='日期格式无效，应为 YYYY-MM-DD')
+    at = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    quantities = stock_as_of(item_type, [id], at)
+    if id not in quantities:
+        abort(404)
+    return jsonify({'id': id, 'date': day.isoformat(), 'stock_quantity': quantities[id]})
+
+@api_bp.route('/products/<int:id>/stock')
+@login_required
+def get_product_stock(id):
+    """获取商品在指定日期结束时的库存"""
+    return _stock_as_of_response('product', id)
+
+@api_bp.route('/raw-materials/<int:id>/stock')
+@login_required
+def get_raw_material_stock(id):
+    """获取原材料在指定日期结束时的库存"""
+    return _stock_as_of_response('raw_material', id)
+
 @api_bp.route('/search/products')
 @login_required
 def search_products():
@@ -120,15 +216,12 @@ def search_products():
     query = request.args.get('q', '')
     category_id = request.args.get('category_id', type=int)
     
-    # 构建查询
-    products_query = Product.query
+    # 构建查询（结果包含分类名称，预加载分类）
+    products_query = Product.query.options(joinedload(Product.category))
     
-    # 应用筛选条件
+    # 应用筛选条件：关键词走全文检索索引（含拼音首字母），按相关度排序
     if query:
-        products_query = products_query.filter(
-            Product.name.like(f'%{query}%') | 
-            Product.sku.like(f'%{query}%')
-        )
+        products_query = apply_product_search(products_query, query)
     
     if category_id:
         products_query = products_query.filter(Product.category_id == category_id)
@@ -148,3 +241,30 @@ def search_products():
     } for p in products]
     
     return jsonify(result)
+
+@api_bp.route('/orders/import', methods=['POST'])
+@login_required
+def import_orders_api():
+    """批量导入订单的API接口
+
+    上传 multipart 文件字段 file（按扩展名或 format 参数判断 CSV / JSON），
+    或直接以 application/json、text/csv 作为请求体。返回成功数量与逐行错误。
+    """
+    # 导入模块只在这个接口用到，不在 worker 启动时加载
+    from order_import import OrderImportError, import_orders, parse_orders
+
+    upload = request.files.get('file')
+    if upload is not None:
+        content = upload.read()
+        default_format = 'json' if (upload.filename or '').lower().endswith('.json') else 'csv'
+    else:
+        content = request.get_data()
+        default_format = 'json' if request.is_json else 'csv'
+    fmt = request.args.get('format') or request.form.get('format') or default_format
+
+    try:
+        orders = parse_orders(content, fmt)
+    except (OrderImportError, UnicodeDecodeError) as e:
+        abort(400, description=str(e))
+    result = import_orders(orders, created_by=current_user.id)
+    return jsonify(result.to_dict())
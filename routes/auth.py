@@ -2,12 +2,41 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from sqlalchemy.orm import make_transient_to_detached
+
 from models import db
 from models import User
 from forms import LoginForm, UserForm
+from cache import TTLCache
+from report_cache import report_cache
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# 登录用户的进程内缓存：user_loader 每个请求都会执行，缓存后不再查询 users 表。
+# 本进程内编辑、删除用户时立即失效；其他 worker 最多在 TTL（USER_CACHE_TTL，秒，默认 60）后生效
+user_cache = TTLCache(ttl=60)
+
+# 缓存的字段（不缓存密码哈希）
+_CACHED_USER_FIELDS = ('id', 'username', 'role', 'created_at')
+
+def load_cached_user(user_id):
+    """Flask-Login 的 user_loader：优先从缓存构造用户对象，未命中再查询数据库"""
+    data = user_cache.get(user_id)
+    if data is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.set(
+                user_id,
+                {field: getattr(user, field) for field in _CACHED_USER_FIELDS},
+                ttl=current_app.config.get('USER_CACHE_TTL', 60)
+            )
+        return user
+    
+    # 以游离（detached）状态返回，未缓存的字段访问时报错而不是悄悄发出查询
+    user = User(**data)
+    make_transient_to_detached(user)
+    return user
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     """用户登录"""
@@ -112,6 +141,7 @@ def edit_user(id):
             user.password_hash = generate_password_hash(form.password.data)
         
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('用户更新成功', 'success')
         return redirect(url_for('auth.user_list'))
     
@@ -136,6 +166,32 @@ def delete_user(id):
     else:
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(id)
         flash('用户删除成功', 'success')
     
     return redirect(url_for('auth.user_list'))
+
+@auth_bp.route('/sql-stats', methods=['GET', 'POST'])
+@login_required
+def sql_stats():
+    """SQL 性能统计：按接口列出语句数、数据库耗时最高的请求"""
+    # 检查是否为管理员
+    if current_user.role != 'admin':
+        flash('您没有权限访问此页面', 'danger')
+        return redirect(url_for('dashboard.index'))
+    
+    stats = current_app.extensions['sql_instrumentation']['stats']
+    if request.method == 'POST':
+        stats.reset()
+        report_cache.reset_stats()
+        flash('统计数据已清空', 'success')
+        return redirect(url_for('auth.sql_stats'))
+    
+    sort = request.args.get('sort', 'db_ms')
+    return render_template(
+        'user/sql_stats.html',
+        endpoints=stats.worst(sort=sort),
+        sort=sort,
+        threshold=current_app.config.get('SLOW_QUERY_THRESHOLD_MS'),
+        report_cache=report_cache.stats()
+    )
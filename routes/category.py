@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 
 from models import db
-from models import Category
+from models import Category, Product
 from forms import CategoryForm
 
 category_bp = Blueprint('category', __name__, url_prefix='/category')
@@ -14,15 +16,24 @@ def list():
     page = request.args.get('page', 1, type=int)
     per_page = 10
     
+    # 每个分类的商品数量用一次分组子查询统计，避免为计数加载全部商品
+    product_counts = db.session.query(
+        Product.category_id,
+        func.count(Product.id).label('product_count')
+    ).group_by(Product.category_id).subquery()
+    query = db.session.query(
+        Category,
+        func.coalesce(product_counts.c.product_count, 0)
+    ).outerjoin(product_counts, product_counts.c.category_id == Category.id)
+    
     # 搜索功能
     search = request.args.get('search', '')
     if search:
-        categories = Category.query.filter(
+        query = query.filter(
             Category.name.like(f'%{search}%') | 
             Category.description.like(f'%{search}%')
-        ).paginate(page=page, per_page=per_page)
-    else:
-        categories = Category.query.paginate(page=page, per_page=per_page)
+        )
+    categories = query.paginate(page=page, per_page=per_page)
     
     return render_template('category/list.html', categories=categories, search=search)
 
@@ -30,7 +41,7 @@ def list():
 @login_required
 def detail(id):
     """商品分类详情"""
-    category = Category.query.get_or_404(id)
+    category = Category.query.options(selectinload(Category.products)).get_or_404(id)
     return render_template('category/detail.html', category=category)
 
 @category_bp.route('/add', methods=['GET', 'POST'])
@@ -76,7 +87,7 @@ def delete(id):
     category = Category.query.get_or_404(id)
     
     # 检查分类是否有关联商品
-    if category.products:
+    if db.session.query(Product.query.filter_by(category_id=category.id).exists()).scalar():
         flash('无法删除：该分类已有关联商品', 'danger')
         return redirect(url_for('category.list'))
     
@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required
+from sqlalchemy.orm import selectinload
 
 from models import db
-from models import Customer
+from models import Customer, Order, ArchivedOrder
 from forms import CustomerForm
 
 customer_bp = Blueprint('customer', __name__, url_prefix='/customer')
@@ -31,8 +32,12 @@ def list():
 @login_required
 def detail(id):
     """客户详情"""
-    customer = Customer.query.get_or_404(id)
-    return render_template('customer/detail.html', customer=customer)
+    customer = Customer.query.options(selectinload(Customer.orders)).get_or_404(id)
+    # 已归档的订单（只读，不能查看或编辑）
+    archived_orders = ArchivedOrder.query.filter_by(customer_id=id).order_by(
+        ArchivedOrder.order_date.desc(), ArchivedOrder.id.desc()
+    ).all()
+    return render_template('customer/detail.html', customer=customer, archived_orders=archived_orders)
 
 @customer_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -80,8 +85,9 @@ def delete(id):
     """删除客户"""
     customer = Customer.query.get_or_404(id)
     
-    # 检查客户是否有关联订单
-    if customer.orders:
+    # 检查客户是否有关联订单（含已归档的订单）
+    if db.session.query(Order.query.filter_by(customer_id=customer.id).exists()).scalar() or \
+            db.session.query(ArchivedOrder.query.filter_by(customer_id=customer.id).exists()).scalar():
         flash('无法删除：该客户已有关联订单', 'danger')
         return redirect(url_for('customer.list'))
     
@@ -1,59 +1,142 @@
+from itertools import chain
+
 from flask import Blueprint, render_template, current_app
 from flask_login import login_required, current_user
-from sqlalchemy import func
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
 
 from models import db
-from models import User, Customer, Product, RawMaterial, Order, Category, OrderItem, StockAdjustment
+from models import User, Customer, Product, RawMaterial, Order, ArchivedOrder, Category, OrderItem, StockAdjustment
+from cache import TTLCache
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix=None)
 
-@dashboard_bp.route('/')
-@login_required
-def index():
-    """仪表盘首页"""
-    # 统计数据
-    stats = {
-        'user_count': User.query.count(),
-        'customer_count': Customer.query.count(),
-        'product_count': Product.query.count(),
-        'raw_material_count': RawMaterial.query.count(),
-        'order_count': Order.query.count(),
-    }
+# 仪表盘数据的进程内缓存，TTL 由 DASHBOARD_CACHE_TTL 配置（秒，默认 30，0 表示不缓存）
+dashboard_cache = TTLCache(ttl=30)
+
+# 这些模型的写入会影响仪表盘数据，提交后失效缓存
+_DASHBOARD_MODELS = (User, Customer, Product, RawMaterial, Order, Category)
+
+
+@event.listens_for(Session, 'before_flush')
+def _mark_dashboard_dirty(session, flush_context, instances):
+    """ORM 对象的增删改"""
+    if any(isinstance(obj, _DASHBOARD_MODELS) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['dashboard_dirty'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_dashboard_dirty_bulk(orm_execute_state):
+    """update(Product) 等批量语句（例如原子扣减库存）不经过 flush，单独识别"""
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _DASHBOARD_MODELS):
+        orm_execute_state.session.info['dashboard_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_dashboard(session):
+    if session.info.pop('dashboard_dirty', False):
+        dashboard_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_dirty(session):
+    session.info.pop('dashboard_dirty', None)
+
+
+def _count(model):
+    return select(func.count()).select_from(model).scalar_subquery()
+
+
+def _load_dashboard_data():
+    """查询仪表盘所需的全部数据，返回可跨请求缓存的普通字典/列表（不含 ORM 对象）"""
+    # 统计数据：一条语句取回全部计数
+    stats = db.session.execute(select(
+        _count(User).label('user_count'),
+        _count(Customer).label('customer_count'),
+        _count(Product).label('product_count'),
+        _count(RawMaterial).label('raw_material_count'),
+        (_count(Order) + _count(ArchivedOrder)).label('order_count'),
+    )).one()._asdict()
     
-    # 获取最近订单
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    # 获取最近订单（连带客户名称，避免模板逐行懒加载）
+    recent_orders = [
+        {
+            'id': row.id,
+            'order_number': row.order_number,
+            'customer': {'name': row.customer_name},
+            'order_date': row.order_date,
+            'total_amount': row.total_amount,
+            'status': row.status,
+        }
+        for row in db.session.execute(
+            select(
+                Order.id, Order.order_number, Order.order_date, Order.total_amount, Order.status,
+                Customer.name.label('customer_name')
+            ).join(Customer, Customer.id == Order.customer_id).order_by(Order.created_at.desc()).limit(5)
+        )
+    ]
     
     # 获取低库存商品
-    low_stock_products = Product.query.filter(
-        Product.stock_quantity <= 10
-    ).order_by(Product.stock_quantity).limit(5).all()
+    low_stock_products = [
+        row._asdict() for row in db.session.execute(
+            select(Product.id, Product.name, Product.sku, Product.stock_quantity).filter(
+                Product.stock_quantity <= 10
+            ).order_by(Product.stock_quantity).limit(5)
+        )
+    ]
     
     # 获取低库存原材料
-    low_stock_materials = RawMaterial.query.filter(
-        RawMaterial.safety_stock != None,
-        RawMaterial.stock_quantity <= RawMaterial.safety_stock
-    ).order_by(
-        (RawMaterial.stock_quantity / RawMaterial.safety_stock)
-    ).limit(5).all()
+    low_stock_materials = [
+        row._asdict() for row in db.session.execute(
+            select(
+                RawMaterial.id, RawMaterial.name, RawMaterial.stock_quantity, RawMaterial.safety_stock, RawMaterial.unit
+            ).filter(
+                RawMaterial.safety_stock != None,
+                RawMaterial.stock_quantity <= RawMaterial.safety_stock
+            ).order_by(
+                (RawMaterial.stock_quantity / RawMaterial.safety_stock)
+            ).limit(5)
+        )
+    ]
+    
+    # 获取按分类的商品数量：一次分组查询（LEFT JOIN 保留没有商品的分类）
+    category_products = [
+        {'name': row.name, 'count': row.count}
+        for row in db.session.execute(
+            select(Category.name, func.count(Product.id).label('count'))
+            .outerjoin(Product, Product.category_id == Category.id)
+            .group_by(Category.id, Category.name)
+            .order_by(Category.id)
+        )
+    ]
     
-    # 获取按分类的商品数量 - 使用 ORM 方式替代原 db.session.query
-    category_products = []
-    categories = Category.query.all()
-    for category in categories:
-        category_products.append({
-            'name': category.name,
-            'count': Product.query.filter_by(category_id=category.id).count()
-        })
+    return {
+        'stats': stats,
+        'recent_orders': recent_orders,
+        'low_stock_products': low_stock_products,
+        'low_stock_materials': low_stock_materials,
+        'category_products': category_products,
+    }
+
+
+@dashboard_bp.route('/')
+@login_required
+def index():
+    """仪表盘首页"""
+    data = dashboard_cache.get_or_set(
+        'index',
+        _load_dashboard_data,
+        ttl=current_app.config.get('DASHBOARD_CACHE_TTL', 30)
+    )
     
     # 初始化 top_products
     top_products = []
     
     return render_template(
         'dashboard.html',
-        stats=stats,
-        recent_orders=recent_orders,
-        low_stock_products=low_stock_products,
-        low_stock_materials=low_stock_materials,
-        category_products=category_products,
-        top_products=top_products
+        top_products=top_products,
+        **data
     )
@@ -1,21 +1,41 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, selectinload
 
 from models import db
 # 假设你的所有模型都在 models.py 中定义并导入
 from models import Order, OrderItem, Customer, Product, Category, StockAdjustment, User # 导入User模型以便记录stock adjustments created_by
 # 假设你的订单相关的表单在 forms.py 中定义并导入
 from forms import OrderForm#, StockAdjustmentForm # StockAdjustmentForm 没有在routes里用到，先注释
+# 库存增减统一走带条件的原子 UPDATE，避免并发下单超卖
+from inventory import adjust_product_stock, InsufficientStock, retry_on_conflict
+from pagination import paginate
+# 销售日汇总在订单写操作的同一事务内增量维护
+from rollups import sales_snapshot, apply_sales_delta
+from exports import csv_response, iter_rows
 
 # 创建订单蓝图
 order_bp = Blueprint('order', __name__, url_prefix='/order')
 
+
+def _load_products(product_ids):
+    """按ID批量加载商品，返回 {id: Product}
+
+    一次 IN 查询取回所有订单项涉及的商品，逐项校验时只查内存映射，
+    避免每个订单项单独查询一次数据库。无法解析的ID直接忽略，由逐项校验报错。
+    """
+    ids = {int(pid) for pid in product_ids if str(pid).isdigit()}
+    if not ids:
+        return {}
+    return {p.id: p for p in Product.query.filter(Product.id.in_(ids)).all()}
+
+
 @order_bp.route('/list')
 @login_required
 def list():
     """订单列表"""
-    page = request.args.get('page', 1, type=int)
     per_page = 10
 
     # 高级筛选条件
@@ -122,12 +142,15 @@ def list():
         # 保持原AI生成的join逻辑
         query = query.join(OrderItem).join(Product).filter(Product.category_id == category_id).group_by(Order.id)
 
+    # 导出当前筛选结果（订单 + 订单项），流式输出
+    if request.args.get('export') == 'csv':
+        return export_orders_to_csv(query)
 
-    # 按日期降序排序
-    query = query.order_by(Order.order_date.desc())
+    # 按日期降序排序；客户名称在列表中逐行显示，批量预加载
+    query = query.order_by(Order.order_date.desc()).options(selectinload(Order.customer))
 
-    # 执行分页查询
-    orders = query.paginate(page=page, per_page=per_page, error_out=False) # error_out=False避免页码超出范围时404
+    # 执行分页查询：默认页码分页，paging=cursor 时按 (order_date, id) 游标分页
+    orders = paginate(query, [Order.order_date, Order.id], per_page, descending=True, error_out=False) # error_out=False避免页码超出范围时404
 
     # 获取筛选选项数据
     customers = Customer.query.order_by('name').all() # 排序一下更友好
@@ -175,6 +198,64 @@ def list():
         }
     )
 
+def export_orders_to_csv(order_query):
+    """导出筛选后的订单明细为CSV，每个订单项一行
+
+    订单范围以子查询传入，明细通过 yield_per 分批读取并逐块输出，导出行数再多内存占用也保持恒定。
+    """
+    order_ids = order_query.with_entities(Order.id)
+    items = db.session.query(
+        Order.order_number,
+        Order.order_date,
+        Customer.name.label('customer'),
+        Order.status,
+        Order.payment_method,
+        Order.total_amount,
+        Product.sku,
+        Product.name.label('product'),
+        OrderItem.quantity,
+        OrderItem.unit_price,
+        OrderItem.subtotal
+    ).select_from(
+        Order
+    ).join(
+        Customer, Customer.id == Order.customer_id
+    ).outerjoin(
+        OrderItem, OrderItem.order_id == Order.id
+    ).outerjoin(
+        Product, Product.id == OrderItem.product_id
+    ).filter(
+        Order.id.in_(order_ids)
+    ).order_by(
+        Order.order_date.desc(), Order.id.desc(), OrderItem.id
+    )
+
+    def rows():
+        yield ['订单号', '日期', '客户', '状态', '支付方式', '订单总额', 'SKU', '商品', '数量', '单价', '小计']
+        for item in iter_rows(items):
+            yield [
+                item.order_number,
+                item.order_date.strftime('%Y-%m-%d'),
+                item.customer,
+                item.status,
+                item.payment_method,
+                item.total_amount,
+                item.sku,
+                item.product,
+                item.quantity,
+                item.unit_price,
+                item.subtotal
+            ]
+
+    return csv_response(rows(), f"orders_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv")
+
+def _order_with_items():
+    """订单详情/出库单共用：预加载客户、订单项及订单项商品"""
+    return Order.query.options(
+        joinedload(Order.customer),
+        selectinload(Order.items).joinedload(OrderItem.product)
+    )
+
 # --- 后面是 add, detail, edit, delete, outbound_slip, update_status 函数 ---
 # 这些函数保持不变，因为它们不涉及订单列表的日期筛选逻辑
 
@@ -182,11 +263,12 @@ def list():
 @login_required
 def detail(id):
     """订单详情"""
-    order = Order.query.get_or_404(id)
+    order = _order_with_items().get_or_404(id)
     return render_template('order/detail.html', order=order)
 
 @order_bp.route('/add', methods=['GET', 'POST'])
 @login_required
+@retry_on_conflict
 def add():
     """添加订单"""
     form = OrderForm()
@@ -252,12 +334,7 @@ def add():
             notes=notes
         )
         db.session.add(order)
-        db.session.flush()  # 获取订单ID (如果在generate_order_number中用到了id)
-
-        # 确保order_number在commit前生成，如果default=generate_order_number依赖于order.id
-        # 更好做法是 generate_order_number 在commit前生成不依赖id的唯一号
-        # 或者在commit后生成并更新order.order_number
-        # 如果 default=generate_order_number 已经可以工作，就保持原样
+        db.session.flush()  # 获取订单ID，订单号在插入时由每日序列分配
 
         # 处理订单项
         total_amount = 0
@@ -278,6 +355,9 @@ def add():
             # 注意：这里无法自动填充动态添加的订单项到表单对象，前端可能需要JS来处理回显
             return render_template('order/form.html', form=form, products=products, title='添加订单')
 
+        # 批量加载订单项涉及的商品
+        product_map = _load_products(product_ids)
+        created_items = []
 
         for i in range(len(product_ids)):
             # 防止索引越界，虽然getlist通常会返回等长列表
@@ -334,7 +414,7 @@ def add():
                 return render_template('order/form.html', form=form, products=products, title='添加订单')
 
             # 获取商品
-            product = Product.query.get(product_id)
+            product = product_map.get(product_id)
             if not product:
                 flash(f'商品ID {product_id} 不存在 (项 {i+1})', 'danger')
                 db.session.rollback()
@@ -347,17 +427,26 @@ def add():
                 return render_template('order/form.html', form=form, products=products, title='添加订单')
 
 
-            # 检查库存 (只在状态不是"已取消"时检查和扣减库存)
-            if order.status != '已取消' and quantity > product.stock_quantity:
-                flash(f'商品 "{product.name}" 库存不足: 需要 {quantity}, 实际 {product.stock_quantity} (项 {i+1})', 'danger')
-                db.session.rollback() # 回滚所有已添加的订单项和订单对象
-                form.order_date.data = order.order_date
-                form.customer_id.data = order.customer_id
-                form.status.data = order.status
-                form.payment_method.data = order.payment_method
-                form.notes.data = order.notes
-                form.customer_id.choices = [(c.id, c.name) for c in Customer.query.order_by('name').all()]
-                return render_template('order/form.html', form=form, products=products, title='添加订单')
+            # 减少商品库存并记录库存变动 (只在状态不是"已取消"时扣减库存)
+            # 检查和扣减在同一条 UPDATE 中完成，库存不足时抛出 InsufficientStock
+            if order.status != '已取消':
+                try:
+                    adjust_product_stock(
+                        product.id,
+                        -quantity,
+                        reason=f'销售出库: 订单 {order.order_number if order.order_number else order.id}', # 使用order_number如果生成了，否则使用id
+                        created_by=current_user.id if current_user.is_authenticated else None # 记录操作用户ID
+                    )
+                except InsufficientStock as e:
+                    flash(f'商品 "{product.name}" 库存不足: 需要 {quantity}, 实际 {e.available} (项 {i+1})', 'danger')
+                    db.session.rollback() # 回滚所有已添加的订单项、库存变动和订单对象
+                    form.order_date.data = order.order_date
+                    form.customer_id.data = order.customer_id
+                    form.status.data = order.status
+                    form.payment_method.data = order.payment_method
+                    form.notes.data = order.notes
+                    form.customer_id.choices = [(c.id, c.name) for c in Customer.query.order_by('name').all()]
+                    return render_template('order/form.html', form=form, products=products, title='添加订单')
 
             # 创建订单项
             subtotal = round(quantity * unit_price, 2) # 计算并保留两位小数
@@ -369,23 +458,7 @@ def add():
                 subtotal=subtotal
             )
             db.session.add(order_item)
-
-            # 减少商品库存 (只在状态不是"已取消"时扣减库存)
-            if order.status != '已取消':
-                old_stock = product.stock_quantity
-                product.stock_quantity -= quantity
-
-                # 记录库存变动
-                adjustment = StockAdjustment(
-                    adjustment_type='product',
-                    product_id=product.id,
-                    quantity_before=old_stock,
-                    quantity_after=product.stock_quantity,
-                    adjustment_quantity=-quantity,
-                    reason=f'销售出库: 订单 {order.order_number if order.order_number else order.id}', # 使用order_number如果生成了，否则使用id
-                    created_by=current_user.id if current_user.is_authenticated else None # 记录操作用户ID
-                )
-                db.session.add(adjustment)
+            created_items.append(order_item)
 
             # 累计订单总金额
             total_amount = round(total_amount + subtotal, 2) # 累计并保留两位小数
@@ -393,6 +466,9 @@ def add():
         # 设置订单总金额
         order.total_amount = total_amount
 
+        # 更新销售日汇总
+        apply_sales_delta({}, sales_snapshot(order, created_items))
+
         db.session.commit()
         flash('订单创建成功', 'success')
         return redirect(url_for('order.detail', id=order.id))
@@ -405,6 +481,7 @@ def add():
 
 @order_bp.route('/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
+@retry_on_conflict
 def edit(id):
     """编辑订单"""
     order = Order.query.get_or_404(id)
@@ -455,6 +532,7 @@ def edit(id):
         # 存储旧的订单项数量，用于库存回滚
         old_order_item_quantities = {item.product_id: item.quantity for item in order_items}
         old_order_status = order.status # 记录旧状态用于库存调整判断
+        sales_before = sales_snapshot(order, order_items) # 修改前对销售汇总的贡献
 
         # 更新订单基本信息
         order.order_date = order_date # Use validated date
@@ -481,6 +559,17 @@ def edit(id):
 
         processed_item_count = 0 # 用于 tracking submitted items index
 
+        # 批量加载：提交的商品 + 原有订单项的商品（删除项回滚库存时要用）
+        product_map = _load_products(product_ids + [item.product_id for item in order_items])
+        # 当前订单的原有订单项，按ID索引
+        existing_items_map = {item.id: item for item in order_items}
+        # 不属于当前订单的已提交ID，一次查询确认其是否属于其他订单
+        foreign_item_ids = {int(iid) for iid in item_ids if iid and iid.isdigit()} - set(existing_items_map)
+        if foreign_item_ids:
+            foreign_item_ids = {
+                row.id for row in db.session.query(OrderItem.id).filter(OrderItem.id.in_(foreign_item_ids))
+            }
+
         for i in range(len(product_ids)):
              # 防止索引越界
             if i >= len(quantities) or i >= len(unit_prices) or i >= len(item_ids):
@@ -518,7 +607,7 @@ def edit(id):
                 return render_template('order/form.html', form=form, products=products, order=order, order_items=order_items, title='编辑订单')
 
             # 获取商品
-            product = Product.query.get(product_id)
+            product = product_map.get(product_id)
             if not product:
                 flash(f'商品ID {product_id} 不存在 (项 {i+1}, 编辑)', 'danger')
                 db.session.rollback()
@@ -531,8 +620,8 @@ def edit(id):
             # 处理现有订单项 或 创建新订单项
             existing_item = None
             if item_id is not None:
-                 existing_item = OrderItem.query.get(item_id)
-                 if existing_item and existing_item.order_id != order.id:
+                 existing_item = existing_items_map.get(item_id)
+                 if item_id in foreign_item_ids:
                      flash(f'订单项ID {item_id} 不属于当前订单 (编辑)', 'danger')
                      db.session.rollback()
                      return render_template('order/form.html', form=form, products=products, order=order, order_items=order_items, title='编辑订单')
@@ -556,32 +645,22 @@ def edit(id):
                     stock_change_needed = -quantity # 需要扣减新数量
                 # 如果新状态是“已取消”，无论旧状态如何，这里都不做库存调整，留给最后的状态变更逻辑处理
 
-                # 检查库存 (只在新状态不是"已取消"且需要额外扣减时检查)
-                if order.status != '已取消' and stock_change_needed < 0: # 小于0表示需要额外扣减库存
-                    additional_qty_needed = -stock_change_needed
-                    if additional_qty_needed > product.stock_quantity:
-                        flash(f'商品 "{product.name}" 库存不足: 需要额外 {additional_qty_needed}, 实际 {product.stock_quantity} (项 {existing_item.id}, 编辑)', 'danger')
+                # 应用库存调整 (只在新状态不是"已取消"且库存需要变动时调整)
+                # 需要额外扣减时 (小于0) 由条件 UPDATE 检查库存是否足够
+                if order.status != '已取消' and stock_change_needed != 0:
+                    try:
+                        adjust_product_stock(
+                            product.id,
+                            stock_change_needed, # 正数增加，负数减少
+                            reason=f'订单修改项库存调整: 订单号 {order.order_number if order.order_number else order.id}',
+                            created_by=current_user.id if current_user.is_authenticated else None
+                        )
+                    except InsufficientStock as e:
+                        flash(f'商品 "{product.name}" 库存不足: 需要额外 {e.requested}, 实际 {e.available} (项 {existing_item.id}, 编辑)', 'danger')
                         db.session.rollback()
                         # ... (re-populate form/render template) ...
                         return render_template('order/form.html', form=form, products=products, order=order, order_items=order_items, title='编辑订单')
 
-                # 应用库存调整 (只在新状态不是"已取消"且库存需要变动时调整)
-                if order.status != '已取消' and stock_change_needed != 0:
-                     old_stock = product.stock_quantity
-                     product.stock_quantity += stock_change_needed # 正数增加，负数减少
-
-                     # 记录库存变动
-                     adjustment = StockAdjustment(
-                         adjustment_type='product',
-                         product_id=product.id,
-                         quantity_before=old_stock,
-                         quantity_after=product.stock_quantity,
-                         adjustment_quantity=stock_change_needed,
-                         reason=f'订单修改项库存调整: 订单号 {order.order_number if order.order_number else order.id}',
-                         created_by=current_user.id if current_user.is_authenticated else None
-                     )
-                     db.session.add(adjustment)
-
 
                 # 更新订单项
                 existing_item.product_id = product_id # 即使是现有项，也可能更换商品
@@ -593,12 +672,20 @@ def edit(id):
                 submitted_item_ids.add(existing_item.id)
             else:
                 # 创建新订单项
-                # 检查库存 (只在新状态不是"已取消"时检查和扣减)
-                if order.status != '已取消' and quantity > product.stock_quantity:
-                    flash(f'商品 "{product.name}" 库存不足: 需要 {quantity}, 实际 {product.stock_quantity} (新项 {i+1}, 编辑)', 'danger')
-                    db.session.rollback()
-                    # ... (re-populate form/render template) ...
-                    return render_template('order/form.html', form=form, products=products, order=order, order_items=order_items, title='编辑订单')
+                # 减少商品库存 (只在新状态不是"已取消"时检查和扣减)
+                if order.status != '已取消':
+                    try:
+                        adjust_product_stock(
+                            product.id,
+                            -quantity,
+                            reason=f'订单修改新增项: 订单号 {order.order_number if order.order_number else order.id}',
+                            created_by=current_user.id if current_user.is_authenticated else None
+                        )
+                    except InsufficientStock as e:
+                        flash(f'商品 "{product.name}" 库存不足: 需要 {quantity}, 实际 {e.available} (新项 {i+1}, 编辑)', 'danger')
+                        db.session.rollback()
+                        # ... (re-populate form/render template) ...
+                        return render_template('order/form.html', form=form, products=products, order=order, order_items=order_items, title='编辑订单')
 
                 # 创建订单项
                 new_item = OrderItem(
@@ -610,23 +697,6 @@ def edit(id):
                 )
                 db.session.add(new_item)
 
-                # 减少商品库存 (只在新状态不是"已取消"时扣减)
-                if order.status != '已取消':
-                    old_stock = product.stock_quantity
-                    product.stock_quantity -= quantity
-
-                    # 记录库存变动
-                    adjustment = StockAdjustment(
-                        adjustment_type='product',
-                        product_id=product.id,
-                        quantity_before=old_stock,
-                        quantity_after=product.stock_quantity,
-                        adjustment_quantity=-quantity,
-                        reason=f'订单修改新增项: 订单号 {order.order_number if order.order_number else order.id}',
-                        created_by=current_user.id if current_user.is_authenticated else None
-                    )
-                    db.session.add(adjustment)
-
 
             # 累计订单总金额
             total_amount = round(total_amount + subtotal, 2)
@@ -637,8 +707,7 @@ def edit(id):
         # 或者依赖级联删除，这里假设OrderItem.query.filter_by(order_id=order.id).all() 在 session.delete(item) 后会更新
         # 但更安全的是根据 submitted_item_ids 和原始加载的 order_items 来判断
         
-        # 改进：根据提交的 item_ids 和加载的 order_items 来判断哪些被删
-        existing_items_map = {item.id: item for item in order_items} # order_items 是加载本页面时的数据
+        # 改进：根据提交的 item_ids 和加载的 order_items (existing_items_map) 来判断哪些被删
         submitted_item_ids_int = {int(id) for id in item_ids if id and id.isdigit()}
 
         items_to_delete_ids = set(existing_items_map.keys()) - submitted_item_ids_int
@@ -650,22 +719,14 @@ def edit(id):
                  # 归还库存 (只在旧状态不是"已取消"时回滚删除的项的库存)
                  # 如果新状态也是"已取消"，不回滚，留给状态变更处理
                  if old_order_status != '已取消' and order.status != '已取消':
-                     product = Product.query.get(item_to_delete.product_id)
+                     product = product_map.get(item_to_delete.product_id)
                      if product: # 检查商品是否存在
-                         old_stock = product.stock_quantity
-                         product.stock_quantity += item_to_delete.quantity
-
-                         # 记录库存变动
-                         adjustment = StockAdjustment(
-                             adjustment_type='product',
-                             product_id=product.id,
-                             quantity_before=old_stock,
-                             quantity_after=product.stock_quantity,
-                             adjustment_quantity=item_to_delete.quantity,
+                         adjust_product_stock(
+                             product.id,
+                             item_to_delete.quantity,
                              reason=f'订单删除项: 订单号 {order.order_number if order.order_number else order.id}',
                              created_by=current_user.id if current_user.is_authenticated else None
                          )
-                         db.session.add(adjustment)
 
                  # 删除订单项
                  db.session.delete(item_to_delete)
@@ -688,6 +749,11 @@ def edit(id):
         # 设置订单总金额
         order.total_amount = total_amount
 
+        # 按修改前后的差值更新销售日汇总
+        db.session.flush()
+        current_items = OrderItem.query.filter_by(order_id=order.id).all()
+        apply_sales_delta(sales_before, sales_snapshot(order, current_items))
+
         db.session.commit()
         flash('订单更新成功', 'success')
         return redirect(url_for('order.detail', id=order.id))
@@ -700,6 +766,7 @@ def edit(id):
 
 @order_bp.route('/delete/<int:id>', methods=['POST'])
 @login_required
+@retry_on_conflict
 def delete(id):
     """删除订单"""
     order = Order.query.get_or_404(id)
@@ -709,24 +776,16 @@ def delete(id):
 
     # 如果订单不是"已取消"状态，恢复库存
     if order.status != '已取消':
+        product_map = _load_products([item.product_id for item in order_items])
         for item in order_items:
             # 归还库存
-            product = Product.query.get(item.product_id)
-            if product: # 检查商品是否存在
-                old_stock = product.stock_quantity
-                product.stock_quantity += item.quantity
-
-                # 记录库存变动
-                adjustment = StockAdjustment(
-                    adjustment_type='product',
-                    product_id=product.id,
-                    quantity_before=old_stock,
-                    quantity_after=product.stock_quantity,
-                    adjustment_quantity=item.quantity,
+            if item.product_id in product_map: # 检查商品是否存在
+                adjust_product_stock(
+                    item.product_id,
+                    item.quantity,
                     reason=f'订单删除: 订单号 {order.order_number if order.order_number else order.id}',
                     created_by=current_user.id if current_user.is_authenticated else None
                 )
-                db.session.add(adjustment)
     else:
         # 如果订单已经是“已取消”，记录一个删除记录但库存未变动的调整
         adjustment = StockAdjustment(
@@ -740,6 +799,9 @@ def delete(id):
         )
         db.session.add(adjustment)
 
+    # 从销售日汇总中扣除该订单
+    apply_sales_delta(sales_snapshot(order, order_items), {})
+
     try:
         # 删除所有订单项
         for item in order_items:
@@ -749,6 +811,9 @@ def delete(id):
         db.session.delete(order)
         db.session.commit()
         flash('订单删除成功', 'success')
+    except OperationalError:
+        # 锁冲突 / 序列化错误交给 retry_on_conflict 回滚后整体重试
+        raise
     except Exception as e:
         db.session.rollback()
         flash(f'删除订单失败: {str(e)}', 'danger')
@@ -760,12 +825,13 @@ def delete(id):
 @login_required
 def outbound_slip(id):
     """生成并显示出库单"""
-    order = Order.query.get_or_404(id)
+    order = _order_with_items().get_or_404(id)
     return render_template('order/outbound_slip.html', order=order)
 
 
 @order_bp.route('/<int:id>/update_status', methods=['POST'])
 @login_required
+@retry_on_conflict
 def update_status(id):
     """更新订单状态并处理库存逻辑"""
     order = Order.query.get_or_404(id)
@@ -781,56 +847,41 @@ def update_status(id):
             # 获取所有订单项，用于库存
             # 获取所有订单项，用于库存调整
             order_items = OrderItem.query.filter_by(order_id=order.id).all()
+            product_map = _load_products([item.product_id for item in order_items])
 
             if new_status == '已取消':
                 # 从非“已取消”状态变为“已取消”时，恢复库存
                 if old_status != '已取消':
                     for item in order_items:
-                        product = Product.query.get(item.product_id)
-                        if product:
-                            old_stock = product.stock_quantity
-                            product.stock_quantity += item.quantity
-
-                            # 记录库存变动
-                            adjustment = StockAdjustment(
-                                adjustment_type='product',
-                                product_id=product.id,
-                                quantity_before=old_stock,
-                                quantity_after=product.stock_quantity,
-                                adjustment_quantity=item.quantity, # 增加库存
+                        if item.product_id in product_map:
+                            adjust_product_stock(
+                                item.product_id,
+                                item.quantity, # 增加库存
                                 reason=f'订单取消: 订单号 {order.order_number if order.order_number else order.id}',
                                 created_by=current_user.id if current_user.is_authenticated else None
                             )
-                            db.session.add(adjustment)
             elif old_status == '已取消':
                 # 从“已取消”状态变为其他非“已取消”状态时，扣减库存
-                # 需要检查库存是否足够
+                # 库存是否足够由条件 UPDATE 检查
                 for item in order_items:
-                    product = Product.query.get(item.product_id)
+                    product = product_map.get(item.product_id)
                     if product:
-                        if item.quantity > product.stock_quantity:
+                        try:
+                            adjust_product_stock(
+                                item.product_id,
+                                -item.quantity, # 减少库存
+                                reason=f'订单恢复: 订单号 {order.order_number if order.order_number else order.id}',
+                                created_by=current_user.id if current_user.is_authenticated else None
+                            )
+                        except InsufficientStock as e:
                             db.session.rollback()
-                            flash(f'无法恢复订单: 商品 "{product.name}" 库存不足: 需要 {item.quantity}, 实际 {product.stock_quantity}', 'danger')
+                            flash(f'无法恢复订单: 商品 "{product.name}" 库存不足: 需要 {item.quantity}, 实际 {e.available}', 'danger')
                             return redirect(url_for('order.detail', id=id))
 
-                        # 减少库存
-                        old_stock = product.stock_quantity
-                        product.stock_quantity -= item.quantity
-
-                        # 记录库存变动
-                        adjustment = StockAdjustment(
-                            adjustment_type='product',
-                            product_id=product.id,
-                            quantity_before=old_stock,
-                            quantity_after=product.stock_quantity,
-                            adjustment_quantity=-item.quantity, # 减少库存
-                            reason=f'订单恢复: 订单号 {order.order_number if order.order_number else order.id}',
-                            created_by=current_user.id if current_user.is_authenticated else None
-                        )
-                        db.session.add(adjustment)
-
-            # 更新状态
+            # 更新状态，并按状态变更前后的差值更新销售日汇总
+            sales_before = sales_snapshot(order, order_items)
             order.status = new_status
+            apply_sales_delta(sales_before, sales_snapshot(order, order_items))
             db.session.commit()
             flash('订单状态更新成功', 'success')
         else:
@@ -2,16 +2,18 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from models import db
 # 确保导入了 RawMaterial，因为 StockAdjustmentForm 中会用到
-from models import Product, Category, Supplier, StockAdjustment, RawMaterial 
-
-# 引入 pypinyin 库和 time
-from pypinyin import Style, pinyin
-import time
+from models import (
+    Product, Category, Supplier, StockAdjustment, RawMaterial, Order, OrderItem, Customer, ArchivedOrder, ArchivedOrderItem
+)
 
 # 引入 IntegrityError
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 
 from forms import ProductForm, StockAdjustmentForm # 确保 StockAdjustmentForm 导入正确
+from pagination import paginate
+from search import apply_product_search
+from sku import allocate_sku
 
 
 product_bp = Blueprint('product', __name__, url_prefix='/product')
@@ -20,7 +22,6 @@ product_bp = Blueprint('product', __name__, url_prefix='/product')
 @login_required
 def list():
     """商品列表"""
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
     # 获取所有分类，用于筛选
@@ -32,22 +33,20 @@ def list():
     # 搜索功能
     search = request.args.get('search', '')
     
-    # 构建查询
-    query = Product.query
+    # 构建查询（列表显示分类名称，预加载分类）
+    query = Product.query.options(joinedload(Product.category))
     
     # 应用筛选条件
     if category_id:
         query = query.filter(Product.category_id == category_id)
     
+    # 关键词走全文检索索引（含拼音首字母），按相关度排序
     if search:
-        query = query.filter(
-            Product.name.like(f'%{search}%') | 
-            Product.sku.like(f'%{search}%') | 
-            Product.description.like(f'%{search}%')
-        )
+        query = apply_product_search(query, search)
     
-    # 执行分页查询
-    products = query.paginate(page=page, per_page=per_page)
+    # 执行分页查询：默认页码分页，paging=cursor 时按 (name, id) 游标分页；
+    # 有搜索关键词时按相关度排序，游标分页会丢掉这个顺序，始终用页码分页
+    products = paginate(query, [Product.name, Product.id], per_page, allow_cursor=not search)
     
     return render_template(
         'product/list.html', 
@@ -61,7 +60,11 @@ def list():
 @login_required
 def detail(id):
     """商品详情"""
-    product = Product.query.get_or_404(id)
+    product = Product.query.options(
+        joinedload(Product.category),
+        joinedload(Product.supplier),
+        selectinload(Product.order_items).joinedload(OrderItem.order).joinedload(Order.customer)
+    ).get_or_404(id)
     
     # 获取库存调整历史
     adjustments = StockAdjustment.query.filter(
@@ -69,7 +72,22 @@ def detail(id):
         StockAdjustment.product_id == id
     ).order_by(StockAdjustment.adjustment_date.desc()).limit(5).all()
     
-    return render_template('product/detail.html', product=product, adjustments=adjustments)
+    # 已归档订单中的记录（只读，不能查看或编辑订单）
+    archived_items = db.session.execute(
+        db.select(
+            ArchivedOrder.order_number, ArchivedOrder.order_date, ArchivedOrder.status, Customer.name.label('customer'),
+            ArchivedOrderItem.quantity, ArchivedOrderItem.unit_price, ArchivedOrderItem.subtotal
+        ).join(
+            ArchivedOrder, ArchivedOrder.id == ArchivedOrderItem.order_id
+        ).join(
+            Customer, Customer.id == ArchivedOrder.customer_id
+        ).where(
+            ArchivedOrderItem.product_id == id
+        ).order_by(ArchivedOrder.order_date.desc(), ArchivedOrderItem.id.desc())
+    ).all()
+    
+    return render_template('product/detail.html', product=product, adjustments=adjustments,
+                           archived_items=archived_items)
 
 @product_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -84,22 +102,9 @@ def add():
     if form.validate_on_submit():
         supplier_id = form.supplier_id.data if form.supplier_id.data > 0 else None
         
-        # --- SKU 自动生成逻辑开始 ---
-        sku = form.sku.data # 获取表单中输入的 SKU
+        # 未输入 SKU 时按名称拼音首字母自动分配（序列保证唯一，无需重试）
+        sku = form.sku.data or allocate_sku(form.name.data)
         
-        if not sku: # 如果用户没有输入 SKU (即表单 SKU 字段为空)
-            product_name = form.name.data
-            # 将产品名称转换为拼音首字母，并转为大写
-            pinyin_initials = ''.join([i[0][0].upper() for i in pinyin(product_name, style=Style.NORMAL)])
-            
-            # 为了确保 SKU 唯一性，可以在后面添加一个简短的时间戳或随机数
-            unique_suffix = str(int(time.time() * 100))[-6:] # 取时间戳后6位，足够随机且简短
-            
-            sku = f"{pinyin_initials}-{unique_suffix}"
-            current_app.logger.debug(f"DEBUG: Auto-generated SKU: {sku} for product: {product_name}")
-            
-        # --- SKU 自动生成逻辑结束 ---
-
         product = Product(
             name=form.name.data,
             sku=sku, # 使用生成的或用户输入的 SKU
@@ -118,7 +123,7 @@ def add():
             return redirect(url_for('product.list'))
         except IntegrityError: # 捕获唯一性约束错误
             db.session.rollback() # 回滚事务
-            flash('错误：生成的 SKU 可能已存在，请尝试手动输入 SKU 或稍后重试。', 'danger')
+            flash('错误：SKU 已存在，请修改后重试。', 'danger')
         
     return render_template('product/form.html', form=form, title='添加商品')
 
@@ -178,7 +183,9 @@ def delete(id):
     """删除商品"""
     product = Product.query.get_or_404(id)
     
-    if product.order_items:
+    # 已归档的订单同样引用商品
+    if db.session.query(OrderItem.query.filter_by(product_id=product.id).exists()).scalar() or \
+            db.session.query(ArchivedOrderItem.query.filter_by(product_id=product.id).exists()).scalar():
         flash('无法删除：该商品已有关联订单', 'danger')
         return redirect(url_for('product.list'))
     
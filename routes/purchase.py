@@ -1,10 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 
 from models import db
 from models import RawMaterialPurchase, RawMaterial, Supplier, StockAdjustment
 from forms import RawMaterialPurchaseForm
+from pagination import paginate
+from rollups import apply_material_purchase
 
 purchase_bp = Blueprint('purchase', __name__, url_prefix='/purchase')
 
@@ -12,7 +15,6 @@ purchase_bp = Blueprint('purchase', __name__, url_prefix='/purchase')
 @login_required
 def list():
     """原材料采购列表"""
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
     # 筛选条件
@@ -29,8 +31,11 @@ def list():
         # 设置为当天结束时间
         end_date = end_date.replace(hour=23, minute=59, second=59)
     
-    # 构建查询
-    query = RawMaterialPurchase.query
+    # 构建查询（列表显示原材料和供应商名称，预加载）
+    query = RawMaterialPurchase.query.options(
+        joinedload(RawMaterialPurchase.raw_material),
+        joinedload(RawMaterialPurchase.supplier)
+    )
     
     # 应用筛选条件
     if supplier_id:
@@ -48,8 +53,8 @@ def list():
     # 按日期降序排序
     query = query.order_by(RawMaterialPurchase.purchase_date.desc())
     
-    # 执行分页查询
-    purchases = query.paginate(page=page, per_page=per_page)
+    # 执行分页查询：默认页码分页，paging=cursor 时按 (purchase_date, id) 游标分页
+    purchases = paginate(query, [RawMaterialPurchase.purchase_date, RawMaterialPurchase.id], per_page, descending=True)
     
     # 获取筛选选项数据
     suppliers = Supplier.query.all()
@@ -118,6 +123,8 @@ def add():
         if raw_material:
             db.session.add(purchase)
             db.session.add(adjustment)
+            # 同一事务内累加原材料采购月汇总
+            apply_material_purchase(purchase)
             db.session.commit()
             flash('原材料采购记录添加成功', 'success')
             return redirect(url_for('purchase.list'))
@@ -6,6 +6,7 @@ from models import db
 from models import RawMaterial, StockAdjustment, Product, RawMaterialPurchase, Supplier
 from forms import RawMaterialForm, StockAdjustmentForm
 from datetime import datetime # 确保 datetime 在这里被导入
+from sqlalchemy.orm import joinedload
 
 raw_material_bp = Blueprint('raw_material', __name__, url_prefix='/raw_material')
 
@@ -41,7 +42,9 @@ def detail(id):
     ).order_by(StockAdjustment.adjustment_date.desc()).all()
 
     # 获取采购历史 (使用 RawMaterialPurchase 模型直接查询)
-    purchases = RawMaterialPurchase.query.filter_by(raw_material_id=id).order_by(RawMaterialPurchase.purchase_date.desc()).all()
+    purchases = RawMaterialPurchase.query.options(
+        joinedload(RawMaterialPurchase.supplier)
+    ).filter_by(raw_material_id=id).order_by(RawMaterialPurchase.purchase_date.desc()).all()
 
     return render_template('raw_material/detail.html', 
                            raw_material=raw_material, 
@@ -1,15 +1,113 @@
-from flask import Blueprint, render_template, request, Response, flash, current_app
+from flask import Blueprint, render_template, request, flash, current_app
 from flask_login import login_required
-from datetime import datetime
-import csv
-import io
+from datetime import datetime, timedelta
 from sqlalchemy import func, extract
 
-from models import db, Order, OrderItem, Product, Category, Customer, RawMaterial, RawMaterialPurchase, Supplier
+from models import db, Product, Category, Customer, RawMaterial, DailySalesRollup, DailyCustomerSales
 from forms import ReportDateRangeForm
+from exports import csv_response, iter_rows
+from rollups import material_cost_report
+from report_cache import cached_report
+from valuation import inventory_valuation, month_end_values
+from stock_history import stock_as_of_column
+from search import apply_product_search
+from pagination import keyset_paginate
+
+# 历史库存报表每页的商品数
+STOCK_HISTORY_PER_PAGE = 50
 
 report_bp = Blueprint('report', __name__, url_prefix='/report')
 
+def _load_sales_report(start_day, end_day):
+    """查询销售报表的四个视图，返回可跨请求缓存的结果列表（不含 ORM 对象）"""
+    # 按分类的销售额统计
+    category_sales = db.session.query(
+        Category.name.label('category'),
+        func.sum(DailySalesRollup.amount).label('total_sales')
+    ).select_from(
+        DailySalesRollup
+    ).join(
+        Category, 
+        Category.id == DailySalesRollup.category_id
+    ).filter(
+        DailySalesRollup.day.between(start_day, end_day)
+    ).group_by(
+        Category.name
+    ).having(
+        func.sum(DailySalesRollup.quantity) > 0
+    ).order_by(
+        func.sum(DailySalesRollup.amount).desc()
+    )
+    
+    # 月度销售额统计（按所选日期范围）
+    monthly_sales = db.session.query(
+        extract('year', DailyCustomerSales.day).label('year'),
+        extract('month', DailyCustomerSales.day).label('month'),
+        func.sum(DailyCustomerSales.amount).label('total_sales')
+    ).filter(
+        DailyCustomerSales.day.between(start_day, end_day)
+    ).group_by(
+        extract('year', DailyCustomerSales.day),
+        extract('month', DailyCustomerSales.day)
+    ).having(
+        func.sum(DailyCustomerSales.order_count) > 0
+    ).order_by(
+        extract('year', DailyCustomerSales.day),
+        extract('month', DailyCustomerSales.day)
+    )
+    
+    # 畅销商品排名
+    top_products = db.session.query(
+        Product.name.label('product'),
+        Category.name.label('category'),
+        func.sum(DailySalesRollup.quantity).label('total_quantity'),
+        func.sum(DailySalesRollup.amount).label('total_sales')
+    ).select_from(
+        DailySalesRollup
+    ).join(
+        Product, 
+        Product.id == DailySalesRollup.product_id
+    ).join(
+        Category, 
+        Category.id == DailySalesRollup.category_id
+    ).filter(
+        DailySalesRollup.day.between(start_day, end_day)
+    ).group_by(
+        Product.name,
+        Category.name
+    ).having(
+        func.sum(DailySalesRollup.quantity) > 0
+    ).order_by(
+        func.sum(DailySalesRollup.quantity).desc()
+    ).limit(10)
+    
+    # 客户购买力排名
+    top_customers = db.session.query(
+        Customer.name.label('customer'),
+        func.sum(DailyCustomerSales.order_count).label('order_count'),
+        func.sum(DailyCustomerSales.amount).label('total_amount')
+    ).select_from(
+        DailyCustomerSales
+    ).join(
+        Customer, 
+        Customer.id == DailyCustomerSales.customer_id
+    ).filter(
+        DailyCustomerSales.day.between(start_day, end_day)
+    ).group_by(
+        Customer.name
+    ).having(
+        func.sum(DailyCustomerSales.order_count) > 0
+    ).order_by(
+        func.sum(DailyCustomerSales.amount).desc()
+    ).limit(10)
+    
+    return {
+        'category_sales': category_sales.all(),
+        'monthly_sales': monthly_sales.all(),
+        'top_products': top_products.all(),
+        'top_customers': top_customers.all(),
+    }
+
 @report_bp.route('/sales', methods=['GET', 'POST'])
 @login_required
 def sales():
@@ -47,97 +145,26 @@ def sales():
         start_date = start_date_obj.strftime('%Y-%m-%d')
         end_date = end_date_obj.strftime('%Y-%m-%d')
     
-    # 按分类的销售额统计
-    category_sales = db.session.query(
-        Category.name.label('category'),
-        func.sum(OrderItem.subtotal).label('total_sales')
-    ).join(
-        Product, 
-        Product.id == OrderItem.product_id
-    ).join(
-        Category, 
-        Category.id == Product.category_id
-    ).join(
-        Order, 
-        Order.id == OrderItem.order_id
-    ).filter(
-        Order.order_date.between(start_date_obj, end_date_obj),
-        Order.status != '已取消'
-    ).group_by(
-        Category.name
-    ).order_by(
-        func.sum(OrderItem.subtotal).desc()
-    ).all()
-    
-    # 月度销售额统计
-    monthly_sales = db.session.query(
-        extract('year', Order.order_date).label('year'),
-        extract('month', Order.order_date).label('month'),
-        func.sum(Order.total_amount).label('total_sales')
-    ).filter(
-        Order.status != '已取消'
-    ).group_by(
-        extract('year', Order.order_date),
-        extract('month', Order.order_date)
-    ).order_by(
-        extract('year', Order.order_date),
-        extract('month', Order.order_date)
-    ).all()
-    
-    # 畅销商品排名
-    top_products = db.session.query(
-        Product.name.label('product'),
-        Category.name.label('category'),
-        func.sum(OrderItem.quantity).label('total_quantity'),
-        func.sum(OrderItem.subtotal).label('total_sales')
-    ).join(
-        OrderItem, 
-        OrderItem.product_id == Product.id
-    ).join(
-        Category, 
-        Category.id == Product.category_id
-    ).join(
-        Order, 
-        Order.id == OrderItem.order_id
-    ).filter(
-        Order.order_date.between(start_date_obj, end_date_obj),
-        Order.status != '已取消'
-    ).group_by(
-        Product.name,
-        Category.name
-    ).order_by(
-        func.sum(OrderItem.quantity).desc()
-    ).limit(10).all()
-    
-    # 客户购买力排名
-    top_customers = db.session.query(
-        Customer.name.label('customer'),
-        func.count(Order.id).label('order_count'),
-        func.sum(Order.total_amount).label('total_amount')
-    ).join(
-        Order, 
-        Order.customer_id == Customer.id
-    ).filter(
-        Order.order_date.between(start_date_obj, end_date_obj),
-        Order.status != '已取消'
-    ).group_by(
-        Customer.name
-    ).order_by(
-        func.sum(Order.total_amount).desc()
-    ).limit(10).all()
+    # 以下统计均读取销售日汇总表（见 rollups.py），耗时取决于日期范围内的天数；
+    # 结果按日期范围缓存，订单写入后失效（见 report_cache.py）
+    start_day = start_date_obj.date()
+    end_day = end_date_obj.date()
+    data = cached_report('sales', start_day, end_day, lambda: _load_sales_report(start_day, end_day))
     
     # 导出数据
     export_format = request.args.get('export')
     if export_format == 'csv':
-        return export_sales_to_csv(category_sales, top_products, top_customers, start_date, end_date)
+        return export_sales_to_csv(
+            data['category_sales'], data['top_products'], data['top_customers'], start_date, end_date
+        )
     
     return render_template(
         'report/sales.html',
         form=form,
-        category_sales=category_sales,
-        monthly_sales=monthly_sales,
-        top_products=top_products,
-        top_customers=top_customers,
+        category_sales=data['category_sales'],
+        monthly_sales=data['monthly_sales'],
+        top_products=data['top_products'],
+        top_customers=data['top_customers'],
         start_date=start_date,
         end_date=end_date
     )
@@ -179,54 +206,13 @@ def material_cost():
         start_date = start_date_obj.strftime('%Y-%m-%d')
         end_date = end_date_obj.strftime('%Y-%m-%d')
     
-    # 月度原材料支出统计
-    monthly_costs = db.session.query(
-        extract('year', RawMaterialPurchase.purchase_date).label('year'),
-        extract('month', RawMaterialPurchase.purchase_date).label('month'),
-        func.sum(RawMaterialPurchase.total_price).label('total_cost')
-    ).filter(
-        RawMaterialPurchase.purchase_date.between(start_date_obj, end_date_obj)
-    ).group_by(
-        extract('year', RawMaterialPurchase.purchase_date),
-        extract('month', RawMaterialPurchase.purchase_date)
-    ).order_by(
-        extract('year', RawMaterialPurchase.purchase_date),
-        extract('month', RawMaterialPurchase.purchase_date)
-    ).all()
-    
-    # 原材料采购排名
-    top_materials = db.session.query(
-        RawMaterial.name.label('material'),
-        RawMaterial.unit.label('unit'),
-        func.sum(RawMaterialPurchase.quantity).label('total_quantity'),
-        func.sum(RawMaterialPurchase.total_price).label('total_cost')
-    ).join(
-        RawMaterialPurchase, 
-        RawMaterialPurchase.raw_material_id == RawMaterial.id
-    ).filter(
-        RawMaterialPurchase.purchase_date.between(start_date_obj, end_date_obj)
-    ).group_by(
-        RawMaterial.name,
-        RawMaterial.unit
-    ).order_by(
-        func.sum(RawMaterialPurchase.total_price).desc()
-    ).all()
-    
-    # 供应商采购统计
-    supplier_costs = db.session.query(
-        Supplier.name.label('supplier'),
-        func.sum(RawMaterialPurchase.total_price).label('total_cost'),
-        func.count(RawMaterialPurchase.id).label('purchase_count')
-    ).join(
-        RawMaterialPurchase, 
-        RawMaterialPurchase.supplier_id == Supplier.id
-    ).filter(
-        RawMaterialPurchase.purchase_date.between(start_date_obj, end_date_obj)
-    ).group_by(
-        Supplier.name
-    ).order_by(
-        func.sum(RawMaterialPurchase.total_price).desc()
-    ).all()
+    # 三个视图由一条查询得出：整月读原材料月汇总表，首尾不满一个月的部分读采购记录（见 rollups.py）；
+    # 结果按日期范围缓存，采购写入后失效（见 report_cache.py）
+    start_day = start_date_obj.date()
+    end_day = end_date_obj.date()
+    monthly_costs, top_materials, supplier_costs = cached_report(
+        'material_cost', start_day, end_day, lambda: material_cost_report(start_day, end_day)
+    )
     
     # 导出数据
     export_format = request.args.get('export')
@@ -243,76 +229,198 @@ def material_cost():
         end_date=end_date
     )
 
-def export_sales_to_csv(category_sales, top_products, top_customers, start_date, end_date):
-    """导出销售报表为CSV"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+@report_bp.route('/inventory-valuation')
+@login_required
+def inventory_valuation_report():
+    """库存价值报表：当前库存按成本价估值（按分类、按供应商），以及近 12 个月的月末价值"""
+    # 当前价值在数据库中聚合；月末价值每月读一行库存价值快照（见 valuation.py）
+    summary, category_values, supplier_values = inventory_valuation()
+    month_ends = month_end_values()
+    
+    # 导出数据
+    export_format = request.args.get('export')
+    if export_format == 'csv':
+        return export_inventory_valuation_to_csv(summary, category_values, supplier_values, month_ends)
     
-    # 写入标题
-    writer.writerow(['销售报表', f'日期范围: {start_date} - {end_date}'])
-    writer.writerow([])
+    return render_template(
+        'report/inventory_valuation.html',
+        summary=summary,
+        category_values=category_values,
+        supplier_values=supplier_values,
+        month_ends=month_ends
+    )
+
+@report_bp.route('/stock-as-of')
+@login_required
+def stock_as_of_report():
+    """历史库存报表：商品 / 原材料在指定日期结束时的库存与当前库存对比"""
+    # 获取日期（默认今天）和筛选条件
+    day = request.args.get('date')
+    category_id = request.args.get('category_id', type=int)
+    search = request.args.get('search', '')
+    try:
+        day_obj = datetime.strptime(day, '%Y-%m-%d') if day else datetime.now()
+    except ValueError:
+        flash('日期格式无效，请使用正确的日期格式', 'error')
+        day_obj = datetime.now()
+    day = day_obj.strftime('%Y-%m-%d')
+    # 当天结束时 = 次日 0 点之前
+    at = datetime.combine(day_obj.date() + timedelta(days=1), datetime.min.time())
     
-    # 写入分类销售数据
-    writer.writerow(['按分类的销售额'])
-    writer.writerow(['分类', '销售额'])
-    for item in category_sales:
-        writer.writerow([item.category, item.total_sales])
-    writer.writerow([])
+    # 历史库存 = 最近的库存检查点 + 之后的调整，每个商品只读一个检查点和少量流水（见 stock_history.py）
+    products = db.session.query(
+        Product.id,
+        Product.sku,
+        Product.name,
+        Category.name.label('category'),
+        Product.stock_quantity,
+        stock_as_of_column('product', at).label('quantity')
+    ).join(
+        Category,
+        Category.id == Product.category_id
+    )
+    if category_id:
+        products = products.filter(Product.category_id == category_id)
+    products = apply_product_search(products, search)
     
-    # 写入畅销商品数据
-    writer.writerow(['畅销商品排名'])
-    writer.writerow(['商品', '分类', '销售数量', '销售额'])
-    for item in top_products:
-        writer.writerow([item.product, item.category, item.total_quantity, item.total_sales])
-    writer.writerow([])
+    raw_materials = db.session.query(
+        RawMaterial.id,
+        RawMaterial.name,
+        RawMaterial.unit,
+        RawMaterial.stock_quantity,
+        stock_as_of_column('raw_material', at).label('quantity')
+    ).order_by(RawMaterial.id)
     
-    # 写入客户购买力数据
-    writer.writerow(['客户购买力排名'])
-    writer.writerow(['客户', '订单数', '购买总额'])
-    for item in top_customers:
-        writer.writerow([item.customer, item.order_count, item.total_amount])
+    # 导出数据（全部商品，分批读取）
+    export_format = request.args.get('export')
+    if export_format == 'csv':
+        return export_stock_as_of_to_csv(products.order_by(None).order_by(Product.id), raw_materials, day)
     
-    # 创建响应
-    output.seek(0)
-    return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename=sales_report_{start_date}_to_{end_date}.csv"}
+    return render_template(
+        'report/stock_as_of.html',
+        products=keyset_paginate(products, [Product.id], STOCK_HISTORY_PER_PAGE, cursor=request.args.get('cursor')),
+        raw_materials=raw_materials.all(),
+        categories=Category.query.order_by(Category.name).all(),
+        category_id=category_id,
+        search=search,
+        day=day
     )
 
-def export_material_cost_to_csv(monthly_costs, top_materials, supplier_costs, start_date, end_date):
-    """导出原材料支出报表为CSV"""
-    output = io.StringIO()
-    writer = csv.writer(output)
+def export_sales_to_csv(category_sales, top_products, top_customers, start_date, end_date):
+    """导出销售报表为CSV（流式输出）"""
+    def rows():
+        # 写入标题
+        yield ['销售报表', f'日期范围: {start_date} - {end_date}']
+        yield []
+        
+        # 写入分类销售数据
+        yield ['按分类的销售额']
+        yield ['分类', '销售额']
+        for item in iter_rows(category_sales):
+            yield [item.category, item.total_sales]
+        yield []
+        
+        # 写入畅销商品数据
+        yield ['畅销商品排名']
+        yield ['商品', '分类', '销售数量', '销售额']
+        for item in iter_rows(top_products):
+            yield [item.product, item.category, item.total_quantity, item.total_sales]
+        yield []
+        
+        # 写入客户购买力数据
+        yield ['客户购买力排名']
+        yield ['客户', '订单数', '购买总额']
+        for item in iter_rows(top_customers):
+            yield [item.customer, item.order_count, item.total_amount]
     
-    # 写入标题
-    writer.writerow(['原材料支出报表', f'日期范围: {start_date} - {end_date}'])
-    writer.writerow([])
+    return csv_response(rows(), f"sales_report_{start_date}_to_{end_date}.csv")
+
+def export_material_cost_to_csv(monthly_costs, top_materials, supplier_costs, start_date, end_date):
+    """导出原材料支出报表为CSV（流式输出，查询结果分批读取）"""
+    def rows():
+        # 写入标题
+        yield ['原材料支出报表', f'日期范围: {start_date} - {end_date}']
+        yield []
+        
+        # 写入月度支出数据
+        yield ['月度原材料支出']
+        yield ['年', '月', '总支出']
+        for item in iter_rows(monthly_costs):
+            yield [int(item.year), int(item.month), item.total_cost]
+        yield []
+        
+        # 写入原材料采购排名数据
+        yield ['原材料采购排名']
+        yield ['原材料', '单位', '采购数量', '采购总额']
+        for item in iter_rows(top_materials):
+            yield [item.material, item.unit, item.total_quantity, item.total_cost]
+        yield []
+        
+        # 写入供应商采购统计数据
+        yield ['供应商采购统计']
+        yield ['供应商', '采购次数', '采购总额']
+        for item in iter_rows(supplier_costs):
+            yield [item.supplier, item.purchase_count, item.total_cost]
     
-    # 写入月度支出数据
-    writer.writerow(['月度原材料支出'])
-    writer.writerow(['年', '月', '总支出'])
-    for item in monthly_costs:
-        writer.writerow([int(item.year), int(item.month), item.total_cost])
-    writer.writerow([])
+    return csv_response(rows(), f"material_cost_report_{start_date}_to_{end_date}.csv")
+
+def export_inventory_valuation_to_csv(summary, category_values, supplier_values, month_ends):
+    """导出库存价值报表为CSV（流式输出）"""
+    today = datetime.now().strftime('%Y-%m-%d')
     
-    # 写入原材料采购排名数据
-    writer.writerow(['原材料采购排名'])
-    writer.writerow(['原材料', '单位', '采购数量', '采购总额'])
-    for item in top_materials:
-        writer.writerow([item.material, item.unit, item.total_quantity, item.total_cost])
-    writer.writerow([])
+    def rows():
+        # 写入标题
+        yield ['库存价值报表', f'日期: {today}']
+        yield []
+        
+        # 写入汇总数据
+        yield ['库存价值汇总']
+        yield ['类型', '库存数量', '库存价值']
+        yield ['商品', summary.product_quantity, summary.product_value]
+        yield ['原材料', summary.raw_material_quantity, summary.raw_material_value]
+        yield ['合计', '', summary.total_value]
+        yield []
+        
+        # 写入按分类的商品库存价值
+        yield ['按分类的商品库存价值']
+        yield ['分类', '商品数', '库存数量', '库存价值']
+        for item in category_values:
+            yield [item.category, item.product_count, item.quantity, item.value]
+        yield []
+        
+        # 写入按供应商的库存价值
+        yield ['按供应商的库存价值']
+        yield ['供应商', '商品价值', '原材料价值', '合计']
+        for item in supplier_values:
+            yield [item.supplier, item.product_value, item.raw_material_value, item.total_value]
+        yield []
+        
+        # 写入月末库存价值
+        yield ['月末库存价值']
+        yield ['年', '月', '快照日期', '商品价值', '原材料价值', '合计']
+        for item in month_ends:
+            yield [item.year, item.month, item.snapshot_date, item.product_value, item.raw_material_value, item.total_value]
     
-    # 写入供应商采购统计数据
-    writer.writerow(['供应商采购统计'])
-    writer.writerow(['供应商', '采购次数', '采购总额'])
-    for item in supplier_costs:
-        writer.writerow([item.supplier, item.purchase_count, item.total_cost])
+    return csv_response(rows(), f"inventory_valuation_{today}.csv")
+
+def export_stock_as_of_to_csv(products, raw_materials, day):
+    """导出历史库存报表为CSV（流式输出，查询结果分批读取）"""
+    def rows():
+        # 写入标题
+        yield ['历史库存报表', f'日期: {day}（当天结束时）']
+        yield []
+        
+        # 写入商品库存
+        yield ['商品库存']
+        yield ['SKU', '商品', '分类', '历史库存', '当前库存']
+        for item in iter_rows(products):
+            yield [item.sku, item.name, item.category, item.quantity, item.stock_quantity]
+        yield []
+        
+        # 写入原材料库存
+        yield ['原材料库存']
+        yield ['原材料', '单位', '历史库存', '当前库存']
+        for item in iter_rows(raw_materials):
+            yield [item.name, item.unit, item.quantity, item.stock_quantity]
     
-    # 创建响应
-    output.seek(0)
-    return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename=material_cost_report_{start_date}_to_{end_date}.csv"}
-    )
+    return csv_response(rows(), f"stock_as_of_{day}.csv")
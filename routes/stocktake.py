@@ -0,0 +1,84 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+
+from models import db
+from models import StocktakeSession
+from inventory import retry_on_conflict
+from stocktake import StocktakeError, create_session, preview, apply_session, STATUS_PENDING, STATUS_CANCELLED
+
+stocktake_bp = Blueprint('stocktake', __name__, url_prefix='/stocktake')
+
+# 上传结果页最多提示的错误行数
+MAX_FLASHED_ERRORS = 10
+
+@stocktake_bp.route('/list')
+@login_required
+def list():
+    """盘点单列表与上传入口"""
+    page = request.args.get('page', 1, type=int)
+    sessions = StocktakeSession.query.order_by(StocktakeSession.id.desc()).paginate(page=page, per_page=10)
+    return render_template('stocktake/list.html', sessions=sessions)
+
+@stocktake_bp.route('/upload', methods=['POST'])
+@login_required
+def upload():
+    """上传实盘文件，生成待确认的盘点单"""
+    upload_file = request.files.get('file')
+    if upload_file is None or not upload_file.filename:
+        flash('请选择盘点文件', 'danger')
+        return redirect(url_for('stocktake.list'))
+    
+    try:
+        session, errors = create_session(upload_file.read(), upload_file.filename, current_user.username)
+    except StocktakeError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('stocktake.list'))
+    
+    for line_no, message in errors[:MAX_FLASHED_ERRORS]:
+        flash(f'第 {line_no} 行: {message}', 'warning')
+    if len(errors) > MAX_FLASHED_ERRORS:
+        flash(f'另有 {len(errors) - MAX_FLASHED_ERRORS} 行错误未显示', 'warning')
+    if session is None:
+        flash('文件中没有可用的盘点数据', 'danger')
+        return redirect(url_for('stocktake.list'))
+    
+    db.session.commit()
+    flash(f'盘点单已生成，共 {session.line_count} 项，请确认差异后应用', 'success')
+    return redirect(url_for('stocktake.detail', id=session.id))
+
+@stocktake_bp.route('/<int:id>')
+@login_required
+def detail(id):
+    """盘点单差异预览"""
+    session = StocktakeSession.query.get_or_404(id)
+    summary, rows = preview(session.id)
+    return render_template('stocktake/detail.html', session=session, summary=summary, rows=rows,
+                           pending=session.status == STATUS_PENDING)
+
+@stocktake_bp.route('/<int:id>/apply', methods=['POST'])
+@login_required
+@retry_on_conflict
+def apply(id):
+    """确认盘点单：在一个事务内批量更新库存并记录库存调整"""
+    session = StocktakeSession.query.get_or_404(id)
+    try:
+        count = apply_session(session, current_user.username)
+    except StocktakeError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('stocktake.detail', id=id))
+    db.session.commit()
+    flash(f'盘点已应用，调整库存 {count} 项', 'success')
+    return redirect(url_for('stocktake.detail', id=id))
+
+@stocktake_bp.route('/<int:id>/cancel', methods=['POST'])
+@login_required
+def cancel(id):
+    """取消待确认的盘点单"""
+    session = StocktakeSession.query.get_or_404(id)
+    if session.status != STATUS_PENDING:
+        flash(f'盘点单状态为 {session.status}，不能取消', 'danger')
+    else:
+        session.status = STATUS_CANCELLED
+        db.session.commit()
+        flash('盘点单已取消', 'success')
+    return redirect(url_for('stocktake.list'))
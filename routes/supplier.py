@@ -1,8 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required
+from sqlalchemy.orm import selectinload
 
 from models import db
-from models import Supplier
+from models import Supplier, Product, RawMaterialPurchase
 from forms import SupplierForm
 
 supplier_bp = Blueprint('supplier', __name__, url_prefix='/supplier')
@@ -31,7 +32,10 @@ def list():
 @login_required
 def detail(id):
     """供应商详情"""
-    supplier = Supplier.query.get_or_404(id)
+    supplier = Supplier.query.options(
+        selectinload(Supplier.products),
+        selectinload(Supplier.raw_material_purchases).joinedload(RawMaterialPurchase.raw_material)
+    ).get_or_404(id)
     return render_template('supplier/detail.html', supplier=supplier)
 
 @supplier_bp.route('/add', methods=['GET', 'POST'])
@@ -81,7 +85,9 @@ def delete(id):
     supplier = Supplier.query.get_or_404(id)
     
     # 检查供应商是否有关联产品或采购记录
-    if supplier.products or supplier.raw_material_purchases:
+    has_products = db.session.query(Product.query.filter_by(supplier_id=supplier.id).exists()).scalar()
+    has_purchases = db.session.query(RawMaterialPurchase.query.filter_by(supplier_id=supplier.id).exists()).scalar()
+    if has_products or has_purchases:
         flash('无法删除：该供应商已有关联产品或采购记录', 'danger')
         return redirect(url_for('supplier.list'))
     
@@ -0,0 +1,230 @@
+"""商品全文检索索引
+
+商品名称、SKU、描述以及名称的拼音首字母（与自动生成 SKU 使用同一转换，
+例如 红色笔 -> HSB）写入独立的检索表 product_search：
+
+    SQLite      FTS5 虚拟表（trigram 分词，支持中文子串匹配），rowid = 商品 ID，
+                按 bm25 相关度排序
+    PostgreSQL  普通表 + pg_trgm GIN 索引，ILIKE 走索引，按 similarity 排序
+    其他数据库  不建索引，退回原来的 LIKE 过滤
+
+检索表随 products 表一起由 create_all / drop_all 创建和删除，商品的新增、
+修改、删除通过 ORM 事件在同一事务内同步。已有数据库（products 表早已存在）
+由 flask init-db / upgrade-db 在检索表缺失时建表并回填，
+flask rebuild-search-index 可随时重建。
+
+pypinyin 的字典较大，在第一次转换拼音时才导入，不计入 worker 启动时间和常驻内存。
+"""
+from functools import lru_cache
+
+from sqlalchemy import Float, Integer, String, event, func, inspect, literal_column, or_, select, text
+from sqlalchemy.sql import column, table
+
+from models import db, Product
+
+SEARCH_TABLE = 'product_search'
+
+# trigram 分词要求查询至少 3 个字符，更短的关键词改用 LIKE
+MIN_MATCH_LENGTH = 3
+
+# bm25 列权重，顺序与建表列一致：name, sku, initials, description
+BM25_WEIGHTS = (10.0, 6.0, 8.0, 1.0)
+
+_INDEXED_ATTRS = ('name', 'sku', 'description')
+
+# PostgreSQL 检索文档表达式，查询必须与 GIN 表达式索引逐字一致才能命中索引
+_PG_DOCUMENT = "(name || ' ' || sku || ' ' || initials || ' ' || description)"
+
+_search = table(
+    SEARCH_TABLE,
+    column('rowid', Integer), column('product_id', Integer),
+    column('name', String), column('sku', String), column('initials', String), column('description', String)
+)
+
+
+# 名称 -> 拼音首字母的缓存条数
+PINYIN_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PINYIN_CACHE_SIZE)
+def pinyin_initials(text_value):
+    """名称转拼音首字母（大写），非中文字符取每段的首字母"""
+    if not text_value:
+        return ''
+    from pypinyin import Style, pinyin
+    return ''.join([i[0][0].upper() for i in pinyin(text_value, style=Style.NORMAL)])
+
+
+def _dialect(bind):
+    return bind.dialect.name
+
+
+def _create_ddl(dialect):
+    if dialect == 'sqlite':
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "name, sku, initials, description, tokenize='trigram')"
+        ]
+    if dialect == 'postgresql':
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE, "
+            "name TEXT NOT NULL DEFAULT '', sku TEXT NOT NULL DEFAULT '', "
+            "initials TEXT NOT NULL DEFAULT '', description TEXT NOT NULL DEFAULT '')",
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_trgm ON {SEARCH_TABLE} USING gin "
+            f"({_PG_DOCUMENT} gin_trgm_ops)",
+        ]
+    return []
+
+
+def create_search_table(connection):
+    for statement in _create_ddl(_dialect(connection)):
+        connection.execute(text(statement))
+
+
+def drop_search_table(connection):
+    if _dialect(connection) in ('sqlite', 'postgresql'):
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+@event.listens_for(Product.__table__, 'after_create')
+def _after_products_create(target, connection, **kw):
+    create_search_table(connection)
+
+
+@event.listens_for(Product.__table__, 'before_drop')
+def _before_products_drop(target, connection, **kw):
+    drop_search_table(connection)
+
+
+def _key_column(dialect):
+    return 'rowid' if dialect == 'sqlite' else 'product_id'
+
+
+def _index_row(product_id, name, sku, description):
+    return {
+        'id': product_id,
+        'name': name or '',
+        'sku': sku or '',
+        'initials': pinyin_initials(name),
+        'description': description or '',
+    }
+
+
+def _write_index(connection, rows):
+    """删除后重新写入检索行（FTS5 不支持 ON CONFLICT，统一用先删后插）"""
+    dialect = _dialect(connection)
+    if dialect not in ('sqlite', 'postgresql') or not rows:
+        return
+    key = _key_column(dialect)
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} = :id"), [{'id': r['id']} for r in rows])
+    connection.execute(
+        text(f"INSERT INTO {SEARCH_TABLE} ({key}, name, sku, initials, description) "
+             "VALUES (:id, :name, :sku, :initials, :description)"),
+        rows
+    )
+
+
+@event.listens_for(Product, 'after_insert')
+def _index_inserted_product(mapper, connection, target):
+    _write_index(connection, [_index_row(target.id, target.name, target.sku, target.description)])
+
+
+@event.listens_for(Product, 'after_update')
+def _index_updated_product(mapper, connection, target):
+    # 库存等非检索字段的变化不重建索引
+    state = inspect(target)
+    if any(state.attrs[attr].history.has_changes() for attr in _INDEXED_ATTRS):
+        _write_index(connection, [_index_row(target.id, target.name, target.sku, target.description)])
+
+
+@event.listens_for(Product, 'after_delete')
+def _unindex_deleted_product(mapper, connection, target):
+    dialect = _dialect(connection)
+    if dialect in ('sqlite', 'postgresql'):
+        connection.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE {_key_column(dialect)} = :id"), {'id': target.id}
+        )
+
+
+def rebuild_search_index(chunk_size=1000):
+    """建表（如不存在）并根据全部商品重建检索索引，返回写入的商品数"""
+    connection = db.session.connection()
+    if _dialect(connection) not in ('sqlite', 'postgresql'):
+        return 0
+    create_search_table(connection)
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+
+    count = 0
+    rows = []
+    products = db.session.query(Product.id, Product.name, Product.sku, Product.description).yield_per(chunk_size)
+    for product_id, name, sku, description in products:
+        rows.append(_index_row(product_id, name, sku, description))
+        if len(rows) >= chunk_size:
+            _write_index(connection, rows)
+            count += len(rows)
+            rows = []
+    _write_index(connection, rows)
+    return count + len(rows)
+
+
+def ensure_search_index():
+    """检索表不存在时建表并回填，返回写入的商品数；表已存在或数据库不支持时返回 None"""
+    connection = db.session.connection()
+    if _dialect(connection) not in ('sqlite', 'postgresql'):
+        return None
+    if inspect(connection).has_table(SEARCH_TABLE):
+        return None
+    return rebuild_search_index()
+
+
+def _like_filter(query, keyword):
+    return query.filter(
+        Product.name.like(f'%{keyword}%') |
+        Product.sku.like(f'%{keyword}%') |
+        Product.description.like(f'%{keyword}%')
+    )
+
+
+def _ranked_matches(dialect, keyword):
+    """返回 (product_id, rank) 子查询，rank 越小越相关"""
+    if dialect == 'sqlite':
+        if len(keyword) >= MIN_MATCH_LENGTH:
+            # 整体作为短语匹配，避免用户输入被解析为 FTS5 查询语法
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            return select(
+                _search.c.rowid.label('product_id'),
+                func.bm25(literal_column(SEARCH_TABLE), *BM25_WEIGHTS).label('rank')
+            ).where(literal_column(SEARCH_TABLE).op('MATCH')(phrase)).subquery()
+        pattern = f'%{keyword}%'
+        return select(
+            _search.c.rowid.label('product_id'),
+            literal_column('0').label('rank')
+        ).where(or_(
+            _search.c.name.like(pattern), _search.c.sku.like(pattern),
+            _search.c.initials.like(pattern), _search.c.description.like(pattern)
+        )).subquery()
+
+    document = literal_column(_PG_DOCUMENT, String)
+    return select(
+        _search.c.product_id,
+        (-func.greatest(
+            func.similarity(_search.c.name, keyword),
+            func.similarity(_search.c.initials, keyword),
+            func.similarity(_search.c.sku, keyword),
+            type_=Float
+        )).label('rank')
+    ).where(document.ilike(f'%{keyword}%')).subquery()
+
+
+def apply_product_search(query, keyword):
+    """在 Product 查询上应用关键词检索，并按相关度排序（相关度相同按 ID）"""
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return query
+    dialect = _dialect(db.session.get_bind())
+    if dialect not in ('sqlite', 'postgresql'):
+        return _like_filter(query, keyword)
+    ranked = _ranked_matches(dialect, keyword)
+    return query.join(ranked, ranked.c.product_id == Product.id).order_by(ranked.c.rank, Product.id)
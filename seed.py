@@ -0,0 +1,295 @@
+"""合成数据生成（flask seed、基准测试、压测用）
+
+按给定规模批量写入分类、供应商、商品、原材料、客户、订单（含订单项）、原材料采购
+以及对应的库存调整流水，相同的 seed 生成完全相同的数据：
+
+    - 商品名称由中文词组合而成，SKU 按拼音首字母从 SKU 序列分配（与商品添加页一致）；
+    - 商品热度服从 Zipf 分布（zipf 为指数，0 表示均匀），少数商品占大部分销量；
+    - 订单和采购按时间顺序生成，分布在最近 days 天内；
+    - 每个商品 / 原材料先写一条期初库存流水，之后每笔销售出库（已取消订单除外）和
+      采购入库都写一条 StockAdjustment，库存不足时先补货入库，流水前后数量逐条衔接，
+      最终库存等于流水累计值。
+
+所有数据用 Core insert() 的 executemany 分块写入、分块提交，主键在写入前按当前最大 ID 顺序分配，
+订单和订单项不需要逐行取回自增 ID。写入完成后重建销售日汇总、原材料采购月汇总和商品检索索引。
+"""
+import random
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import func, insert, select, update
+
+from models import (
+    db, Category, Customer, Order, OrderItem, Product, RawMaterial, RawMaterialPurchase, StockAdjustment,
+    Supplier, month_key, order_number_allocator
+)
+from rollups import CANCELLED_STATUS, rebuild_material_cost_rollup, rebuild_sales_rollup
+
+# 每次批量 insert 并提交的行数
+SEED_CHUNK_SIZE = 10000
+
+# 写入库存调整流水时记录的操作者
+SEED_USER = 'seed'
+
+ORDER_STATUSES = ('待支付', '已支付', '已发货', '已完成', CANCELLED_STATUS)
+ORDER_STATUS_WEIGHTS = (10, 25, 15, 45, 5)
+PAYMENT_METHODS = ('支付宝', '微信支付', '货到付款', '银行转账', '其他')
+
+PRODUCT_SIZES = ('大号', '中号', '小号', '迷你', '加厚', '标准')
+PRODUCT_COLORS = ('红色', '蓝色', '黑色', '白色', '绿色', '金色', '银色', '灰色')
+PRODUCT_KINDS = ('圆珠笔', '笔记本', '保温杯', '文件夹', '订书机', '便签', '台灯', '鼠标', '键盘', '背包', '雨伞', '水杯')
+MATERIALS = (('塑料粒', '千克'), ('钢材', '千克'), ('棉布', '米'), ('纸张', '卷'), ('油墨', '升'), ('螺丝', '个'))
+CATEGORY_NAMES = ('文具', '办公设备', '生活用品', '数码配件', '箱包', '家居')
+
+
+def _next_id(model):
+    return (db.session.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def _insert_chunked(model, rows, chunk_size):
+    """分块批量插入并提交，rows 可以是生成器，返回插入的行数
+
+    直接对表执行 Core insert()（executemany），跳过 ORM 批量插入逐行整理参数的开销；
+    行字典需给出全部非空列（列默认值仍由 Core 填充）。
+    """
+    stmt = insert(model.__table__)
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            db.session.execute(stmt, chunk)
+            db.session.commit()
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(stmt, chunk)
+        db.session.commit()
+        count += len(chunk)
+    return count
+
+
+def _update_stock(model, stock, chunk_size):
+    """按主键批量写回最终库存"""
+    rows = [{'id': item_id, 'stock_quantity': quantity} for item_id, quantity in stock.items()]
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(update(model), rows[start:start + chunk_size])
+        db.session.commit()
+
+
+class _Popularity:
+    """按 Zipf 分布抽取 ID：随机打乱后第 k 名的权重为 1 / k^s"""
+
+    def __init__(self, ids, exponent, rng):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(self.ids) + 1)))
+        self.rng = rng
+
+    def pick(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return self.ids[min(bisect_left(self.cum_weights, point), len(self.ids) - 1)]
+
+
+class _Ledger:
+    """跟踪库存并生成前后数量逐条衔接的库存调整流水"""
+
+    def __init__(self, adjustment_type, key):
+        self.adjustment_type = adjustment_type
+        self.key = key
+        self.stock = {}
+        self.rows = []
+
+    def record(self, item_id, quantity, reason, when):
+        before = self.stock.get(item_id, 0)
+        after = round(before + quantity, 2)
+        self.stock[item_id] = after
+        self.rows.append({
+            'adjustment_date': when,
+            'adjustment_type': self.adjustment_type,
+            self.key: item_id,
+            'quantity_before': before,
+            'quantity_after': after,
+            'adjustment_quantity': quantity,
+            'reason': reason,
+            'created_by': SEED_USER,
+            'created_at': when,
+        })
+
+    def flush(self, chunk_size):
+        count = _insert_chunked(StockAdjustment, self.rows, chunk_size)
+        self.rows = []
+        return count
+
+
+def generate(categories=20, suppliers=50, products=1000, raw_materials=100, customers=1000,
+             orders=3000, lines_per_order=3, purchases=1000, days=365, zipf=1.1, seed=42,
+             chunk_size=SEED_CHUNK_SIZE, progress=None):
+    """生成合成数据，返回 {表名: 写入行数}
+
+    lines_per_order 为每个订单的平均订单项数（1 到 2 * lines_per_order - 1 均匀分布，
+    同一商品抽中多次时合并为一行）；progress(表名, 行数) 在每张表写完后回调。
+    """
+    from sku import allocate_skus
+
+    rng = random.Random(seed)  # nosec B311 - 生成测试数据
+    now = datetime.now().replace(microsecond=0)
+    start_time = now - timedelta(days=days)
+    counts = {}
+
+    def done(name, count):
+        counts[name] = count
+        if progress:
+            progress(name, count)
+
+    first = _next_id(Category)
+    done('categories', _insert_chunked(Category, ({
+        'id': first + i, 'name': f'{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]}{first + i}', 'description': ''
+    } for i in range(categories)), chunk_size))
+    category_ids = range(first, first + categories)
+
+    first = _next_id(Supplier)
+    done('suppliers', _insert_chunked(Supplier, ({
+        'id': first + i, 'name': f'合成供应商{first + i}', 'contact': f'联系人{i}',
+        'phone': f'138{rng.randrange(10 ** 8):08d}', 'address': ''
+    } for i in range(suppliers)), chunk_size))
+    supplier_ids = range(first, first + suppliers)
+
+    # 商品：每块先生成名称，再按拼音首字母一次分配整块的 SKU
+    first = _next_id(Product)
+    prices = {}
+    product_ledger = _Ledger('product', 'product_id')
+    product_count = 0
+    for start in range(0, products, chunk_size):
+        rows = []
+        for product_id in range(first + start, first + min(start + chunk_size, products)):
+            cost = round(rng.uniform(1, 200), 2)
+            prices[product_id] = round(cost * rng.uniform(1.1, 2.0), 2)
+            rows.append({
+                'id': product_id,
+                'name': rng.choice(PRODUCT_SIZES) + rng.choice(PRODUCT_COLORS) + rng.choice(PRODUCT_KINDS),
+                'description': '', 'selling_price': prices[product_id], 'cost_price': cost,
+                'stock_quantity': 0, 'category_id': rng.choice(category_ids),
+                'supplier_id': rng.choice(supplier_ids), 'created_at': start_time, 'updated_at': start_time,
+            })
+        for row, sku in zip(rows, allocate_skus([row['name'] for row in rows])):
+            row['sku'] = sku
+        product_count += _insert_chunked(Product, rows, chunk_size)
+        for row in rows:
+            product_ledger.record(row['id'], rng.randint(100, 1000), '期初库存', start_time)
+    done('products', product_count)
+    popularity = _Popularity(range(first, first + products), zipf, rng)
+
+    first = _next_id(RawMaterial)
+    units = {}
+    material_ledger = _Ledger('raw_material', 'raw_material_id')
+
+    def material_rows():
+        for material_id in range(first, first + raw_materials):
+            name, unit = rng.choice(MATERIALS)
+            units[material_id] = unit
+            material_ledger.record(material_id, round(rng.uniform(0, 1000), 2), '期初库存', start_time)
+            yield {
+                'id': material_id, 'name': f'{name}{material_id}', 'unit': unit, 'stock_quantity': 0,
+                'unit_cost': round(rng.uniform(0.5, 50), 2), 'safety_stock': rng.choice((0, 10, 50)),
+                'supplier_id': rng.choice(supplier_ids), 'created_at': start_time, 'updated_at': start_time,
+            }
+    done('raw_materials', _insert_chunked(RawMaterial, material_rows(), chunk_size))
+    material_ids = range(first, first + raw_materials)
+
+    first = _next_id(Customer)
+    done('customers', _insert_chunked(Customer, ({
+        'id': first + i, 'name': f'合成客户{first + i}', 'contact': '',
+        'phone': f'139{rng.randrange(10 ** 8):08d}', 'address': ''
+    } for i in range(customers)), chunk_size))
+    customer_ids = range(first, first + customers)
+
+    # 订单按时间顺序分块生成：订单 -> 订单项 -> 库存流水
+    step = days * 86400 / max(orders, 1)
+    order_id = _next_id(Order)
+    item_id = _next_id(OrderItem)
+    order_count = item_count = ledger_count = 0
+    for start in range(0, orders, chunk_size):
+        order_rows, item_rows = [], []
+        for index in range(start, min(start + chunk_size, orders)):
+            order_date = start_time + timedelta(seconds=int((index + rng.random()) * step))
+            lines = {}
+            for _ in range(rng.randint(1, 2 * lines_per_order - 1)):
+                product_id = popularity.pick()
+                lines[product_id] = lines.get(product_id, 0) + rng.randint(1, 5)
+            total = 0.0
+            for product_id, quantity in lines.items():
+                subtotal = round(quantity * prices[product_id], 2)
+                total += subtotal
+                item_rows.append({
+                    'id': item_id, 'order_id': order_id, 'product_id': product_id, 'quantity': quantity,
+                    'unit_price': prices[product_id], 'subtotal': subtotal, 'created_at': order_date,
+                })
+                item_id += 1
+            order_rows.append({
+                'id': order_id, 'order_date': order_date, 'customer_id': rng.choice(customer_ids),
+                'total_amount': round(total, 2),
+                'status': rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0],
+                'payment_method': rng.choice(PAYMENT_METHODS), 'notes': '',
+                'created_at': order_date, 'updated_at': order_date,
+            })
+            order_id += 1
+
+        # 订单号按订单日期从当天的序列中分配
+        by_day = {}
+        for row in order_rows:
+            by_day.setdefault(row['order_date'].strftime('%Y%m%d'), []).append(row)
+        connection = db.session.connection()
+        for day, rows in by_day.items():
+            for row, number in zip(rows, order_number_allocator.allocate(connection, len(rows), day=day)):
+                row['order_number'] = number
+
+        orders_by_id = {row['id']: row for row in order_rows}
+        for item in item_rows:
+            order = orders_by_id[item['order_id']]
+            if order['status'] == CANCELLED_STATUS:
+                continue
+            product_id, quantity = item['product_id'], item['quantity']
+            if product_ledger.stock[product_id] < quantity:
+                product_ledger.record(product_id, max(quantity, 500), '补货入库', order['order_date'])
+            product_ledger.record(product_id, -quantity, f"销售出库: 订单 {order['order_number']}", order['order_date'])
+
+        order_count += _insert_chunked(Order, order_rows, chunk_size)
+        item_count += _insert_chunked(OrderItem, item_rows, chunk_size)
+        ledger_count += product_ledger.flush(chunk_size)
+    done('orders', order_count)
+    done('order_items', item_count)
+
+    step = days * 86400 / max(purchases, 1)
+    first_purchase = _next_id(RawMaterialPurchase)
+
+    def purchase_rows():
+        for index in range(purchases):
+            material_id = rng.choice(material_ids)
+            quantity = round(rng.uniform(1, 500), 2)
+            unit_price = round(rng.uniform(0.5, 50), 2)
+            purchase_date = start_time + timedelta(seconds=int((index + rng.random()) * step))
+            material_ledger.record(material_id, quantity, f'采购入库：{quantity} {units[material_id]}', purchase_date)
+            yield {
+                'id': first_purchase + index, 'purchase_date': purchase_date,
+                'raw_material_id': material_id, 'supplier_id': rng.choice(supplier_ids),
+                'quantity': quantity, 'unit_price': unit_price,
+                'total_price': round(quantity * unit_price, 2), 'purchase_month': month_key(purchase_date),
+                'created_at': purchase_date,
+            }
+    done('raw_material_purchases', _insert_chunked(RawMaterialPurchase, purchase_rows(), chunk_size))
+    ledger_count += product_ledger.flush(chunk_size) + material_ledger.flush(chunk_size)
+    done('stock_adjustments', ledger_count)
+
+    # 最终库存等于流水累计值
+    _update_stock(Product, product_ledger.stock, chunk_size)
+    _update_stock(RawMaterial, material_ledger.stock, chunk_size)
+
+    # 批量插入绕过了 ORM 事件，统一重建派生数据
+    from search import rebuild_search_index
+    rebuild_sales_rollup()
+    rebuild_material_cost_rollup()
+    rebuild_search_index()
+    db.session.commit()
+    return counts
@@ -0,0 +1,108 @@
+"""自动生成 SKU
+
+格式为 名称拼音首字母 + '-' + 序号（至少 6 位，左补 0），例如 红色笔 -> HSB-000001。
+每个前缀的序号保存在 sku_sequences 表中，分配时在调用方的事务内原子地推进，
+同一批次内同前缀的多个商品只需一条语句，不依赖唯一约束报错后重试。
+
+    - 某个前缀第一次分配时，从 products 中已有的同前缀 SKU（例如旧的时间戳 SKU）
+      的最大序号之后开始；
+    - 手工录入或修改的 SKU 如果符合 前缀-数字 的格式，写入时同步登记到序列，
+      之后不会再分配到它；
+    - 升级已有数据库时 flask upgrade-db 调用 sync_sku_sequences 一次性登记全部已有 SKU。
+"""
+import re
+from itertools import groupby
+
+from sqlalchemy import event, inspect, select
+
+from models import db, Product, SkuSequence, advance_sequence
+from search import pinyin_initials
+
+SKU_SUFFIX_WIDTH = 6
+
+# 名称中没有可转换字符时使用的前缀
+DEFAULT_PREFIX = 'SKU'
+
+_SKU_PATTERN = re.compile(r'^(.+)-(\d+)$')
+
+
+def sku_prefix(name):
+    """商品名称对应的 SKU 前缀"""
+    return pinyin_initials(name) or DEFAULT_PREFIX
+
+
+def format_sku(prefix, value):
+    return f'{prefix}-{value:0{SKU_SUFFIX_WIDTH}d}'
+
+
+def _existing_max(connection, prefix):
+    """products 中 前缀-数字 格式 SKU 的最大序号（按 SKU 范围查询，可走唯一索引）"""
+    skus = connection.execute(
+        select(Product.sku).where(Product.sku >= f'{prefix}-', Product.sku < f'{prefix}.')
+    ).scalars()
+    values = [int(match.group(2)) for match in map(_SKU_PATTERN.match, skus)
+              if match and match.group(1) == prefix]
+    return max(values, default=0)
+
+
+def _reserve(connection, prefix, count):
+    """为前缀预留 count 个序号，返回区间的第一个序号"""
+    table = SkuSequence.__table__
+    end = advance_sequence(connection, table, prefix, count)
+    if end == count:
+        # 序列行刚创建：跳过已有数据中的序号（同一事务内持有序列行的锁，不会与并发分配交错）
+        existing = _existing_max(connection, prefix)
+        if existing:
+            end = advance_sequence(connection, table, prefix, at_least=existing + count)
+    return end - count + 1
+
+
+def allocate_skus(names, connection=None):
+    """按商品名称批量分配 SKU（在当前事务内，未提交），按输入顺序返回"""
+    connection = connection or db.session.connection()
+    prefixes = [sku_prefix(name) for name in names]
+    skus = [None] * len(prefixes)
+    order = sorted(range(len(prefixes)), key=prefixes.__getitem__)
+    for prefix, group in groupby(order, key=prefixes.__getitem__):
+        positions = list(group)
+        start = _reserve(connection, prefix, len(positions))
+        for offset, position in enumerate(positions):
+            skus[position] = format_sku(prefix, start + offset)
+    return skus
+
+
+def allocate_sku(name, connection=None):
+    """为单个商品名称分配 SKU"""
+    return allocate_skus([name], connection)[0]
+
+
+def record_sku(connection, sku):
+    """登记一个已写入的 SKU，使序列不会再分配到它"""
+    match = _SKU_PATTERN.match(sku or '')
+    if match:
+        advance_sequence(connection, SkuSequence.__table__, match.group(1), at_least=int(match.group(2)))
+
+
+def sync_sku_sequences(connection=None):
+    """根据已有商品把每个前缀的序列推进到不小于已用的最大序号，返回登记的前缀数"""
+    connection = connection or db.session.connection()
+    latest = {}
+    for sku in connection.execute(select(Product.sku).where(Product.sku.is_not(None))).scalars():
+        match = _SKU_PATTERN.match(sku)
+        if match:
+            prefix, value = match.group(1), int(match.group(2))
+            latest[prefix] = max(latest.get(prefix, 0), value)
+    for prefix, value in latest.items():
+        advance_sequence(connection, SkuSequence.__table__, prefix, at_least=value)
+    return len(latest)
+
+
+@event.listens_for(Product, 'after_insert')
+def _record_inserted_sku(mapper, connection, target):
+    record_sku(connection, target.sku)
+
+
+@event.listens_for(Product, 'after_update')
+def _record_updated_sku(mapper, connection, target):
+    if inspect(target).attrs.sku.history.has_changes():
+        record_sku(connection, target.sku)
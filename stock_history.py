@@ -0,0 +1,227 @@
+"""历史库存：库存检查点 + 之后的库存调整
+
+StockAdjustment 是只追加的库存流水，每个订单项、编辑、取消、采购都会写入一行。
+直接回放全部流水才能得到"某天的库存"，流水越长越慢。StockCheckpoint 按月记录每个
+商品 / 原材料在月初 0 点的库存（只为上个月有流水的对象写入），于是
+
+    某一时刻的库存 = 不晚于该时刻的最近检查点 + 检查点之后、该时刻之前的调整之和
+
+只需读一个检查点和最多约一个月的流水（都走索引）。没有检查点的对象从第一条流水的
+quantity_before 开始累加；没有任何流水的对象视为库存一直是当前值。
+
+流水归档（flask archive，见 archive.py）后，旧流水在 archived_stock_adjustments 中，
+这里的查询和回放同时读取在线表与归档表；归档前会先为归档范围建好检查点，
+归档范围之后的查询只会读到在线表中的流水。
+
+检查点由 flask build-stock-checkpoints 建立（只处理已结束的月份，可反复执行，只补新的月份；
+建议每月初由 cron 执行），flask verify-stock-checkpoints 从头回放流水核对全部检查点，
+并核对"检查点 + 调整"推算出的当前库存与库存字段是否一致。
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, union_all
+
+from models import db, Product, RawMaterial, StockAdjustment, ArchivedStockAdjustment, StockCheckpoint
+
+# 每次批量插入的检查点行数
+CHECKPOINT_CHUNK_SIZE = 5000
+
+# 浮点库存（原材料）比较时允许的误差
+QUANTITY_TOLERANCE = 1e-6
+
+# adjustment_type -> 库存对象模型
+ITEM_TYPES = {
+    'product': Product,
+    'raw_material': RawMaterial,
+}
+
+# 库存流水：在线表与归档表，列相同
+LEDGERS = (StockAdjustment, ArchivedStockAdjustment)
+
+
+def _item_column(ledger, item_type):
+    """流水表中指向库存对象的列"""
+    return ledger.product_id if item_type == 'product' else ledger.raw_material_id
+
+CheckpointMismatch = namedtuple('CheckpointMismatch', 'item_type item_id checkpoint_at expected actual')
+
+
+def month_start(moment):
+    """moment 所在月份第一天 0 点"""
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month_start(moment):
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+
+def stock_as_of_column(item_type, at):
+    """库存对象在 at 时刻（不含）的库存数量的 SQL 表达式，与外层查询中的对象表（商品 / 原材料）相关联"""
+    model = ITEM_TYPES[item_type]
+    latest = select(StockCheckpoint.checkpoint_at, StockCheckpoint.quantity).where(
+        StockCheckpoint.item_type == item_type,
+        StockCheckpoint.item_id == model.id,
+        StockCheckpoint.checkpoint_at <= at
+    ).order_by(StockCheckpoint.checkpoint_at.desc()).limit(1)
+    # 嵌套在 delta 子查询中，需显式关联到最外层的对象表
+    checkpoint_at = latest.with_only_columns(StockCheckpoint.checkpoint_at).correlate(model).scalar_subquery()
+    checkpoint_quantity = latest.with_only_columns(StockCheckpoint.quantity).scalar_subquery()
+
+    def first_before(ledger):
+        return select(ledger.quantity_before).where(
+            ledger.adjustment_type == item_type,
+            _item_column(ledger, item_type) == model.id
+        ).order_by(ledger.adjustment_date, ledger.id).limit(1).scalar_subquery()
+
+    def delta(ledger):
+        return select(func.coalesce(func.sum(ledger.adjustment_quantity), 0)).where(
+            ledger.adjustment_type == item_type,
+            _item_column(ledger, item_type) == model.id,
+            ledger.adjustment_date >= func.coalesce(checkpoint_at, datetime.min),
+            ledger.adjustment_date < at
+        ).scalar_subquery()
+
+    # 没有检查点时从第一条流水的 quantity_before 起算（归档的流水总是早于在线流水）
+    start = func.coalesce(
+        checkpoint_quantity, first_before(ArchivedStockAdjustment), first_before(StockAdjustment), model.stock_quantity
+    )
+    return start + delta(StockAdjustment) + delta(ArchivedStockAdjustment)
+
+
+def stock_as_of(item_type, item_ids, at):
+    """指定对象在 at 时刻（不含）的库存，返回 {id: 数量}"""
+    model = ITEM_TYPES[item_type]
+    return dict(db.session.execute(
+        select(model.id, stock_as_of_column(item_type, at)).where(model.id.in_(list(item_ids)))
+    ).all())
+
+
+def _latest_checkpoints():
+    """每个对象最近一个检查点的数量 {(类型, id): 数量}"""
+    latest = select(
+        StockCheckpoint.item_type, StockCheckpoint.item_id,
+        func.max(StockCheckpoint.checkpoint_at).label('checkpoint_at')
+    ).group_by(StockCheckpoint.item_type, StockCheckpoint.item_id).subquery()
+    rows = db.session.execute(
+        select(StockCheckpoint.item_type, StockCheckpoint.item_id, StockCheckpoint.quantity).join(
+            latest,
+            (latest.c.item_type == StockCheckpoint.item_type)
+            & (latest.c.item_id == StockCheckpoint.item_id)
+            & (latest.c.checkpoint_at == StockCheckpoint.checkpoint_at)
+        )
+    )
+    return {(item_type, item_id): quantity for item_type, item_id, quantity in rows}
+
+
+def _replay(since, until, base):
+    """按对象回放 [since, until) 内的流水（在线表与归档表），逐个产出 (类型, id, 检查点时刻, 数量)
+
+    base 为回放起点的库存 {(类型, id): 数量}，不在其中的对象从第一条流水的 quantity_before 开始。
+    每个有流水的月份结束时产出一个检查点（时刻为次月第一天 0 点）。
+    """
+    parts = []
+    for ledger in LEDGERS:
+        part = select(
+            ledger.adjustment_type, func.coalesce(ledger.product_id, ledger.raw_material_id).label('item_id'),
+            ledger.adjustment_date, ledger.id, ledger.quantity_before, ledger.adjustment_quantity
+        ).where(
+            ledger.adjustment_type.in_(list(ITEM_TYPES)),
+            ledger.adjustment_date < until
+        )
+        if since is not None:
+            part = part.where(ledger.adjustment_date >= since)
+        parts.append(part)
+    rows = union_all(*parts).subquery()
+    query = select(
+        rows.c.adjustment_type, rows.c.item_id, rows.c.adjustment_date,
+        rows.c.quantity_before, rows.c.adjustment_quantity
+    ).order_by(
+        rows.c.adjustment_type, rows.c.item_id, rows.c.adjustment_date, rows.c.id
+    )
+
+    key, quantity, pending = None, None, None
+    for item_type, current_id, adjusted_at, quantity_before, change in db.session.execute(
+        query.execution_options(yield_per=CHECKPOINT_CHUNK_SIZE)
+    ):
+        if (item_type, current_id) != key:
+            if pending is not None:
+                yield key + (pending, quantity)
+            key, pending = (item_type, current_id), None
+            quantity = base.get(key, quantity_before)
+        boundary = next_month_start(adjusted_at)
+        if pending is not None and boundary != pending:
+            yield key + (pending, quantity)
+        quantity += change
+        pending = boundary
+    if pending is not None:
+        yield key + (pending, quantity)
+
+
+def build_checkpoints(until=None, rebuild=False):
+    """为 until（默认当前时刻）所在月份之前已结束的月份补建检查点，返回新建的行数
+
+    增量执行：从已有的最近检查点时刻起回放流水，rebuild=True 时清空后从头重建。
+    在当前事务内执行，不提交。
+    """
+    until = month_start(until or datetime.now())
+    if rebuild:
+        db.session.execute(delete(StockCheckpoint))
+    since = db.session.scalar(select(func.max(StockCheckpoint.checkpoint_at)))
+    if since is not None and since >= until:
+        return 0
+    base = _latest_checkpoints() if since is not None else {}
+
+    table = StockCheckpoint.__table__
+    now = datetime.now()
+    created, batch = 0, []
+    for item_type, item_id, checkpoint_at, quantity in _replay(since, until, base):
+        batch.append({'item_type': item_type, 'item_id': item_id, 'checkpoint_at': checkpoint_at,
+                      'quantity': quantity, 'created_at': now})
+        if len(batch) >= CHECKPOINT_CHUNK_SIZE:
+            db.session.execute(insert(table), batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(table), batch)
+        created += len(batch)
+    return created
+
+
+def verify_checkpoints():
+    """从头回放流水核对检查点，并核对推算出的当前库存
+
+    返回 (核对的检查点数, 检查点不一致列表, 当前库存不一致列表)，列表元素为 CheckpointMismatch
+    （缺失的检查点 actual 为 None；当前库存不一致时 checkpoint_at 为 None，
+    expected 为检查点 + 调整推算出的数量，actual 为库存字段）。
+    """
+    stored = {
+        (item_type, item_id, checkpoint_at): quantity
+        for item_type, item_id, checkpoint_at, quantity in db.session.execute(select(
+            StockCheckpoint.item_type, StockCheckpoint.item_id,
+            StockCheckpoint.checkpoint_at, StockCheckpoint.quantity
+        ))
+    }
+    checked = len(stored)
+    last = max((key[2] for key in stored), default=None)
+    mismatches = []
+    if last is not None:
+        for item_type, item_id, checkpoint_at, expected in _replay(None, last, {}):
+            actual = stored.pop((item_type, item_id, checkpoint_at), None)
+            if actual is None or abs(actual - expected) > QUANTITY_TOLERANCE:
+                mismatches.append(CheckpointMismatch(item_type, item_id, checkpoint_at, expected, actual))
+        # 回放中不存在的检查点（对应月份没有流水）
+        mismatches.extend(
+            CheckpointMismatch(item_type, item_id, checkpoint_at, None, actual)
+            for (item_type, item_id, checkpoint_at), actual in stored.items()
+        )
+
+    stock_mismatches = []
+    for item_type in ITEM_TYPES:
+        model = ITEM_TYPES[item_type]
+        for item_id, expected, actual in db.session.execute(
+            select(model.id, stock_as_of_column(item_type, datetime.max), model.stock_quantity).order_by(model.id)
+        ):
+            if abs(expected - (actual or 0)) > QUANTITY_TOLERANCE:
+                stock_mismatches.append(CheckpointMismatch(item_type, item_id, None, expected, actual))
+    return checked, mismatches, stock_mismatches
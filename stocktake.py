@@ -0,0 +1,210 @@
+"""库存盘点
+
+上传实盘文件（CSV，表头 type,sku,name,counted_quantity）：
+
+    type              product（默认）或 raw_material，也可写 商品 / 原材料
+    sku               商品按 SKU 匹配
+    name              原材料没有 SKU，按名称匹配（名称重复的原材料无法匹配）
+    counted_quantity  实盘数量，商品须为非负整数
+
+上传后解析为盘点单（StocktakeSession + StocktakeLine，批量插入），预览页用一条
+关联查询计算每一项的差异；确认后在同一事务内：
+
+    1. 按类型各用一条查询取出实盘数与当前库存不一致的明细；
+    2. 以主键批量 UPDATE 把库存设为实盘数；
+    3. 批量 insert() 写入全部 StockAdjustment。
+
+差异以确认时的库存为准，预览之后发生的出入库不会被重复计算。
+"""
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import case, func, insert, select, update
+
+from models import db, Product, RawMaterial, StockAdjustment, StocktakeSession, StocktakeLine
+
+PRODUCT = 'product'
+RAW_MATERIAL = 'raw_material'
+_TYPE_ALIASES = {'': PRODUCT, 'product': PRODUCT, '商品': PRODUCT, 'raw_material': RAW_MATERIAL, '原材料': RAW_MATERIAL}
+
+STATUS_PENDING = '待确认'
+STATUS_APPLIED = '已应用'
+STATUS_CANCELLED = '已取消'
+
+# 按 SKU / 名称批量查找时每条 IN 查询的参数个数
+LOOKUP_CHUNK_SIZE = 5000
+
+# 预览页最多列出的差异行数（按差异绝对值降序）
+PREVIEW_LIMIT = 200
+
+
+class StocktakeError(ValueError):
+    """盘点文件无法解析，或盘点单状态不允许该操作"""
+
+
+def parse_counts(content):
+    """解析盘点 CSV，返回 ([(行号, 类型, 匹配键, 数量), ...], [(行号, 错误), ...])"""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise StocktakeError('文件必须是 UTF-8 编码的 CSV')
+    reader = csv.DictReader(io.StringIO(content))
+    if not reader.fieldnames or 'counted_quantity' not in reader.fieldnames:
+        raise StocktakeError('CSV 表头需包含 type,sku,name,counted_quantity')
+
+    entries, errors = [], []
+    for row in reader:
+        line_no = reader.line_num
+        item_type = _TYPE_ALIASES.get((row.get('type') or '').strip())
+        if item_type is None:
+            errors.append((line_no, f"未知类型: {row.get('type')}"))
+            continue
+        key = (row.get('sku') if item_type == PRODUCT else row.get('name')) or ''
+        key = key.strip()
+        if not key:
+            errors.append((line_no, '商品缺少 sku' if item_type == PRODUCT else '原材料缺少 name'))
+            continue
+        try:
+            quantity = float(row.get('counted_quantity'))
+        except (TypeError, ValueError):
+            errors.append((line_no, f"实盘数量无效: {row.get('counted_quantity')}"))
+            continue
+        if quantity < 0 or (item_type == PRODUCT and not quantity.is_integer()):
+            errors.append((line_no, f'实盘数量无效: {quantity:g}'))
+            continue
+        entries.append((line_no, item_type, key, quantity))
+    return entries, errors
+
+
+def _lookup(column, id_column, keys):
+    """按 IN 分块查找，返回 {键: [id, ...]}"""
+    keys = list(keys)
+    found = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        for item_id, key in db.session.execute(select(id_column, column).where(column.in_(chunk))):
+            found.setdefault(key, []).append(item_id)
+    return found
+
+
+def create_session(content, filename, created_by):
+    """解析上传文件并创建待确认的盘点单（未提交），返回 (盘点单或 None, 逐行错误)"""
+    entries, errors = parse_counts(content)
+    products = _lookup(Product.sku, Product.id, {key for _, t, key, _ in entries if t == PRODUCT})
+    materials = _lookup(RawMaterial.name, RawMaterial.id, {key for _, t, key, _ in entries if t == RAW_MATERIAL})
+
+    lines, seen = [], set()
+    for line_no, item_type, key, quantity in entries:
+        ids = (products if item_type == PRODUCT else materials).get(key, [])
+        if not ids:
+            errors.append((line_no, f"{'SKU' if item_type == PRODUCT else '原材料'} {key} 不存在"))
+            continue
+        if len(ids) > 1:
+            errors.append((line_no, f'原材料名称 {key} 不唯一'))
+            continue
+        if (item_type, ids[0]) in seen:
+            errors.append((line_no, f'{key} 重复出现，已忽略'))
+            continue
+        seen.add((item_type, ids[0]))
+        lines.append({
+            'item_type': item_type,
+            'product_id': ids[0] if item_type == PRODUCT else None,
+            'raw_material_id': ids[0] if item_type == RAW_MATERIAL else None,
+            'counted_quantity': quantity,
+        })
+
+    errors.sort()
+    if not lines:
+        return None, errors
+
+    session = StocktakeSession(
+        status=STATUS_PENDING, filename=filename, line_count=len(lines), created_by=created_by
+    )
+    db.session.add(session)
+    db.session.flush()
+    for line in lines:
+        line['session_id'] = session.id
+    db.session.execute(insert(StocktakeLine), lines)
+    return session, errors
+
+
+def _difference_select(session_id):
+    """盘点明细与当前库存的差异（一条查询同时关联商品和原材料）"""
+    current = func.coalesce(Product.stock_quantity, RawMaterial.stock_quantity)
+    difference = StocktakeLine.counted_quantity - current
+    return select(
+        StocktakeLine.item_type,
+        func.coalesce(Product.name, RawMaterial.name).label('name'),
+        Product.sku,
+        RawMaterial.unit,
+        StocktakeLine.counted_quantity,
+        current.label('current_quantity'),
+        difference.label('difference')
+    ).outerjoin(
+        Product, Product.id == StocktakeLine.product_id
+    ).outerjoin(
+        RawMaterial, RawMaterial.id == StocktakeLine.raw_material_id
+    ).where(StocktakeLine.session_id == session_id)
+
+
+def preview(session_id, limit=PREVIEW_LIMIT):
+    """返回 (汇总, 差异最大的 limit 行)"""
+    differences = _difference_select(session_id).subquery()
+    summary = db.session.execute(select(
+        func.count().label('lines'),
+        func.coalesce(func.sum(case((differences.c.difference != 0, 1), else_=0)), 0).label('changed'),
+        func.coalesce(func.sum(case((differences.c.difference > 0, differences.c.difference), else_=0)), 0).label('gain'),
+        func.coalesce(func.sum(case((differences.c.difference < 0, differences.c.difference), else_=0)), 0).label('loss'),
+    )).one()
+    rows = db.session.execute(
+        select(differences)
+        .where(differences.c.difference != 0)
+        .order_by(func.abs(differences.c.difference).desc(), differences.c.name)
+        .limit(limit)
+    ).all()
+    return summary, rows
+
+
+def apply_session(session, created_by):
+    """把盘点单写入库存（在当前事务内执行，不提交），返回调整的条目数"""
+    # 带条件地认领盘点单，重复提交或并发确认只有一次生效
+    claimed = db.session.execute(
+        update(StocktakeSession)
+        .where(StocktakeSession.id == session.id, StocktakeSession.status == STATUS_PENDING)
+        .values(status=STATUS_APPLIED, applied_at=datetime.now())
+    ).rowcount
+    if not claimed:
+        raise StocktakeError(f'盘点单状态为 {session.status}，不能应用')
+
+    reason = f'库存盘点: 盘点单 #{session.id}'
+    adjustments = []
+    for item_type, model, foreign_key in (
+        (PRODUCT, Product, StocktakeLine.product_id),
+        (RAW_MATERIAL, RawMaterial, StocktakeLine.raw_material_id),
+    ):
+        rows = db.session.execute(
+            select(model.id, model.stock_quantity, StocktakeLine.counted_quantity)
+            .join(StocktakeLine, foreign_key == model.id)
+            .where(StocktakeLine.session_id == session.id, model.stock_quantity != StocktakeLine.counted_quantity)
+            .with_for_update(of=model)
+        ).all()
+        if not rows:
+            continue
+        cast = int if item_type == PRODUCT else float
+        db.session.execute(update(model), [{'id': r.id, 'stock_quantity': cast(r.counted_quantity)} for r in rows])
+        adjustments.extend({
+            'adjustment_type': item_type,
+            'product_id': r.id if item_type == PRODUCT else None,
+            'raw_material_id': r.id if item_type == RAW_MATERIAL else None,
+            'quantity_before': r.stock_quantity,
+            'quantity_after': r.counted_quantity,
+            'adjustment_quantity': r.counted_quantity - r.stock_quantity,
+            'reason': reason,
+            'created_by': created_by,
+        } for r in rows)
+
+    if adjustments:
+        db.session.execute(insert(StockAdjustment), adjustments)
+    return len(adjustments)
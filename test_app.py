@@ -11,7 +11,8 @@ def app():
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
         "WTF_CSRF_ENABLED": False,  # 测试时关闭 CSRF
         "LOGIN_DISABLED": False,
-        "SECRET_KEY": "test_secret"
+        "SECRET_KEY": "test_secret",
+        "STRICT_LOADING": True,  # 未预加载的关系访问直接报错
     })
     with app.app_context():
         db.drop_all()
@@ -20,6 +21,10 @@ def app():
         user = User(username="admin", password_hash=generate_password_hash("admin"), role="admin")
         db.session.add(user)
         db.session.commit()
+    # 进程内缓存不能跨测试复用（每个测试重建数据库）
+    from report_cache import report_cache
+    report_cache.invalidate()
+    report_cache.reset_stats()
     yield app
 
 @pytest.fixture
@@ -99,3 +104,1122 @@ def test_api_products(client):
     login(client, "admin", "admin")
     resp = client.get("/api/products")
     assert resp.status_code in (200, 401, 403)  # 视权限和实现而定
+
+def test_create_indexes_command(app, runner):
+    # 删除一个索引后，命令应能在不重建表的情况下补建
+    with app.app_context():
+        db.session.execute(db.text("DROP INDEX IF EXISTS ix_orders_order_date_id"))
+        db.session.commit()
+    result = runner.invoke(args=["create-indexes"])
+    assert result.exit_code == 0
+    assert "ix_orders_order_date_id" in result.output
+    with app.app_context():
+        names = {ix["name"] for ix in db.inspect(db.engine).get_indexes("orders")}
+        assert {"ix_orders_order_date_id", "ix_orders_status_order_date"} <= names
+    # 再次执行不会重复创建
+    result = runner.invoke(args=["create-indexes"])
+    assert "新建 0 个" in result.output
+
+def _seed_catalog(app, product_count, stock=1000):
+    """创建一个分类、一个客户和若干商品，返回 (customer_id, [product_id, ...])"""
+    from models import Category, Customer, Product
+    with app.app_context():
+        category = Category(name="测试分类", description="")
+        customer = Customer(name="测试客户", contact="", phone="", address="")
+        db.session.add_all([category, customer])
+        db.session.flush()
+        products = [
+            Product(name=f"商品{i}", sku=f"SKU-{i}", description="", selling_price=10.0,
+                    cost_price=5.0, stock_quantity=stock, category_id=category.id)
+            for i in range(product_count)
+        ]
+        db.session.add_all(products)
+        db.session.commit()
+        return customer.id, [p.id for p in products]
+
+def _order_form(customer_id, product_ids, quantity=1, status="待支付"):
+    return {
+        "order_date": "2026-01-01",
+        "customer_id": customer_id,
+        "status": status,
+        "payment_method": "现金",
+        "notes": "",
+        "product_id[]": [str(pid) for pid in product_ids],
+        "quantity[]": [str(quantity)] * len(product_ids),
+        "unit_price[]": ["10.0"] * len(product_ids),
+    }
+
+def _count_product_selects(app, fn):
+    """统计 fn 执行期间加载 Product 实体（整行）的 SELECT 语句数"""
+    from sqlalchemy import event
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return sum(1 for s in statements if s.lstrip().upper().startswith("SELECT") and "products.name" in s)
+
+def test_order_add_product_lookup_is_batched(app, client):
+    customer_id, product_ids = _seed_catalog(app, 40)
+    login(client, "admin", "admin")
+    few = _count_product_selects(app, lambda: client.post("/order/add", data=_order_form(customer_id, product_ids[:2])))
+    many = _count_product_selects(app, lambda: client.post("/order/add", data=_order_form(customer_id, product_ids)))
+    # 订单项从 2 增加到 40，商品查询次数不随行数增长
+    assert few >= 1 and many == few
+    from models import Order
+    with app.app_context():
+        assert Order.query.count() == 2
+
+def test_order_edit_rejects_foreign_item(app, client):
+    from models import Order, OrderItem
+    customer_id, product_ids = _seed_catalog(app, 3)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids[:1]))
+    client.post("/order/add", data=_order_form(customer_id, product_ids[1:2]))
+    with app.app_context():
+        first, second = Order.query.order_by(Order.id).all()
+        foreign_item_id = OrderItem.query.filter_by(order_id=second.id).first().id
+        first_id = first.id
+    data = _order_form(customer_id, product_ids[:1])
+    data["item_id[]"] = [str(foreign_item_id)]
+    resp = client.post(f"/order/edit/{first_id}", data=data, follow_redirects=True)
+    assert "不属于当前订单" in resp.get_data(as_text=True)
+
+def test_concurrent_orders_never_oversell(app):
+    # 多线程同时对同一商品下单：库存不能为负，成功扣减数量与库存变化一致
+    import threading
+    from models import Order, Product, StockAdjustment
+    initial_stock = 15
+    customer_id, (product_id,) = _seed_catalog(app, 1, stock=initial_stock)
+    app.config["STOCK_RETRY_ATTEMPTS"] = 10
+    threads_count, orders_per_thread = 6, 5
+    errors = []
+
+    def worker():
+        client = app.test_client()
+        login(client, "admin", "admin")
+        for _ in range(orders_per_thread):
+            try:
+                client.post("/order/add", data=_order_form(customer_id, [product_id]))
+            except Exception as e:  # 记录并在主线程断言
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    with app.app_context():
+        stock = db.session.get(Product, product_id).stock_quantity
+        sold = Order.query.count()
+        assert stock >= 0
+        assert sold == initial_stock - stock
+        assert sold == initial_stock  # 请求数多于库存，库存应恰好售罄
+        deducted = db.session.query(db.func.sum(StockAdjustment.adjustment_quantity)).scalar()
+        assert deducted == -initial_stock
+
+def test_concurrent_orders_today_skip_report_versions(app):
+    # 当天的订单不更新 report_versions，多个 worker 同时下单不会排队等同一行
+    import threading
+    from datetime import date, timedelta
+    from sqlalchemy import event
+    from models import Order, ReportVersion
+    customer_id, product_ids = _seed_catalog(app, 4)
+    app.config["STOCK_RETRY_ATTEMPTS"] = 10
+    today = date.today()
+    writes, errors = [], []
+    with app.app_context():
+        engine = db.engine
+
+    def listener(conn, cursor, statement, *args):
+        if ReportVersion.__tablename__ in statement and not statement.lstrip().upper().startswith("SELECT"):
+            writes.append(statement)
+
+    def worker(product_id):
+        client = app.test_client()
+        login(client, "admin", "admin")
+        form = _order_form(customer_id, [product_id])
+        form["order_date"] = today.isoformat()
+        for _ in range(3):
+            try:
+                client.post("/order/add", data=form)
+            except Exception as e:  # 记录并在主线程断言
+                errors.append(e)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        threads = [threading.Thread(target=worker, args=(pid,)) for pid in product_ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert not errors and not writes
+    with app.app_context():
+        assert Order.query.count() == 12
+        assert db.session.get(ReportVersion, today) is None
+
+    # 补录到过去日期的订单更新当天的版本号
+    client = app.test_client()
+    login(client, "admin", "admin")
+    form = _order_form(customer_id, product_ids[:1])
+    form["order_date"] = (today - timedelta(days=1)).isoformat()
+    client.post("/order/add", data=form)
+    with app.app_context():
+        assert db.session.get(ReportVersion, today - timedelta(days=1)).version == 1
+
+def test_order_cancel_and_restore_stock(app, client):
+    from models import Order, Product
+    customer_id, (product_id,) = _seed_catalog(app, 1, stock=3)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, [product_id], quantity=3))
+    with app.app_context():
+        order_id = Order.query.first().id
+        assert db.session.get(Product, product_id).stock_quantity == 0
+    client.post(f"/order/{order_id}/update_status", data={"status": "已取消"})
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock_quantity == 3
+    # 取消期间库存被其他订单占用后，恢复订单应因库存不足失败
+    client.post("/order/add", data=_order_form(customer_id, [product_id], quantity=1))
+    resp = client.post(f"/order/{order_id}/update_status", data={"status": "已支付"}, follow_redirects=True)
+    assert "库存不足" in resp.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Order, order_id).status == "已取消"
+        assert db.session.get(Product, product_id).stock_quantity == 2
+
+def test_order_delete_retries_lock_conflict(app, client, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import Session
+    from models import Order, Product
+    customer_id, (product_id,) = _seed_catalog(app, 1, stock=3)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, [product_id], quantity=2))
+    with app.app_context():
+        order_id = Order.query.first().id
+
+    # 第一次提交遇到锁冲突，整体回滚后重试成功
+    commit, failures = Session.commit, []
+    def flaky_commit(session):
+        if not failures:
+            failures.append(1)
+            raise OperationalError("COMMIT", {}, Exception("database is locked"))
+        commit(session)
+    monkeypatch.setattr(Session, "commit", flaky_commit)
+    resp = client.post(f"/order/delete/{order_id}", follow_redirects=True)
+    monkeypatch.undo()
+    assert failures and "订单删除成功" in resp.get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Order, order_id) is None
+        assert db.session.get(Product, product_id).stock_quantity == 3
+
+def test_keyset_pagination_walks_forward_and_back(app):
+    from models import Product
+    from pagination import keyset_paginate
+    _seed_catalog(app, 25)
+    with app.app_context():
+        keys = [Product.name, Product.id]
+        expected = [p.id for p in Product.query.order_by(Product.name, Product.id)]
+        seen, pages, cursor = [], [], None
+        while True:
+            page = keyset_paginate(Product.query, keys, 10, cursor=cursor, with_total=not pages)
+            pages.append(page)
+            seen.extend(p.id for p in page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        assert seen == expected
+        assert pages[0].total == 25 and pages[1].total is None
+        assert [len(p.items) for p in pages] == [10, 10, 5]
+        assert not pages[0].has_prev and pages[-1].has_prev
+        # 从最后一页往回翻，应回到第二页
+        back = keyset_paginate(Product.query, keys, 10, cursor=pages[-1].prev_cursor)
+        assert [p.id for p in back.items] == [p.id for p in pages[1].items]
+        assert back.has_next and back.has_prev
+        # 无效游标回到第一页
+        first = keyset_paginate(Product.query, keys, 10, cursor="not-a-cursor")
+        assert [p.id for p in first.items] == [p.id for p in pages[0].items]
+
+def test_list_views_cursor_mode(app, client):
+    customer_id, product_ids = _seed_catalog(app, 12)
+    login(client, "admin", "admin")
+    for pid in product_ids:
+        client.post("/order/add", data=_order_form(customer_id, [pid]))
+    for url in ("/order/list", "/product/list", "/purchase/list"):
+        resp = client.get(url + "?paging=cursor")
+        assert resp.status_code == 200
+    text = client.get("/order/list?paging=cursor").get_data(as_text=True)
+    assert "cursor=" in text and "共" not in text.split("pagination-container")[1]
+    text = client.get("/order/list?paging=cursor&count=1").get_data(as_text=True)
+    assert "共 12 条" in text
+
+def _sales_rollup_state(app):
+    from models import DailySalesRollup, DailyCustomerSales
+    with app.app_context():
+        lines = {
+            (r.day, r.product_id, r.customer_id): (r.quantity, round(r.amount, 2))
+            for r in DailySalesRollup.query.all() if r.quantity
+        }
+        orders = {
+            (r.day, r.customer_id): (r.order_count, round(r.amount, 2))
+            for r in DailyCustomerSales.query.all() if r.order_count
+        }
+        return lines, orders
+
+def test_sales_rollup_tracks_order_writes(app, client, runner):
+    from models import Order, OrderItem
+    customer_id, product_ids = _seed_catalog(app, 3)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids[:2], quantity=2))
+    client.post("/order/add", data=_order_form(customer_id, product_ids[1:], quantity=1))
+    with app.app_context():
+        first_id, second_id = [o.id for o in Order.query.order_by(Order.id)]
+        item_ids = [str(i.id) for i in OrderItem.query.filter_by(order_id=first_id).order_by(OrderItem.id)]
+    # 编辑：改数量、删一项、换日期
+    data = _order_form(customer_id, product_ids[:1], quantity=5)
+    data["order_date"] = "2026-01-02"
+    data["item_id[]"] = item_ids[:1]
+    client.post(f"/order/edit/{first_id}", data=data)
+    client.post(f"/order/{second_id}/update_status", data={"status": "已取消"})
+    incremental = _sales_rollup_state(app)
+
+    result = runner.invoke(args=["rebuild-sales-rollup"])
+    assert result.exit_code == 0
+    assert _sales_rollup_state(app) == incremental
+    lines, orders = incremental
+    from datetime import date
+    assert lines == {(date(2026, 1, 2), product_ids[0], customer_id): (5, 50.0)}
+    assert orders == {(date(2026, 1, 2), customer_id): (1, 50.0)}
+
+    resp = client.get("/report/sales?start_date=2026-01-01&end_date=2026-01-31")
+    text = resp.get_data(as_text=True)
+    assert "测试分类" in text and "50.00" in text
+    resp = client.get("/report/sales?start_date=2026-01-01&end_date=2026-01-31&export=csv")
+    assert "商品0" in resp.get_data(as_text=True)
+    # 升级前的旧数据库：有订单而汇总表为空，upgrade-db 回填
+    from models import DailySalesRollup, DailyCustomerSales
+    with app.app_context():
+        db.session.execute(db.delete(DailySalesRollup))
+        db.session.execute(db.delete(DailyCustomerSales))
+        db.session.commit()
+    result = runner.invoke(args=["upgrade-db"])
+    assert result.exit_code == 0 and "回填销售日汇总: 明细 1 行, 客户 1 行" in result.output
+    assert _sales_rollup_state(app) == incremental
+    assert "回填销售日汇总" not in runner.invoke(args=["upgrade-db"]).output
+
+    # 删除订单后汇总清零
+    client.post(f"/order/delete/{first_id}")
+    assert _sales_rollup_state(app) == ({}, {})
+
+def test_sales_rollup_follows_product_category_change(app, client, runner):
+    from sqlalchemy import func
+    from models import Category, DailySalesRollup, Order, Product
+    customer_id, product_ids = _seed_catalog(app, 2)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids, quantity=2))
+    client.post("/order/add", data=_order_form(customer_id, product_ids[:1], quantity=1))
+    with app.app_context():
+        first_id = Order.query.order_by(Order.id).first().id
+        other = Category(name="新分类", description="")
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+        db.session.get(Product, product_ids[0]).category_id = other_id
+        db.session.commit()
+
+    def by_category():
+        with app.app_context():
+            return dict(db.session.execute(
+                db.select(DailySalesRollup.category_id, func.sum(DailySalesRollup.amount))
+                .group_by(DailySalesRollup.category_id)).all())
+
+    old_id = next(c for c in by_category() if c != other_id)
+    assert by_category() == {old_id: 20.0, other_id: 30.0}
+    # 改分类后编辑、删除订单，从新分类扣减，旧分类不残留
+    client.post(f"/order/delete/{first_id}")
+    assert by_category() == {old_id: 0.0, other_id: 10.0}
+    state = by_category()
+    assert runner.invoke(args=["rebuild-sales-rollup"]).exit_code == 0
+    assert {k: v for k, v in state.items() if v} == by_category()
+
+def test_inventory_valuation_report_and_snapshots(app, client, runner):
+    from datetime import date
+    from models import Category, InventorySnapshot, Product, RawMaterial, Supplier
+    from valuation import inventory_valuation, month_end_values, take_inventory_snapshot
+    with app.app_context():
+        supplier = Supplier(name="供应商甲", contact="", phone="", address="")
+        tools, toys = Category(name="工具", description=""), Category(name="玩具", description="")
+        db.session.add_all([supplier, tools, toys])
+        db.session.flush()
+        db.session.add_all([
+            Product(name="锤子", sku="T-1", description="", selling_price=20, cost_price=8.0,
+                    stock_quantity=10, category_id=tools.id, supplier_id=supplier.id),
+            Product(name="扳手", sku="T-2", description="", selling_price=20, cost_price=5.0,
+                    stock_quantity=4, category_id=tools.id),
+            Product(name="积木", sku="Y-1", description="", selling_price=30, cost_price=12.5,
+                    stock_quantity=2, category_id=toys.id, supplier_id=supplier.id),
+            RawMaterial(name="钢材", unit="千克", stock_quantity=100, unit_cost=1.5, supplier_id=supplier.id),
+            RawMaterial(name="木料", unit="立方米", stock_quantity=2, unit_cost=40.0),
+        ])
+        db.session.commit()
+
+        summary, by_category, by_supplier = inventory_valuation()
+        assert (summary.product_quantity, summary.product_value) == (16, 125.0)
+        assert (summary.raw_material_value, summary.total_value) == (230.0, 355.0)
+        assert [(c.category, c.product_count, c.quantity, c.value) for c in by_category] == [
+            ("工具", 2, 14, 100.0), ("玩具", 1, 2, 25.0)]
+        assert [tuple(s) for s in by_supplier] == [("供应商甲", 105.0, 150.0, 255.0), ("未指定供应商", 20.0, 80.0, 100.0)]
+
+        # 锤子 10 -> 0，流水时间为现在；过去日期的快照按当日结束时的库存计价
+        from inventory import adjust_product_stock
+        adjust_product_stock(1, -10, reason="盘亏", created_by=1)
+        db.session.commit()
+        assert take_inventory_snapshot().total_value == 275.0
+        # 每天一行，同一天重复执行时覆盖；月末价值取每月最后一个快照
+        take_inventory_snapshot(date(2026, 1, 15))
+        take_inventory_snapshot(date(2026, 1, 31))
+        take_inventory_snapshot(date(2026, 2, 10))
+        db.session.commit()
+        assert [(m.month, m.snapshot_date, m.total_value) for m in month_end_values(3, today=date(2026, 3, 5))] == [
+            (1, date(2026, 1, 31), 355.0), (2, date(2026, 2, 10), 355.0)]
+
+    assert runner.invoke(args=["snapshot-inventory", "--date", "2026-02-10"]).exit_code == 0
+    result = runner.invoke(args=["snapshot-inventory", "--date", "2999-01-01"])
+    assert result.exit_code != 0 and "将来的日期" in result.output
+    with app.app_context():
+        assert InventorySnapshot.query.count() == 4
+        assert InventorySnapshot.query.filter_by(snapshot_date=date(2026, 2, 10)).one().total_value == 355.0
+
+    login(client, "admin", "admin")
+    text = client.get("/report/inventory-valuation").get_data(as_text=True)
+    assert "工具" in text and "275.00" in text
+    csv_text = client.get("/report/inventory-valuation?export=csv").get_data(as_text=True)
+    assert "供应商甲,25.0,150.0,175.0" in csv_text and "合计,,275.0" in csv_text
+
+def test_stock_checkpoints_answer_stock_as_of_date(app, client, runner):
+    from datetime import datetime
+    from models import RawMaterial, StockAdjustment, StockCheckpoint
+    from stock_history import build_checkpoints, stock_as_of
+    customer_id, (product_id,) = _seed_catalog(app, 1, stock=6)
+    with app.app_context():
+        material = RawMaterial(name="钢材", unit="千克", stock_quantity=10, unit_cost=1.0)
+        db.session.add(material)
+        db.session.flush()
+        material_id = material.id
+        ledger = [("product", "2026-01-10", 10, -3), ("product", "2026-01-20", 7, 5),
+                  ("product", "2026-02-05", 12, -2), ("product", "2026-03-15", 10, -4),
+                  ("raw_material", "2026-02-01", 0, 10)]
+        db.session.add_all([
+            StockAdjustment(
+                adjustment_type=kind, adjustment_date=datetime.strptime(day, "%Y-%m-%d"),
+                product_id=product_id if kind == "product" else None,
+                raw_material_id=material_id if kind == "raw_material" else None,
+                quantity_before=before, quantity_after=before + change, adjustment_quantity=change, reason="测试",
+                created_by="admin"
+            ) for kind, day, before, change in ledger
+        ])
+        db.session.commit()
+
+        # 只为已结束且有流水的月份建立检查点，再次执行只补新的月份
+        assert build_checkpoints(until=datetime(2026, 3, 20)) == 3
+        assert build_checkpoints(until=datetime(2026, 3, 31)) == 0
+        assert build_checkpoints(until=datetime(2026, 4, 2)) == 1
+        db.session.commit()
+        assert sorted((c.item_type, c.checkpoint_at.month, c.quantity) for c in StockCheckpoint.query) == [
+            ("product", 2, 12), ("product", 3, 10), ("product", 4, 6), ("raw_material", 3, 10)]
+
+        def as_of(day, kind="product", item_id=product_id):
+            return stock_as_of(kind, [item_id], datetime.strptime(day, "%Y-%m-%d"))[item_id]
+        assert [as_of(d) for d in ("2026-01-01", "2026-01-16", "2026-02-10", "2026-03-16", "2026-05-01")] == [10, 7, 10, 6, 6]
+        assert [as_of(d, "raw_material", material_id) for d in ("2026-01-15", "2026-02-02")] == [0, 10]
+
+    login(client, "admin", "admin")
+    resp = client.get(f"/api/products/{product_id}/stock?date=2026-01-15")
+    assert resp.get_json() == {"id": product_id, "date": "2026-01-15", "stock_quantity": 7}
+    assert client.get(f"/api/products/{product_id}/stock?date=2026-13-01").status_code == 400
+    assert client.get("/api/raw-materials/999/stock").status_code == 404
+    text = client.get("/report/stock-as-of?date=2026-02-28&search=商品0").get_data(as_text=True)
+    assert "<td>10</td>" in text and "钢材" in text
+    csv_text = client.get("/report/stock-as-of?date=2026-01-15&export=csv").get_data(as_text=True)
+    assert "SKU-0,商品0,测试分类,7.0,6" in csv_text
+
+    result = runner.invoke(args=["verify-stock-checkpoints"])
+    assert result.exit_code == 0 and "4 个检查点" in result.output
+    # 历史库存从检查点起算：篡改检查点后结果随之变化，核对命令能发现
+    with app.app_context():
+        checkpoint = StockCheckpoint.query.filter_by(item_type="product", checkpoint_at=datetime(2026, 2, 1)).one()
+        checkpoint.quantity = 100
+        db.session.commit()
+        assert stock_as_of("product", [product_id], datetime(2026, 2, 10))[product_id] == 98
+    result = runner.invoke(args=["verify-stock-checkpoints"])
+    assert result.exit_code != 0 and "检查点不一致" in result.output
+    assert runner.invoke(args=["build-stock-checkpoints", "--rebuild", "--verify"]).exit_code == 0
+
+def test_archive_moves_closed_orders_and_ledger_keeping_derived_data(app, client, runner):
+    from datetime import datetime
+    from models import (Order, OrderItem, Product, StockAdjustment, ArchivedOrder, ArchivedOrderItem,
+                        ArchivedStockAdjustment)
+    from archive import archive_orders, archive_stock_adjustments
+    from stock_history import next_month_start, stock_as_of, verify_checkpoints
+    customer_id, product_ids = _seed_catalog(app, 2, stock=20)
+    login(client, "admin", "admin")
+    for status in ("已完成", "已取消", "待支付"):
+        client.post("/order/add", data=_order_form(customer_id, product_ids, quantity=2, status=status))
+    with app.app_context():
+        done_id, cancelled_id, pending_id = [o.id for o in Order.query.order_by(Order.id)]
+        rollup_before = _sales_rollup_state(app)
+        moment = datetime.now()
+        stock_before = stock_as_of("product", product_ids, moment)
+
+        # 只归档截止时间之前已完成 / 已取消的订单，每批一个事务
+        assert archive_orders(datetime(2026, 2, 1), batch_size=1) == 2
+        assert [o.id for o in Order.query] == [pending_id]
+        assert sorted(o.id for o in ArchivedOrder.query) == [done_id, cancelled_id]
+        assert ArchivedOrderItem.query.count() == 4 and OrderItem.query.count() == 2
+
+        # 归档流水前先建检查点，归档后历史库存不变
+        # 已取消的订单不扣库存：两张订单各两行流水
+        assert archive_stock_adjustments(next_month_start(moment)) == 4
+        assert StockAdjustment.query.count() == 0 and ArchivedStockAdjustment.query.count() == 4
+        assert stock_as_of("product", product_ids, moment) == stock_before
+        assert stock_as_of("product", product_ids, datetime(2026, 1, 1)) == {pid: 20 for pid in product_ids}
+        checked, mismatches, stock_mismatches = verify_checkpoints()
+        assert checked == 2 and not mismatches and not stock_mismatches
+        assert _sales_rollup_state(app) == rollup_before
+
+    # 汇总表重建同时读取归档订单
+    assert runner.invoke(args=["rebuild-sales-rollup"]).exit_code == 0
+    assert _sales_rollup_state(app) == rollup_before
+    assert runner.invoke(args=["build-stock-checkpoints", "--rebuild", "--verify"]).exit_code == 0
+    result = runner.invoke(args=["archive", "--months", "1"])
+    assert result.exit_code == 0 and "归档完成" in result.output
+
+    # 商品与客户的订单记录同时显示已归档的订单（只读）
+    with app.app_context():
+        done_number = db.session.get(ArchivedOrder, done_id).order_number
+    text = client.get(f"/product/{product_ids[0]}").get_data(as_text=True)
+    assert done_number in text and "已完成（已归档）" in text
+    text = client.get(f"/customer/{customer_id}").get_data(as_text=True)
+    assert done_number in text and "已归档（只读）" in text
+
+    # 被归档订单引用的商品不能删除；已归档订单不能再编辑
+    client.post(f"/product/delete/{product_ids[0]}")
+    with app.app_context():
+        assert db.session.get(Product, product_ids[0]) is not None
+    assert client.get(f"/order/edit/{done_id}").status_code == 404
+
+def test_report_cache_hits_and_date_driven_invalidation(app, client):
+    from sqlalchemy import event
+    from models import DailySalesRollup, Product
+    from report_cache import REPORT_CACHE_SIZE, report_cache
+    customer_id, product_ids = _seed_catalog(app, 2)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids[:1], quantity=2))
+    january = "/report/sales?start_date=2026-01-01&end_date=2026-01-31"
+    february = "/report/sales?start_date=2026-02-01&end_date=2026-02-28"
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert "20.00" in client.get(january).get_data(as_text=True)
+        client.get(february)
+        statements.clear()
+        assert "20.00" in client.get(january).get_data(as_text=True)
+        # 已结束的区间直接命中缓存，不再读汇总表
+        assert not any(DailySalesRollup.__tablename__ in s for s in statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert (report_cache.stats()["hits"], report_cache.stats()["misses"]) == (1, 2)
+
+    # 1 月的新订单只失效包含 1 月 1 日的条目
+    client.post("/order/add", data=_order_form(customer_id, product_ids[1:], quantity=3))
+    assert report_cache.stats()["invalidations"] == 1
+    assert "50.00" in client.get(january).get_data(as_text=True)
+    client.get(february)
+    assert report_cache.stats()["hits"] == 2
+
+    # 修改商品名称后全部失效
+    with app.app_context():
+        db.session.get(Product, product_ids[0]).name = "改名商品"
+        db.session.commit()
+    assert report_cache.stats()["size"] == 0
+    assert "改名商品" in client.get(january).get_data(as_text=True)
+
+    # 包含今天的区间按 REPORT_CACHE_OPEN_TTL 缓存，0 表示不缓存
+    app.config["REPORT_CACHE_OPEN_TTL"] = 0
+    client.get("/report/sales")
+    client.get("/report/sales")
+    assert report_cache.stats()["size"] == 1
+
+    # 超出容量按 LRU 淘汰
+    report_cache.maxsize = 2
+    try:
+        for day in ("01", "02", "03"):
+            client.get(f"/report/material-cost?start_date=2025-12-{day}&end_date=2025-12-31")
+        assert report_cache.stats()["size"] == 2 and report_cache.stats()["evictions"] == 2
+    finally:
+        report_cache.maxsize = REPORT_CACHE_SIZE
+    text = client.get("/auth/sql-stats").get_data(as_text=True)
+    assert "报表缓存" in text
+
+def test_report_cache_sees_writes_from_other_workers(app, client):
+    from datetime import date
+    from cache import LRUCache
+    from models import DailySalesRollup, ReportVersion
+    from report_cache import ALL_DAYS, report_cache
+    customer_id, product_ids = _seed_catalog(app, 1)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids))
+    january = "/report/sales?start_date=2026-01-01&end_date=2026-01-31"
+    assert "10.00" in client.get(january).get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(ReportVersion, date(2026, 1, 1)).version == 1
+
+    # 其他 worker 提交的修改不会失效本进程的缓存，但会更新版本号
+    with app.app_context():
+        db.session.execute(db.update(DailySalesRollup).values(amount=99.0))
+        db.session.execute(db.update(ReportVersion).where(ReportVersion.day == date(2026, 1, 1))
+                           .values(version=ReportVersion.version + 1))
+        db.session.commit()
+    assert report_cache.stats()["size"] == 1
+    assert "99.00" in client.get(january).get_data(as_text=True)
+    with app.app_context():
+        db.session.execute(db.update(DailySalesRollup).values(amount=77.0))
+        db.session.add(ReportVersion(day=ALL_DAYS, version=1))
+        db.session.commit()
+    assert "77.00" in client.get(january).get_data(as_text=True)
+
+    # 计算期间发生失效，结果不写入缓存
+    cache = LRUCache(maxsize=4)
+    def compute():
+        cache.invalidate()
+        return "stale"
+    assert cache.get_or_set("key", compute) == "stale"
+    assert cache.get("key") is None
+
+def test_dashboard_cached_and_invalidated_on_write(app, client):
+    from sqlalchemy import event
+    from models import Product
+    customer_id, product_ids = _seed_catalog(app, 2, stock=5)
+    login(client, "admin", "admin")
+    assert "商品0" in client.get("/").get_data(as_text=True)
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        client.get("/")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    # 缓存命中时只有登录用户加载，不再查询业务表
+    assert all("FROM users" in s for s in statements)
+
+    # 下单通过原子 UPDATE 扣减库存，提交后缓存失效，低库存列表随之变化
+    client.post("/order/add", data=_order_form(customer_id, product_ids[:1], quantity=5))
+    text = client.get("/").get_data(as_text=True)
+    with app.app_context():
+        assert db.session.get(Product, product_ids[0]).stock_quantity == 0
+    assert '<td class="low-stock">0</td>' in text
+
+def test_order_list_csv_export_streams_filtered_items(app, client):
+    customer_id, product_ids = _seed_catalog(app, 3)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids[:2]))
+    client.post("/order/add", data=_order_form(customer_id, product_ids[2:], status="已支付"))
+    resp = client.get("/order/list?export=csv&status=待支付")
+    assert resp.is_streamed
+    assert resp.mimetype == "text/csv"
+    lines = resp.get_data(as_text=True).strip().splitlines()
+    assert len(lines) == 3  # 表头 + 2 个订单项
+    assert "商品0" in lines[1] + lines[2] and "商品2" not in "".join(lines)
+
+def test_report_csv_exports_stream(app, client):
+    login(client, "admin", "admin")
+    for url in ("/report/sales?export=csv", "/report/material-cost?export=csv"):
+        resp = client.get(url)
+        assert resp.status_code == 200 and resp.is_streamed
+        assert "日期范围" in resp.get_data(as_text=True)
+
+def test_strict_loading_pages_render_with_eager_loads(app, client):
+    from datetime import datetime
+    from models import Order, Product, Supplier, RawMaterial, RawMaterialPurchase, Category, Customer
+    customer_id, product_ids = _seed_catalog(app, 3)
+    login(client, "admin", "admin")
+    client.post("/order/add", data=_order_form(customer_id, product_ids))
+    with app.app_context():
+        supplier = Supplier(name="测试供应商", contact="", phone="", address="")
+        db.session.add(supplier)
+        db.session.flush()
+        material = RawMaterial(name="原料", unit="千克", stock_quantity=0, unit_cost=1.0, supplier_id=supplier.id)
+        db.session.add(material)
+        db.session.flush()
+        db.session.add(RawMaterialPurchase(purchase_date=datetime(2026, 1, 1), raw_material_id=material.id,
+                                           supplier_id=supplier.id, quantity=1, unit_price=1.0, total_price=1.0))
+        db.session.commit()
+        order_id = Order.query.first().id
+        supplier_id, material_id = supplier.id, material.id
+        category_id = Category.query.first().id
+
+    urls = [
+        "/order/list", f"/order/{order_id}", f"/order/{order_id}/outbound_slip",
+        "/product/list", f"/product/{product_ids[0]}", "/purchase/list",
+        f"/raw_material/{material_id}", f"/supplier/{supplier_id}", f"/customer/{customer_id}",
+        "/category/list", f"/category/{category_id}", "/api/products", f"/api/products/{product_ids[0]}",
+        "/api/search/products?q=商品",
+    ]
+    for url in urls:
+        assert client.get(url).status_code == 200, url
+
+    # 严格模式下，未预加载的关系访问会直接报错
+    import sqlalchemy.exc
+    with app.test_request_context():
+        order = db.session.get(Order, order_id)
+        with pytest.raises(sqlalchemy.exc.InvalidRequestError):
+            order.items
+
+def test_sql_instrumentation_headers_stats_and_slow_log(app, client, caplog):
+    import json
+    import logging
+    login(client, "admin", "admin")
+    app.config["SLOW_QUERY_THRESHOLD_MS"] = 0  # 每条语句都视为慢查询
+    with caplog.at_level(logging.WARNING):
+        resp = client.get("/order/list")
+    assert resp.headers["Server-Timing"].startswith("db;dur=")
+    assert "queries" in resp.headers["Server-Timing"] and "app;dur=" in resp.headers["Server-Timing"]
+    slow = [json.loads(r.getMessage()) for r in caplog.records if r.name.endswith("slow_query")]
+    assert slow and all(entry["endpoint"] == "order.list" for entry in slow)
+
+    text = client.get("/auth/sql-stats?sort=queries").get_data(as_text=True)
+    assert "order.list" in text
+    client.post("/auth/sql-stats")
+    endpoints = [row["endpoint"] for row in app.extensions["sql_instrumentation"]["stats"].worst()]
+    assert "order.list" not in endpoints
+
+    # 失败的语句不在连接上残留计时状态
+    from flask import g
+    from sqlalchemy.exc import OperationalError
+    with app.test_request_context("/"), app.app_context():
+        with pytest.raises(OperationalError):
+            db.session.execute(db.text("SELECT * FROM missing_table"))
+        db.session.rollback()
+        db.session.execute(db.text("SELECT 1"))
+        assert g.sql_stats["count"] == 1
+        assert "query_start_time" not in db.session.connection().info
+
+def test_category_list_uses_grouped_product_counts(app, client):
+    from models import Category
+    _seed_catalog(app, 4)
+    with app.app_context():
+        db.session.add(Category(name="空分类", description=""))
+        db.session.commit()
+    login(client, "admin", "admin")
+    resp = {}
+    loads = _count_product_selects(app, lambda: resp.update(r=client.get("/category/list")))
+    text = resp["r"].get_data(as_text=True)
+    assert loads == 0
+    assert "<td>4</td>" in text and "<td>0</td>" in text
+
+def test_product_search_index_pinyin_sync_and_ranking(app, client):
+    from models import Category, Product
+    with app.app_context():
+        category = Category(name="文具", description="")
+        db.session.add(category)
+        db.session.flush()
+        for name, sku, description in [("红色笔记本", "NB-1", "A5"), ("红色笔", "PEN-1", ""), ("蓝色笔", "PEN-2", "红色笔芯")]:
+            db.session.add(Product(name=name, sku=sku, description=description, selling_price=1.0,
+                                   cost_price=1.0, stock_quantity=1, category_id=category.id))
+        db.session.commit()
+    login(client, "admin", "admin")
+
+    def search(q):
+        return [p["name"] for p in client.get(f"/api/search/products?q={q}").get_json()]
+
+    assert search("HSB") == ["红色笔", "红色笔记本"]  # 拼音首字母，名称越短越相关
+    assert search("红色笔")[0] == "红色笔" and set(search("红色笔")) == {"红色笔", "红色笔记本", "蓝色笔"}
+    assert search("pen-2") == ["蓝色笔"]
+    assert search("笔") and "红色笔" in client.get("/product/list?search=HSB").get_data(as_text=True)
+    # 游标模式下搜索仍按相关度排序（退回页码分页），与默认模式一致；
+    # 名称排在最前、只有描述匹配的商品相关度最低
+    with app.app_context():
+        db.session.add(Product(name="A笔筒", sku="HOLDER-1", description="放红色笔", selling_price=1.0,
+                               cost_price=1.0, stock_quantity=1, category_id=Category.query.first().id))
+        db.session.commit()
+    def listed(url):
+        text = client.get(url).get_data(as_text=True)
+        return sorted(["红色笔记本", "红色笔", "A笔筒"], key=lambda n: text.find(f">{n}<"))
+    assert listed("/product/list?search=红色笔")[-1] == "A笔筒"
+    assert listed("/product/list?search=红色笔&paging=cursor") == listed("/product/list?search=红色笔")
+    with app.app_context():
+        db.session.delete(Product.query.filter_by(sku="HOLDER-1").one())
+        db.session.commit()
+
+    # 编辑、删除后索引同步
+    with app.app_context():
+        pen = Product.query.filter_by(sku="PEN-1").one()
+        pen.name = "钢笔"
+        db.session.commit()
+        db.session.delete(Product.query.filter_by(sku="NB-1").one())
+        db.session.commit()
+    assert search("HSB") == []
+    assert search("gb") == ["钢笔"]
+
+def test_upgrade_db_creates_missing_search_index(app, client, runner):
+    # products 表已存在的旧数据库没有检索表，create_all 不会创建
+    from models import Category, Product
+    with app.app_context():
+        category = Category(name="文具", description="")
+        db.session.add(category)
+        db.session.flush()
+        db.session.add(Product(name="红色笔", sku="PEN-1", description="", selling_price=1.0,
+                               cost_price=1.0, stock_quantity=1, category_id=category.id))
+        db.session.execute(db.text("DROP TABLE product_search"))
+        db.session.commit()
+        category_id = category.id
+    result = runner.invoke(args=["upgrade-db"])
+    assert result.exit_code == 0 and "创建商品检索索引: 1 个商品" in result.output
+    assert "创建商品检索索引" not in runner.invoke(args=["upgrade-db"]).output
+
+    login(client, "admin", "admin")
+    form = {"name": "蓝色笔", "sku": "PEN-2", "description": "", "selling_price": 1, "cost_price": 1,
+            "stock_quantity": 1, "category_id": category_id, "supplier_id": 0}
+    assert client.post("/product/add", data=form).status_code == 302
+    assert [p["name"] for p in client.get("/api/search/products?q=HSB").get_json()] == ["红色笔"]
+    assert [p["name"] for p in client.get("/api/search/products?q=PEN-2").get_json()] == ["蓝色笔"]
+
+def test_api_collections_projection_cursor_and_conditional_get(app, client):
+    from models import Category
+    _seed_catalog(app, 5)
+    login(client, "admin", "admin")
+
+    resp = client.get("/api/products?fields=id,name,category_name&limit=2")
+    body = resp.get_json()
+    assert [set(item) for item in body["items"]] == [{"id", "name", "category_name"}] * 2
+    assert body["items"][0]["category_name"] == "测试分类"
+    names = [item["name"] for item in body["items"]]
+    while body["next_cursor"]:
+        body = client.get(f"/api/products?fields=name&limit=2&cursor={body['next_cursor']}").get_json()
+        names += [item["name"] for item in body["items"]]
+    assert names == [f"商品{i}" for i in range(5)]
+    assert client.get("/api/products?fields=password").status_code == 400
+    assert len(client.get("/api/products").get_json()) == 5  # 不分页时保持原来的数组格式
+
+    first = client.get("/api/categories")
+    products_etag = client.get("/api/products").headers["ETag"]
+    assert first.headers["ETag"] and first.headers["Last-Modified"]
+    cached = client.get("/api/categories", headers={"If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304 and cached.get_data() == b""
+
+    with app.app_context():
+        Category.query.first().name = "改名分类"
+        db.session.commit()
+    changed = client.get("/api/categories", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200 and changed.get_json()[0]["name"] == "改名分类"
+    # 商品接口包含分类名称，同样失效
+    assert client.get("/api/products", headers={"If-None-Match": products_etag}).status_code == 200
+
+    # 删除由累计删除计数感知（不再 COUNT 全表），304 只走索引查找
+    from models import Customer, TableDeleteCount
+    with app.app_context():
+        db.session.add_all([Customer(name=f"客户{i}", contact="", phone="", address="") for i in range(2)])
+        db.session.commit()
+    customers_etag = client.get("/api/customers").headers["ETag"]
+    assert client.get("/api/customers", headers={"If-None-Match": customers_etag}).status_code == 304
+    with app.app_context():
+        db.session.delete(Customer.query.order_by(Customer.id).first())  # 删除的不是最大 id
+        db.session.commit()
+        assert db.session.get(TableDeleteCount, "customers").last_value == 1
+        db.session.execute(db.delete(Customer).where(Customer.name == "不存在"))
+        db.session.commit()
+        assert db.session.get(TableDeleteCount, "customers").last_value == 2
+    assert client.get("/api/customers", headers={"If-None-Match": customers_etag}).status_code == 200
+    with app.app_context():
+        names = {ix["name"] for ix in db.inspect(db.engine).get_indexes("products")}
+        assert "ix_products_updated_at" in names
+    for url in ("/api/customers", "/api/suppliers", "/api/raw-materials"):
+        assert client.get(url).status_code == 200
+
+def test_bulk_order_import_api_and_cli(app, client, runner, tmp_path):
+    import json
+    from models import Order, OrderItem, Product, StockAdjustment
+    customer_id, product_ids = _seed_catalog(app, 2, stock=5)
+    login(client, "admin", "admin")
+    orders = [
+        {"ref": "A1", "order_date": "2026-01-01", "customer_id": customer_id, "status": "已支付",
+         "items": [{"sku": "SKU-0", "quantity": 2, "unit_price": 3.5}, {"product_id": product_ids[1], "quantity": 1}]},
+        {"ref": "A2", "customer_id": 999, "items": [{"sku": "SKU-0", "quantity": 1}]},   # 客户不存在
+        {"ref": "A3", "customer_id": customer_id, "items": [{"sku": "NOPE", "quantity": 1}]},  # 商品不存在
+        {"ref": "A4", "customer_id": customer_id, "items": [{"sku": "SKU-0", "quantity": 4}]},  # 库存不足（只剩 3）
+        {"ref": "A5", "customer_id": customer_id, "items": [{"sku": "SKU-0", "quantity": 0}]},  # 数量无效
+    ]
+    body = client.post("/api/orders/import", json=orders).get_json()
+    assert body["imported"] == 1
+    assert [(e["row"], e["ref"]) for e in body["errors"]] == [(2, "A2"), (3, "A3"), (4, "A4"), (5, "A5")]
+    with app.app_context():
+        order = db.session.get(Order, body["order_ids"][0])
+        assert order.total_amount == 17.0 and order.status == "已支付"
+        assert db.session.get(Product, product_ids[0]).stock_quantity == 3
+        assert OrderItem.query.count() == 2 and StockAdjustment.query.count() == 2
+
+    csv_path = tmp_path / "orders.csv"
+    csv_path.write_text(
+        "ref,order_date,customer_id,status,payment_method,notes,product_id,sku,quantity,unit_price\n"
+        f"B1,2026-01-02,{customer_id},已取消,支付宝,,,SKU-0,10,\n"
+        f"B2,2026-01-02,{customer_id},,,,,SKU-0,3,\n"
+        f"B2,2026-01-02,{customer_id},,,,,SKU-1,1,\n"
+        f"B3,bad-date,{customer_id},,,,,SKU-1,1,\n",
+        encoding="utf-8"
+    )
+    result = runner.invoke(args=["import-orders", str(csv_path), "--chunk-size", "1", "--user", "admin"])
+    assert "成功 2 个订单, 失败 1 个" in result.output
+    assert "第 5 行 (ref=B3)" in result.output
+    with app.app_context():
+        assert db.session.get(Product, product_ids[0]).stock_quantity == 0  # 已取消订单不扣库存
+        assert Order.query.count() == 3
+    # 批量写入的销售汇总与全量重建一致
+    incremental = _sales_rollup_state(app)
+    runner.invoke(args=["rebuild-sales-rollup"])
+    assert _sales_rollup_state(app) == incremental and incremental[0]
+
+def test_stocktake_upload_preview_and_apply(app, client):
+    import io
+    from models import Product, RawMaterial, StockAdjustment, StocktakeSession
+    _seed_catalog(app, 3, stock=10)
+    with app.app_context():
+        db.session.add(RawMaterial(name="钢材", unit="千克", stock_quantity=5.0, unit_cost=1.0))
+        db.session.commit()
+    login(client, "admin", "admin")
+    content = (
+        "type,sku,name,counted_quantity\n"
+        ",SKU-0,,7\n"          # 盘亏 3
+        "product,SKU-1,,10\n"  # 无差异
+        "raw_material,,钢材,6.5\n"
+        ",SKU-404,,1\n"        # SKU 不存在
+        ",SKU-2,,1.5\n"        # 商品数量必须为整数
+    )
+    resp = client.post("/stocktake/upload", data={"file": (io.BytesIO(content.encode("utf-8")), "count.csv")},
+                       content_type="multipart/form-data", follow_redirects=True)
+    text = resp.get_data(as_text=True)
+    assert "第 5 行" in text and "第 6 行" in text
+    assert "商品0" in text and "钢材" in text and "-3" in text and "+1.5" in text
+    with app.app_context():
+        session_id = StocktakeSession.query.one().id
+        assert Product.query.filter_by(sku="SKU-0").one().stock_quantity == 10  # 预览不修改库存
+
+    client.post(f"/stocktake/{session_id}/apply")
+    text = client.post(f"/stocktake/{session_id}/apply", follow_redirects=True).get_data(as_text=True)
+    assert "不能应用" in text  # 重复确认不会再次写入
+    with app.app_context():
+        assert Product.query.filter_by(sku="SKU-0").one().stock_quantity == 7
+        assert RawMaterial.query.one().stock_quantity == 6.5
+        adjustments = StockAdjustment.query.order_by(StockAdjustment.id).all()
+        assert [(a.adjustment_type, a.adjustment_quantity) for a in adjustments] == [("product", -3), ("raw_material", 1.5)]
+        assert db.session.get(StocktakeSession, session_id).status == "已应用"
+
+def test_user_loader_cache_and_invalidation(app, client):
+    from routes.auth import user_cache
+    user_cache.invalidate()
+    login(client, "admin", "admin")
+    with app.app_context():
+        other = User(username="clerk", password_hash=generate_password_hash("clerk"), role="user")
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    client.get("/")
+    user_selects = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    def listener(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            user_selects.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        for _ in range(3):
+            client.get("/customer/list")
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert user_selects == []  # 已缓存，不再查询 users 表
+
+    # 编辑后缓存失效，已登录用户立即看到新角色；删除后同样失效
+    client2 = app.test_client()
+    login(client2, "clerk", "clerk")
+    assert "用户管理" not in client2.get("/").get_data(as_text=True)
+    client.post(f"/auth/users/edit/{other_id}", data={"username": "clerk", "role": "admin", "password": "clerk123"})
+    assert "用户管理" in client2.get("/").get_data(as_text=True)
+    client.post(f"/auth/users/delete/{other_id}")
+    assert client2.get("/customer/list").status_code == 302
+
+def test_order_numbers_are_sequential_per_day(app):
+    import json
+    from datetime import datetime
+    from models import Order, OrderNumberSequence, format_order_number, order_number_allocator
+    from order_import import import_orders, parse_orders
+    customer_id, _ = _seed_catalog(app, 1, stock=10)
+    today = datetime.now().strftime("%Y%m%d")
+    with app.app_context():
+        orders = [Order(customer_id=customer_id, payment_method="现金", notes="") for _ in range(3)]
+        db.session.add_all(orders)
+        db.session.commit()
+        assert [o.order_number for o in orders] == [f"{today}00000{i}" for i in (1, 2, 3)]
+
+        payload = json.dumps([{"customer_id": customer_id, "items": [{"sku": "SKU-0", "quantity": 1}]}] * 2)
+        result = import_orders(parse_orders(payload, "json"), "tester")
+        numbers = [db.session.get(Order, i).order_number for i in result.order_ids]
+        assert numbers == [f"{today}000004", f"{today}000005"]
+
+        # 回滚的事务不占用序号；不同日期各自从 1 开始
+        db.session.add(Order(customer_id=customer_id, payment_method="现金", notes=""))
+        db.session.flush()
+        db.session.rollback()
+        assert order_number_allocator.allocate(db.session.connection(), 2, day="20250101") == ["20250101000001", "20250101000002"]
+        db.session.commit()
+        assert db.session.get(OrderNumberSequence, today).last_value == 5
+        assert format_order_number(today, 36) == f"{today}000010"
+
+def test_sku_allocation_is_unique_and_skips_existing(app, client, runner):
+    from models import Category, Product, SkuSequence
+    from sku import allocate_skus
+    with app.app_context():
+        category = Category(name="文具", description="")
+        db.session.add(category)
+        db.session.flush()
+        # 旧的时间戳 SKU 与手工录入的 SKU 都不会被再次分配
+        for name, sku in [("红色笔", "HSB-123456"), ("蓝色笔", "LSB-000007")]:
+            db.session.add(Product(name=name, sku=sku, description="", selling_price=1.0,
+                                   cost_price=1.0, stock_quantity=1, category_id=category.id))
+        db.session.commit()
+        db.session.execute(db.delete(SkuSequence))
+        db.session.commit()
+        assert allocate_skus(["红色笔", "蓝色笔", "红色笔", "123"]) == ["HSB-123457", "LSB-000008", "HSB-123458", "1-000001"]
+        db.session.rollback()
+        category_id = category.id
+
+    login(client, "admin", "admin")
+    form = {"name": "蓝色笔", "sku": "", "description": "", "selling_price": 1, "cost_price": 1,
+            "stock_quantity": 1, "category_id": category_id, "supplier_id": 0}
+    for _ in range(2):
+        client.post("/product/add", data=form)
+    with app.app_context():
+        assert sorted(db.session.scalars(db.select(Product.sku).where(Product.sku.like("LSB-%")))) == [
+            "LSB-000007", "LSB-000008", "LSB-000009"]
+    assert runner.invoke(args=["upgrade-db"]).exit_code == 0
+
+def test_startup_builds_one_app_and_defers_heavy_imports():
+    import subprocess
+    import sys
+    probe = (
+        "import sys, app; assert 'app' not in vars(app); "
+        "import main; assert vars(app).get('app') is None; "
+        "print(sorted(m for m in ('pypinyin', 'order_import', 'sqlalchemy.dialects.postgresql') if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+def test_seed_generate_is_deterministic_and_consistent(app, runner):
+    from sqlalchemy import func
+    from models import DailySalesRollup, Order, OrderItem, Product, StockAdjustment
+    from seed import generate
+    sizes = dict(categories=2, suppliers=2, products=20, raw_materials=3, customers=5,
+                 orders=60, lines_per_order=2, purchases=10, days=30, seed=7, chunk_size=16)
+    with app.app_context():
+        counts = generate(**sizes)
+        assert counts["orders"] == 60 and counts["order_items"] == OrderItem.query.count()
+        first = [(o.customer_id, o.total_amount) for o in Order.query.order_by(Order.id)]
+        numbers = [o.order_number for o in Order.query.order_by(Order.id)]
+        assert len(set(numbers)) == 60 and all(len(n) == 14 for n in numbers)
+        assert all(p.sku.split("-")[0].isalpha() for p in Product.query)  # 拼音首字母 SKU
+        # 汇总表与明细一致
+        active = db.session.scalar(
+            db.select(func.sum(OrderItem.subtotal)).join(Order).where(Order.status != "已取消"))
+        assert round(db.session.scalar(db.select(func.sum(DailySalesRollup.amount))), 2) == round(active, 2)
+        # 库存流水逐条衔接，累计值等于当前库存；Zipf 热度下销量集中在少数商品
+        ledger = dict(db.session.execute(
+            db.select(StockAdjustment.product_id, func.sum(StockAdjustment.adjustment_quantity))
+            .where(StockAdjustment.adjustment_type == "product").group_by(StockAdjustment.product_id)).all())
+        assert ledger == {p.id: p.stock_quantity for p in Product.query}
+        sold = sorted(db.session.scalars(
+            db.select(func.sum(OrderItem.quantity)).group_by(OrderItem.product_id)), reverse=True)
+        assert sum(sold[:4]) > sum(sold) * 0.4
+
+        db.drop_all()
+        db.create_all()
+        generate(**sizes)
+        assert [(o.customer_id, o.total_amount) for o in Order.query.order_by(Order.id)] == first
+
+    result = runner.invoke(args=["seed", "--products", "5", "--customers", "3", "--orders", "4", "--purchases", "2"])
+    assert result.exit_code == 0 and "orders: 4" in result.output
+
+def test_material_cost_report_reads_monthly_rollup(app, client, runner):
+    from datetime import datetime
+    from models import MonthlyMaterialCost, RawMaterial, RawMaterialPurchase, Supplier
+    with app.app_context():
+        suppliers = [Supplier(name=n, contact="", phone="", address="") for n in ("甲", "乙")]
+        db.session.add_all(suppliers)
+        db.session.flush()
+        materials = [RawMaterial(name=n, unit="千克", stock_quantity=0, unit_cost=1.0) for n in ("钢材", "棉布")]
+        db.session.add_all(materials)
+        db.session.commit()
+        ids = [m.id for m in materials], [s.id for s in suppliers]
+    login(client, "admin", "admin")
+    (steel, cloth), (jia, yi) = ids
+    for day, material, supplier, quantity, price in [
+        ("2026-01-05", steel, jia, 10, 2.0), ("2026-01-20", steel, yi, 5, 2.0),
+        ("2026-02-03", cloth, jia, 4, 5.0), ("2026-02-28", steel, jia, 1, 3.0), ("2026-03-10", cloth, yi, 2, 5.0),
+    ]:
+        client.post("/purchase/add", data={"purchase_date": day, "raw_material_id": material, "supplier_id": supplier,
+                                           "quantity": quantity, "unit_price": price,
+                                           "total_price": quantity * price})
+    with app.app_context():
+        assert {(r.month, r.raw_material_id, r.supplier_id): r.amount for r in MonthlyMaterialCost.query} == {
+            (202601, steel, jia): 20.0, (202601, steel, yi): 10.0, (202602, cloth, jia): 20.0,
+            (202602, steel, jia): 3.0, (202603, cloth, yi): 10.0}
+        assert {p.purchase_month for p in RawMaterialPurchase.query} == {202601, 202602, 202603}
+
+        from rollups import material_cost_report
+        # 1 月 20 日起的半月 + 整个 2 月 + 3 月 1~9 日
+        monthly, top, by_supplier = material_cost_report(datetime(2026, 1, 20).date(), datetime(2026, 3, 9).date())
+        assert [(m.year, m.month, m.total_cost) for m in monthly] == [(2026, 1, 10.0), (2026, 2, 23.0)]
+        assert [(m.material, m.total_quantity, m.total_cost) for m in top] == [("棉布", 4, 20.0), ("钢材", 6, 13.0)]
+        assert [(s.supplier, s.total_cost, s.purchase_count) for s in by_supplier] == [("甲", 23.0, 2), ("乙", 10.0, 1)]
+
+        # 重建结果与增量维护一致
+        before = {(r.month, r.raw_material_id, r.supplier_id): (r.purchase_count, r.amount) for r in MonthlyMaterialCost.query}
+        db.session.execute(db.update(RawMaterialPurchase).values(purchase_month=None))
+        db.session.commit()
+    assert runner.invoke(args=["rebuild-material-cost-rollup"]).exit_code == 0
+    with app.app_context():
+        assert {(r.month, r.raw_material_id, r.supplier_id): (r.purchase_count, r.amount)
+                for r in MonthlyMaterialCost.query} == before
+
+    html = client.get("/report/material-cost?start_date=2026-01-01&end_date=2026-03-31").get_data(as_text=True)
+    assert "钢材" in html and "33.00" in html
+    csv_text = client.get("/report/material-cost?start_date=2026-01-01&end_date=2026-03-31&export=csv").get_data(as_text=True)
+    assert "2026,1,30.0" in csv_text and "甲,3,43.0" in csv_text
+
+    # 升级前的旧数据库：purchase_month 为空、月汇总表为空
+    with app.app_context():
+        db.session.execute(db.update(RawMaterialPurchase).values(purchase_month=None))
+        db.session.execute(db.delete(MonthlyMaterialCost))
+        db.session.commit()
+        monthly, _, _ = material_cost_report(datetime(2026, 1, 20).date(), datetime(2026, 1, 31).date())
+        assert [(m.year, m.month, m.total_cost) for m in monthly] == [(2026, 1, 10.0)]
+    result = runner.invoke(args=["upgrade-db"])
+    assert result.exit_code == 0 and "回填原材料采购月汇总: 5 行" in result.output
+    assert "回填原材料采购月汇总" not in runner.invoke(args=["upgrade-db"]).output
+    with app.app_context():
+        assert {(r.month, r.raw_material_id, r.supplier_id): (r.purchase_count, r.amount)
+                for r in MonthlyMaterialCost.query} == before
@@ -0,0 +1,169 @@
+"""库存价值（按成本价）
+
+    商品价值   = stock_quantity × cost_price
+    原材料价值 = stock_quantity × unit_cost
+
+inventory_valuation 在数据库中按分类、按供应商聚合，只取回汇总行，
+不把全部商品 / 原材料加载到 Python。商品按默认供应商（Product.supplier_id）归属，
+未指定供应商的单独一行。
+
+take_inventory_snapshot 把当天的总量和总价值写入 InventorySnapshot（每天一行），
+由 flask snapshot-inventory 每晚执行；补录过去的日期时，数量取该日结束时的库存
+（库存检查点 + 流水，见 stock_history.py），按当前成本价计价。
+month_end_values 按月取月内最后一个快照，每个月只读一行。
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+
+from models import db, Category, InventorySnapshot, Product, RawMaterial, Supplier
+from stock_history import stock_as_of_column
+
+CategoryValue = namedtuple('CategoryValue', 'category product_count quantity value')
+SupplierValue = namedtuple('SupplierValue', 'supplier product_value raw_material_value total_value')
+ValuationSummary = namedtuple(
+    'ValuationSummary', 'product_quantity product_value raw_material_quantity raw_material_value total_value'
+)
+MonthEndValue = namedtuple('MonthEndValue', 'year month snapshot_date product_value raw_material_value total_value')
+
+# 未指定供应商的商品 / 原材料在按供应商统计中的名称
+NO_SUPPLIER = '未指定供应商'
+
+_PRODUCT_VALUE = func.coalesce(Product.stock_quantity, 0) * Product.cost_price
+_RAW_MATERIAL_VALUE = func.coalesce(RawMaterial.stock_quantity, 0) * RawMaterial.unit_cost
+
+
+def _summary_select(at=None):
+    """一条语句计算商品、原材料的库存总量和总价值；at 不为空时取 at 时刻（不含）的库存数量"""
+    def total(expr, model):
+        return select(func.coalesce(func.sum(expr), 0)).select_from(model).scalar_subquery()
+
+    if at is None:
+        product_quantity, raw_material_quantity = Product.stock_quantity, RawMaterial.stock_quantity
+        product_value, raw_material_value = _PRODUCT_VALUE, _RAW_MATERIAL_VALUE
+    else:
+        product_quantity = stock_as_of_column('product', at)
+        raw_material_quantity = stock_as_of_column('raw_material', at)
+        product_value = product_quantity * Product.cost_price
+        raw_material_value = raw_material_quantity * RawMaterial.unit_cost
+    return select(
+        total(product_quantity, Product).label('product_quantity'),
+        total(product_value, Product).label('product_value'),
+        total(raw_material_quantity, RawMaterial).label('raw_material_quantity'),
+        total(raw_material_value, RawMaterial).label('raw_material_value'),
+    )
+
+
+def inventory_valuation():
+    """当前库存价值：返回 (汇总, 按分类, 按供应商)，按分类 / 按供应商均按价值降序"""
+    by_category = [
+        CategoryValue(*row) for row in db.session.execute(
+            select(
+                Category.name,
+                func.count(Product.id),
+                func.coalesce(func.sum(Product.stock_quantity), 0),
+                func.coalesce(func.sum(_PRODUCT_VALUE), 0.0)
+            ).join(
+                Product, Product.category_id == Category.id
+            ).group_by(
+                Category.id, Category.name
+            ).order_by(
+                func.sum(_PRODUCT_VALUE).desc()
+            )
+        )
+    ]
+
+    items = union_all(
+        select(
+            Product.supplier_id.label('supplier_id'),
+            _PRODUCT_VALUE.label('product_value'),
+            literal(0.0).label('raw_material_value')
+        ),
+        select(
+            RawMaterial.supplier_id.label('supplier_id'),
+            literal(0.0).label('product_value'),
+            _RAW_MATERIAL_VALUE.label('raw_material_value')
+        )
+    ).subquery()
+    product_value = func.coalesce(func.sum(items.c.product_value), 0.0)
+    raw_material_value = func.coalesce(func.sum(items.c.raw_material_value), 0.0)
+    by_supplier = [
+        SupplierValue(name or NO_SUPPLIER, products, materials, products + materials)
+        for name, products, materials in db.session.execute(
+            select(
+                Supplier.name, product_value, raw_material_value
+            ).select_from(
+                items
+            ).outerjoin(
+                Supplier, Supplier.id == items.c.supplier_id
+            ).group_by(
+                items.c.supplier_id, Supplier.name
+            ).order_by(
+                (product_value + raw_material_value).desc()
+            )
+        )
+    ]
+
+    row = db.session.execute(_summary_select()).one()
+    summary = ValuationSummary(
+        row.product_quantity, row.product_value, row.raw_material_quantity, row.raw_material_value,
+        row.product_value + row.raw_material_value
+    )
+    return summary, by_category, by_supplier
+
+
+def take_inventory_snapshot(snapshot_date=None):
+    """写入（或覆盖）指定日期的库存价值快照，默认今天；在当前事务内执行，不提交
+
+    今天取当前库存；过去的日期取该日结束时的库存数量（按当前成本价计价）；不接受将来的日期。
+    """
+    today = date.today()
+    snapshot_date = snapshot_date or today
+    if snapshot_date > today:
+        raise ValueError(f'不能为将来的日期 {snapshot_date} 记录库存价值快照')
+    at = None if snapshot_date == today else datetime.combine(snapshot_date + timedelta(days=1), datetime.min.time())
+    db.session.execute(delete(InventorySnapshot).where(InventorySnapshot.snapshot_date == snapshot_date))
+    summary = _summary_select(at).subquery()
+    db.session.execute(
+        insert(InventorySnapshot.__table__).from_select(
+            ['snapshot_date', 'product_quantity', 'product_value', 'raw_material_quantity',
+             'raw_material_value', 'created_at'],
+            select(
+                literal(snapshot_date), summary.c.product_quantity, summary.c.product_value,
+                summary.c.raw_material_quantity, summary.c.raw_material_value, literal(datetime.now())
+            )
+        )
+    )
+    return db.session.execute(
+        select(InventorySnapshot).where(InventorySnapshot.snapshot_date == snapshot_date)
+    ).scalar_one()
+
+
+def value_at(day):
+    """day 当天或之前最近的快照（没有则返回 None）"""
+    return db.session.execute(
+        select(InventorySnapshot)
+        .where(InventorySnapshot.snapshot_date <= day)
+        .order_by(InventorySnapshot.snapshot_date.desc())
+        .limit(1)
+    ).scalar()
+
+
+def month_end_values(months=12, today=None):
+    """最近 months 个月（含本月）每月最后一个快照的库存价值，按月份升序；没有快照的月份跳过"""
+    today = today or date.today()
+    results = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        first = date(year, month, 1)
+        last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+        snapshot = value_at(min(last, today))
+        if snapshot is not None and snapshot.snapshot_date >= first:
+            results.append(MonthEndValue(
+                year, month, snapshot.snapshot_date, snapshot.product_value,
+                snapshot.raw_material_value, snapshot.total_value
+            ))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    results.reverse()
+    return results